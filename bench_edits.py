@@ -0,0 +1,77 @@
+"""
+Edit history benchmark: memory per stored edit, deltas vs keeping every full version.
+
+    python bench_edits.py [messages] [edits per message]
+
+Feeds bot.record_edit with synthetic messages that get small successive edits
+(typo fixes, appended sentences), measures the traced allocation of edit_history
+and compares it with keeping every full version. Nothing connects to Discord.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORDS = "the a bot server mod role channel message edit typo really quick fix update link game later".split()
+
+
+def next_version(text, rng):
+    words = text.split()
+    kind = rng.random()
+    if kind < 0.4:
+        words[rng.randrange(len(words))] = rng.choice(WORDS)  # fix a word
+    elif kind < 0.8:
+        words += rng.choices(WORDS, k=rng.randint(1, 6))     # add to the end
+    else:
+        del words[rng.randrange(len(words))]                  # drop a word
+    return " ".join(words) or "ok"
+
+
+def main(messages, edits):
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    import bot
+
+    rng = random.Random(0)
+    bot.EDITS_PER_CHANNEL = messages  # one channel holding every message, nothing evicted
+    scripts = []
+    for _ in range(messages):
+        versions = [" ".join(rng.choices(WORDS, k=rng.randint(8, 40)))]
+        for _ in range(edits):
+            versions.append(next_version(versions[-1], rng))
+        scripts.append(versions)
+
+    def feed(channel):
+        for mid, versions in enumerate(scripts):
+            for before, after in zip(versions, versions[1:]):
+                bot.record_edit(channel, mid, "someone", 1, None, before, after)
+
+    started = time.perf_counter()
+    feed(1)  # timed without tracemalloc, which slows allocation-heavy code down several times
+    took = time.perf_counter() - started
+    tracemalloc.start()
+    feed(2)
+    delta_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    # the naive layout: every version as a string (copies, not shared with scripts) plus the edit times
+    full = [([v.encode().decode() for v in versions], array("d", [time.time()] * edits)) for versions in scripts]
+    full_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    stored = messages * edits
+    assert all(bot.edit_versions(bot.edit_history[1][mid]) == versions for mid, versions in enumerate(scripts))
+    print(f"{messages} messages x {edits} edits, {sum(map(len, scripts[0])) / len(scripts[0]):.0f} chars per version")
+    print(f"deltas:        {delta_bytes / stored:6.0f} bytes per edit (record_edit {took / stored * 1e6:.1f}us each)")
+    print(f"full versions: {full_bytes / stored:6.0f} bytes per edit")
+    print("(both include the original text and per-message overhead, spread over its edits)")
+    del full
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5)
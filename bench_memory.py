@@ -0,0 +1,95 @@
+"""
+Memory benchmark: normal caching vs LOW_MEMORY on synthetic guilds.
+
+    python bench_memory.py [guilds] [members per guild]
+
+LOW_MEMORY is read when bot.py is imported, so each mode runs in its own process.
+Guild payloads shaped like GUILD_CREATE go through the library's own parser
+(the bot's ConnectionState, with the cache flags bot.py picked), then a burst of
+messages goes through the message cache. Nothing connects to Discord.
+"""
+import os
+import subprocess
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def guild_payload(gid, members):
+    base = gid * 10_000_000
+    roles = [{"id": str(gid), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+              "hoist": False, "managed": False, "mentionable": False}]
+    roles += [{"id": str(base + r), "name": f"role {r}", "permissions": "0", "position": r, "color": 0,
+               "hoist": False, "managed": False, "mentionable": False} for r in range(1, 21)]
+    channels = [{"id": str(base + 100 + c), "type": 0, "name": f"chat-{c}", "position": c,
+                 "permission_overwrites": []} for c in range(30)]
+    return {
+        "id": str(gid), "name": f"guild {gid}", "owner_id": str(base + 1000), "member_count": members,
+        "roles": roles, "channels": channels, "emojis": [], "stickers": [], "features": [],
+        "members": [{
+            "user": {"id": str(base + 1000 + m), "username": f"user{m}", "discriminator": "0",
+                     "avatar": None, "global_name": f"User {m}"},
+            "roles": [str(base + 1 + m % 20)], "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0,
+        } for m in range(members)],
+    }
+
+
+def message_payload(guild, i):
+    channel = guild.text_channels[i % len(guild.text_channels)]
+    return {
+        "id": str(channel.id * 1000 + i), "channel_id": str(channel.id), "guild_id": str(guild.id),
+        "author": {"id": str(i), "username": f"user{i}", "discriminator": "0", "avatar": None},
+        "content": "hello there " * 5, "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False, "type": 0,
+    }
+
+
+def child(guilds, members):
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    import discord
+    import bot
+
+    state = bot.bot._connection
+    rss_before = rss_kb()
+    tracemalloc.start()
+    for g in range(1, guilds + 1):
+        state._add_guild_from_data(guild_payload(g, members))
+    for i in range(5000):
+        guild = state._guilds[1 + i % guilds]
+        channel = guild.text_channels[i % len(guild.text_channels)]
+        msg = discord.Message(state=state, channel=channel, data=message_payload(guild, i))
+        if state._messages is not None:
+            state._messages.append(msg)
+    traced, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cached = sum(len(g.members) for g in state._guilds.values())
+    print(f"{'low-memory' if bot.LOW_MEMORY else 'normal':>10}: {cached:>8} members cached, "
+          f"{traced / 1e6:7.1f} MB traced (peak {peak / 1e6:.1f} MB), "
+          f"RSS +{(rss_kb() - rss_before) / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+        members = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+        print(f"{guilds} guilds x {members} members")
+        for low in ("0", "1"):
+            env = dict(os.environ, LOW_MEMORY=low)
+            env.pop("CLUSTER_ID", None)
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(guilds), str(members)],
+                           env=env, check=True)
@@ -0,0 +1,65 @@
+"""
+XP benchmark: award_xp throughput and the cost of a batched flush.
+
+    python bench_xp.py [guilds] [users per guild] [messages]
+
+Runs bot.award_xp over synthetic messages twice: with the normal cooldown (most
+messages only bump the counter) and with no cooldown (every message awards XP
+and touches the top-K leaderboard). Then times one flush of every guild into a
+temporary directory: the snapshot taken on the event loop and the write done in
+the worker thread. Nothing connects to Discord.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(guilds, users, count):
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    import bot
+
+    bot.xp_data.clear()
+    bot.xp_top.clear()
+    bot.xp_top_members.clear()
+    random.seed(0)
+    guild_objs = [SimpleNamespace(id=10_000 + g) for g in range(guilds)]
+    messages = [
+        SimpleNamespace(guild=random.choice(guild_objs), author=SimpleNamespace(id=random.randrange(users)))
+        for _ in range(count)
+    ]
+
+    for label, cooldown in (("cooldown", bot.XP_COOLDOWN), ("no cooldown", 0)):
+        bot.XP_COOLDOWN = cooldown
+        bot.xp_last.clear()
+        started = time.perf_counter()
+        for m in messages:
+            bot.award_xp(m)
+        took = time.perf_counter() - started
+        print(f"{label:>11}: {took / count * 1e6:.2f}us per message -> {count / took * 3600 / 1e6:,.0f}M messages/hour")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.XP_DIR = tmp
+        dirty = list(bot.xp_data)
+        started = time.perf_counter()
+        snapshot = bot.snapshot_xp(dirty)
+        on_loop = time.perf_counter() - started
+        started = time.perf_counter()
+        asyncio.run(asyncio.to_thread(bot._write_xp, snapshot))
+        off_loop = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(tmp, n)) for n in os.listdir(tmp))
+    counters = sum(len(u) for u in bot.xp_data.values())
+    print(f"flush of {counters} counters in {len(dirty)} guilds: {on_loop * 1000:.1f}ms snapshot on the loop, "
+          f"{off_loop * 1000:.1f}ms writing {size / 1e6:.1f} MB in the thread")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20_000,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 1_000_000)
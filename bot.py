@@ -2,24 +2,47 @@ import discord
 from discord.ext import commands, tasks
 from discord import ui, ButtonStyle, Interaction
 from discord.ui import Button, View
+from discord import app_commands
 import json
+import io
 import os
+import sys
+import sqlite3
+import uuid
 import random
 import asyncio
 import re
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 from discord.utils import utcnow
 import itertools
+import bisect
+import heapq
+import contextvars
+import contextlib
+import time
+from array import array
 import difflib
+import unicodedata
+import hashlib
+import math
+import operator
+import struct
+import zlib
+import multiprocessing
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import aiohttp
 import pytz
 import requests
 
 #keeping bot alive
 from keep_alive import keep_alive
-
-keep_alive()
+import cards
 
 # -------------------------
 # CONFIG / INTENTS / BOT
@@ -32,7 +55,34 @@ intents.members = True
 def get_prefix(bot, message):
     return ["x", "X"]
 
-bot = commands.Bot(command_prefix=get_prefix, intents=intents, case_insensitive=True)
+# Cluster mode (see CLUSTER MODE): CLUSTERS=N processes, each running every Nth shard.
+CLUSTER_COUNT = int(os.getenv("CLUSTERS", "1"))
+CLUSTER_ID = int(os.environ["CLUSTER_ID"]) if os.getenv("CLUSTER_ID") else None
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", str(CLUSTER_COUNT)))
+cluster_kwargs = {}
+if CLUSTER_ID is not None:
+    cluster_kwargs = {
+        "shard_count": SHARD_COUNT,
+        "shard_ids": [s for s in range(SHARD_COUNT) if s % CLUSTER_COUNT == CLUSTER_ID],
+    }
+
+# Low-memory mode: no member chunking, no member or message cache. Member lookups fall back
+# to fetch_member/query_members through fetch_member_cached (see HELPERS). on_member_update
+# only fires for cached members, so timeouts set or lifted outside the bot aren't picked up
+# by mute tracking in this mode (track_timeout / sync_mutes_from_cache); mutes made through
+# the bot still expire normally. Measure the difference with bench_memory.py.
+LOW_MEMORY = os.getenv("LOW_MEMORY", "").lower() in ("1", "true", "yes")
+# Snipes come from our own per-channel capture (see SNIPE CAPTURE), so the library
+# message cache only needs to serve short-lived lookups.
+cache_kwargs = {"max_messages": 200}
+if LOW_MEMORY:
+    cache_kwargs = {
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "max_messages": None,
+    }
+
+bot = commands.AutoShardedBot(command_prefix=get_prefix, intents=intents, case_insensitive=True, **cache_kwargs, **cluster_kwargs)
 
 # -------------------------
 # GLOBAL STATE
@@ -43,26 +93,83 @@ jail_channel_id = None  # set via jailset
 jail_role_id = None     # set via jailrole
 deleted_messages = {}   # {channel_id: [ {author, avatar, content, attachments, time}, ... ]}
 MAX_STORE_PER_CHANNEL = 500
+CAPTURE_PER_CHANNEL = 300  # recent messages kept per channel so raw deletes can be resolved
+CAPTURE_MAX_CHANNELS = 2000  # least recently active channels are dropped past this
 WARN_FILE = "warnings.json"
 bot.remove_command("help")
 # -------------------------
 # HELPERS
 # -------------------------
+background_tasks = set()  # fire-and-forget tasks; the event loop only keeps weak references to them
+
+def spawn(coro):
+    """asyncio.create_task that keeps the task referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Permission cache: guild_permissions folds over every role a member has, so the result
+# (plus top role position for hierarchy checks) is cached per member and invalidated from
+# role / member update events. Entries also carry the member's role ids and are rebuilt when
+# those differ, since low-memory mode gets no member update events to invalidate from.
+STAFF_PERMISSIONS = discord.Permissions(
+    manage_messages=True, kick_members=True, ban_members=True,
+    manage_roles=True, mute_members=True, moderate_members=True,
+)
+PERM_CACHE_SIZE = 20_000
+perm_cache = OrderedDict()  # {(guild_id, member_id): (role_version, role_ids, permissions_value, top_role_position)}, LRU
+guild_role_version = defaultdict(int)  # bumped whenever a role or the owner changes in a guild
+
+def _member_perm_entry(member: discord.Member):
+    key = (member.guild.id, member.id)
+    version = guild_role_version[member.guild.id]
+    role_ids = tuple(member._roles)  # raw id array; member.roles resolves and sorts Role objects
+    entry = perm_cache.get(key)
+    if entry is None or entry[0] != version or entry[1] != role_ids:
+        entry = perm_cache[key] = (version, role_ids, member.guild_permissions.value, member.top_role.position)
+        if len(perm_cache) > PERM_CACHE_SIZE:
+            perm_cache.popitem(last=False)
+    else:
+        perm_cache.move_to_end(key)
+    return entry
+
+def invalidate_member_perms(member):
+    perm_cache.pop((member.guild.id, member.id), None)
+
+def invalidate_guild_perms(guild):
+    guild_role_version[guild.id] += 1
+
+def member_perms(member: discord.Member) -> discord.Permissions:
+    return discord.Permissions(_member_perm_entry(member)[2])
+
 def is_staff(member: discord.Member):
-    perms = member.guild_permissions
-    return (
-        perms.manage_messages
-        or perms.kick_members
-        or perms.ban_members
-        or perms.manage_roles
-        or perms.mute_members
-    )
+    return bool(_member_perm_entry(member)[2] & STAFF_PERMISSIONS.value)
+
+def target_block_embed(actor, member, verb: str, past: str, hierarchy: bool = True):
+    """
+    The one immunity policy every moderation command uses: no self-targeting, staff are
+    immune to non-admins, and targets at or above the bot's top role are refused up front.
+    Returns the embed to show, or None if the action may go ahead.
+    """
+    if member.id == actor.id:
+        return make_embed("😂 Nice Try", f"You can’t {verb} yourself, buddy. Sit down 🤡", discord.Color.orange())
+    if is_staff(member) and not member_perms(actor).administrator:
+        return make_embed("🛡️ Staff Immunity", f"{member.mention} is staff and cannot be {past} by you.", discord.Color.gold())
+    if not hierarchy:
+        return None
+    me = member.guild.me
+    if member.id == member.guild.owner_id or _member_perm_entry(member)[3] >= _member_perm_entry(me)[3]:
+        return make_embed("🛡️ Role Hierarchy", f"{member.mention} is above my top role, so I can't {verb} them.", discord.Color.gold())
+    return None
 
 def find_member(ctx, user: str):
     """Find member by mention, id, name#discrim or username (first match)."""
     member = None
-    if ctx.message.mentions:
-        member = ctx.message.mentions[0]
+    mention = re.fullmatch(r"<@!?(\d+)>", user)
+    if mention:
+        member_id = int(mention.group(1))
+        member = discord.utils.get(ctx.message.mentions, id=member_id) or ctx.guild.get_member(member_id)
     elif user.isdigit():
         member = ctx.guild.get_member(int(user))
     elif "#" in user:
@@ -75,6 +182,58 @@ def find_member(ctx, user: str):
         member = discord.utils.find(lambda m: m.name == user, ctx.guild.members)
     return member
 
+MEMBER_LOOKUP_TTL = 300
+member_lookup_cache = {}  # {(guild_id, query): (expires, member or None)}
+
+async def fetch_member_cached(guild, query: str):
+    """
+    Member lookup for when the member cache can't answer (low-memory mode).
+    IDs/mentions use fetch_member, names use query_members and then the same exact
+    username match as find_member; hits and misses are both remembered briefly.
+    """
+    key = (guild.id, query)
+    now = time.monotonic()
+    cached = member_lookup_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    member = None
+    try:
+        match = re.fullmatch(r"<@!?(\d+)>|(\d+)", query.strip())
+        if match:
+            member = await guild.fetch_member(int(match.group(1) or match.group(2)))
+        else:
+            name = query.split("#")[0]
+            found = await guild.query_members(name, limit=5)
+            member = next((m for m in found if m.name == name), None)
+    except (discord.HTTPException, asyncio.TimeoutError):
+        member = None
+    if len(member_lookup_cache) > 5000:
+        for k in [k for k, (expires, _) in member_lookup_cache.items() if expires <= now]:
+            del member_lookup_cache[k]
+    member_lookup_cache[key] = (now + MEMBER_LOOKUP_TTL, member)
+    return member
+
+async def find_member_async(ctx, user: str):
+    """find_member, falling back to the API when the member cache is disabled."""
+    member = find_member(ctx, user)
+    if member is None and LOW_MEMORY:
+        member = await fetch_member_cached(ctx.guild, user)
+    return member
+
+async def split_targets(ctx, args):
+    """
+    Split `xcmd <users...> <reason...>` arguments: members are taken from the front until
+    the first word that isn't one, so reason words are never looked up as names.
+    Returns (members, reason_words).
+    """
+    members = []
+    for i, arg in enumerate(args):
+        member = await find_member_async(ctx, arg)
+        if member is None:
+            return members, list(args[i:])
+        members.append(member)
+    return members, []
+
 def parse_duration(time_str: str):
     """
     Parse time strings like '10s', '5m', '2h', '1d' into timedelta.
@@ -121,21 +280,482 @@ async def send_log_embed(guild, title: str, embed: discord.Embed):
     ch = guild.get_channel(log_channel_id)
     if not ch:
         return
-    await ch.send(embed=embed)
+    with rest_priority("log"):
+        await ch.send(embed=embed)
+
+# -------------------------
+# REST SCHEDULER (priority classes in front of discord.py's HTTP client)
+# -------------------------
+REST_CLASSES = ("mod", "reply", "log", "dm", "cosmetic")   # highest priority first
+REST_CONCURRENCY = 8            # requests in flight at once across all buckets
+REST_BUCKET_INFLIGHT = 2        # per route bucket; discord.py serialises the rest anyway
+REST_SHED_DEPTH = {"cosmetic": 5, "dm": 40}  # queue depth at which a class is dropped
+REST_PARK_AFTER = 1.0           # seconds; a request still running this long is waiting out a rate limit
+REST_STATS_SAMPLES = 500
+rest_class = contextvars.ContextVar("rest_class", default="reply")
+rest_waiters = []               # heap of (priority, seq, bucket, future)
+rest_queued = {"total": 0}      # live (not cancelled) waiters in rest_waiters
+rest_inflight = {"total": 0, "parked": 0}
+rest_bucket_inflight = defaultdict(int)
+rest_waits = {c: deque(maxlen=REST_STATS_SAMPLES) for c in REST_CLASSES}  # seconds queued
+rest_shed = defaultdict(int)    # {class: requests dropped}
+_rest_seq = itertools.count()
+
+class RestShed(Exception):
+    """Raised instead of sending when a low-priority request is dropped under load."""
+
+@contextlib.contextmanager
+def rest_priority(cls: str):
+    """Run the enclosed API calls under a priority class (see REST_CLASSES)."""
+    token = rest_class.set(cls)
+    try:
+        yield
+    finally:
+        rest_class.reset(token)
+
+def _rest_bucket(route):
+    key = getattr(route, "key", None) or f"{route.method} {route.path}"
+    major = getattr(route, "major_parameters", None)
+    return f"{key}:{major}" if major is not None else getattr(route, "bucket", key)
+
+def _rest_take(bucket):
+    rest_inflight["total"] += 1
+    rest_bucket_inflight[bucket] += 1
+
+def _rest_release(bucket, total: bool = True):
+    if total:
+        rest_inflight["total"] -= 1
+    rest_bucket_inflight[bucket] -= 1
+    if rest_bucket_inflight[bucket] <= 0:
+        del rest_bucket_inflight[bucket]
+    _rest_dispatch()
+
+def _rest_dispatch():
+    """Hand free slots to the highest-priority waiters whose bucket isn't saturated."""
+    blocked = []
+    while rest_waiters and rest_inflight["total"] < REST_CONCURRENCY:
+        item = heapq.heappop(rest_waiters)
+        fut = item[3]
+        if fut.done():
+            continue
+        if rest_bucket_inflight[item[2]] >= REST_BUCKET_INFLIGHT:
+            blocked.append(item)
+            continue
+        _rest_take(item[2])
+        fut.set_result(None)
+    for item in blocked:
+        heapq.heappush(rest_waiters, item)
+
+def _rest_park(state):
+    """
+    Stop counting a slow request against REST_CONCURRENCY. discord.py sleeps out 429s
+    inside the request, and a slot held through that sleep would starve mod calls on
+    other buckets. The bucket slot stays taken, so the limited bucket gets no new requests.
+    """
+    state["parked"] = True
+    rest_inflight["total"] -= 1
+    rest_inflight["parked"] += 1
+    _rest_dispatch()
+
+async def rest_acquire(cls: str, bucket):
+    # If slots are free, any remaining waiters are only blocked on their own bucket
+    if rest_inflight["total"] < REST_CONCURRENCY and rest_bucket_inflight[bucket] < REST_BUCKET_INFLIGHT:
+        _rest_take(bucket)
+        rest_waits[cls].append(0.0)
+        return
+    shed_at = REST_SHED_DEPTH.get(cls)
+    if shed_at is not None and rest_queued["total"] >= shed_at:
+        rest_shed[cls] += 1
+        raise RestShed(cls)
+    fut = asyncio.get_running_loop().create_future()
+    heapq.heappush(rest_waiters, (REST_CLASSES.index(cls), next(_rest_seq), bucket, fut))
+    rest_queued["total"] += 1
+    start = time.monotonic()
+    try:
+        await fut
+    except asyncio.CancelledError:
+        if fut.done() and not fut.cancelled():
+            _rest_release(bucket)   # granted a slot but cancelled before using it
+        fut.cancel()
+        raise
+    finally:
+        rest_queued["total"] -= 1
+    rest_waits[cls].append(time.monotonic() - start)
+
+_http_request = bot.http.request
+
+async def scheduled_request(route, **kwargs):
+    bucket = _rest_bucket(route)
+    cls = rest_class.get()
+    await rest_acquire(cls if cls in REST_CLASSES else "reply", bucket)
+    state = {"parked": False}
+    park = asyncio.get_running_loop().call_later(REST_PARK_AFTER, _rest_park, state)
+    try:
+        return await _http_request(route, **kwargs)
+    finally:
+        park.cancel()
+        if state["parked"]:
+            rest_inflight["parked"] -= 1
+        _rest_release(bucket, total=not state["parked"])
+
+bot.http.request = scheduled_request
+
+def rest_stats():
+    """{class: (queued, p50_ms, p95_ms, shed)} over the recent samples."""
+    queued = defaultdict(int)
+    for prio, _, _, fut in rest_waiters:
+        if not fut.done():
+            queued[REST_CLASSES[prio]] += 1
+    out = {}
+    for cls in REST_CLASSES:
+        waits = sorted(rest_waits[cls])
+        p50 = waits[len(waits) // 2] * 1000 if waits else 0
+        p95 = waits[int(len(waits) * 0.95)] * 1000 if waits else 0
+        out[cls] = (queued[cls], p50, p95, rest_shed[cls])
+    return out
+
+@bot.command()
+@commands.has_permissions(manage_guild=True)
+async def rest(ctx):
+    """Queue wait times of the outbound request scheduler per priority class."""
+    lines = [
+        f"**{cls}** — queued {q} • p50 {p50:.0f}ms • p95 {p95:.0f}ms • shed {shed}"
+        for cls, (q, p50, p95, shed) in rest_stats().items()
+    ]
+    embed = make_embed("📡 REST Scheduler", "\n".join(lines), discord.Color.blurple())
+    embed.set_footer(text=f"{rest_inflight['total']}/{REST_CONCURRENCY} in flight • {rest_inflight['parked']} rate limited • {len(rest_bucket_inflight)} busy buckets")
+    await ctx.send(embed=embed)
+
+# -------------------------
+# DM DELIVERY (background queue, closed-DM cache, batched outcome logs)
+# -------------------------
+DM_WORKERS = 4                      # max DMs in flight at once
+DM_QUEUE_SIZE = 5000
+DM_CLOSED_TTL = timedelta(hours=6)  # how long a 403 marks a user's DMs as closed
+DM_REPORT_INTERVAL = 30             # seconds between outcome summaries in the log channel
+DM_SHED_BACKOFF = 2                 # seconds a worker backs off when the scheduler sheds DMs
+dm_queue = None         # asyncio.Queue, created in setup
+dm_closed_until = {}    # {user_id: datetime} users whose DMs are known to be closed
+dm_pending = set()      # dedupe keys of DMs that are queued or in flight
+dm_outcomes = {}        # {guild_id: [(user, ok, note), ...]} waiting for the next summary
+
+def dm_is_closed(user_id: int):
+    until = dm_closed_until.get(user_id)
+    if until is None:
+        return False
+    if until <= datetime.utcnow():
+        del dm_closed_until[user_id]
+        return False
+    return True
+
+def queue_dm(user, content: str = None, embed: discord.Embed = None, guild=None,
+             fallback_channel=None, fallback_content: str = None, removed: bool = False):
+    """
+    Queue a DM for background delivery and return immediately.
+    `user` may be a User/Member or a raw user id.
+    Returns False if the DM was not queued (DMs known closed or queue full).
+    If the DM fails because DMs are closed, fallback_content is sent to fallback_channel.
+    Pass removed=True for notices sent after a kick/ban: a 403 then only means the user
+    no longer shares a guild with the bot, so it isn't cached as closed DMs.
+    """
+    user_id = user if isinstance(user, int) else user.id
+    if dm_is_closed(user_id):
+        if fallback_channel and fallback_content:
+            spawn(fallback_channel.send(fallback_content))
+        return False
+    if dm_queue is None:
+        return False
+    key = (user_id, content, embed.title if embed else None, embed.description if embed else None)
+    if key in dm_pending:
+        return True  # identical DM already on its way
+    job = {
+        "key": key,
+        "user": user,
+        "content": content,
+        "embed": embed,
+        "guild_id": guild.id if guild else None,
+        "fallback_channel": fallback_channel,
+        "fallback_content": fallback_content,
+        "removed": removed,
+    }
+    try:
+        dm_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        print(f"DM queue full, dropping DM to {user_id}")
+        return False
+    dm_pending.add(key)
+    return True
+
+async def deliver_dm(job):
+    target = job["user"]
+    try:
+        if isinstance(target, int):
+            target = bot.get_user(target) or await bot.fetch_user(target)
+    except discord.HTTPException as e:
+        if job["guild_id"]:
+            note = "user not found" if isinstance(e, discord.NotFound) else f"HTTP {e.status}"
+            dm_outcomes.setdefault(job["guild_id"], []).append((str(target), False, note))
+        return
+    try:
+        with rest_priority("dm"):
+            while True:
+                try:
+                    await target.send(content=job["content"], embed=job["embed"])
+                    break
+                except RestShed:
+                    await asyncio.sleep(DM_SHED_BACKOFF)   # let higher classes drain first
+        ok, note = True, "delivered"
+    except discord.Forbidden:
+        # without a mutual guild Discord refuses every DM, which says nothing about the user's settings
+        if not job["removed"] and (LOW_MEMORY or getattr(target, "mutual_guilds", None)):
+            dm_closed_until[target.id] = datetime.utcnow() + DM_CLOSED_TTL
+        ok, note = False, "DMs closed"
+        if job["fallback_channel"] and job["fallback_content"]:
+            await job["fallback_channel"].send(job["fallback_content"])
+    except discord.HTTPException as e:
+        ok, note = False, f"HTTP {e.status}"
+    if job["guild_id"]:
+        dm_outcomes.setdefault(job["guild_id"], []).append((str(target), ok, note))
+
+async def dm_worker():
+    while True:
+        job = await dm_queue.get()
+        try:
+            await deliver_dm(job)
+        except Exception as e:
+            print("dm worker error:", e)
+        finally:
+            dm_pending.discard(job["key"])
+            dm_queue.task_done()
+
+async def dm_report_loop():
+    await bot.wait_until_ready()
+    while True:
+        await asyncio.sleep(DM_REPORT_INTERVAL)
+        now = datetime.utcnow()
+        for user_id in [u for u, until in dm_closed_until.items() if until <= now]:
+            del dm_closed_until[user_id]
+        for guild_id in list(dm_outcomes):
+            outcomes = dm_outcomes.pop(guild_id)
+            guild = bot.get_guild(guild_id)
+            if not guild:
+                continue
+            delivered = sum(1 for _, ok, _ in outcomes if ok)
+            failed = [f"{user}: {note}" for user, ok, note in outcomes if not ok]
+            desc = f"**Delivered:** {delivered}\n**Failed:** {len(failed)}"
+            if failed:
+                desc += "\n\n" + "\n".join(failed[:20])
+                if len(failed) > 20:
+                    desc += f"\n...and {len(failed) - 20} more"
+            embed = make_embed("📬 DM Delivery Report", desc, discord.Color.blurple())
+            try:
+                await send_log_embed(guild, "DM Delivery", embed)
+            except Exception as e:
+                print("dm report error:", e)
+
+def start_dm_workers():
+    global dm_queue
+    dm_queue = asyncio.Queue(maxsize=DM_QUEUE_SIZE)
+    for _ in range(DM_WORKERS):
+        spawn(dm_worker())
+    spawn(dm_report_loop())
+
+# -------------------------
+# STORAGE (JSON files, or a shared SQLite store in cluster mode)
+# -------------------------
+# Every JSON document below goes through store_load/store_save. In cluster mode the documents
+# live in one SQLite database as one row per top-level key (guild/user id), and saves only
+# write the rows this process changed, so clusters owning different guilds never clobber each other.
+STORE_FILE = os.getenv("STORE_FILE") or ("shared_store.db" if CLUSTER_COUNT > 1 else None)
+_store_conn = None
+_store_snapshots = {}  # {doc: {key: json_text}} as last read/written by this process
+
+def _store_db():
+    global _store_conn
+    if _store_conn is None:
+        _store_conn = sqlite3.connect(STORE_FILE, timeout=30, check_same_thread=False)
+        _store_conn.execute("PRAGMA journal_mode=WAL")
+        _store_conn.execute("CREATE TABLE IF NOT EXISTS docs (doc TEXT, key TEXT, value TEXT, PRIMARY KEY (doc, key))")
+        _store_conn.execute("CREATE TABLE IF NOT EXISTS imported (doc TEXT PRIMARY KEY)")
+        _store_conn.commit()
+    return _store_conn
+
+def _import_json_doc(db, path: str):
+    """
+    Copy a pre-cluster JSON file into the store the first time its doc is read. The imported
+    table makes this happen once, so a doc later emptied on purpose isn't refilled from the
+    stale file, and INSERT OR IGNORE keeps a racing cluster's import from doubling rows.
+    """
+    with db:
+        if db.execute("INSERT OR IGNORE INTO imported (doc) VALUES (?)", (path,)).rowcount == 0:
+            return
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"store import of {path} failed:", e)
+            return
+        if isinstance(data, dict):
+            db.executemany(
+                "INSERT OR IGNORE INTO docs (doc, key, value) VALUES (?, ?, ?)",
+                [(path, str(key), json.dumps(value)) for key, value in data.items()]
+            )
+
+def store_load(path: str, default):
+    if not STORE_FILE:
+        if not os.path.exists(path):
+            return default
+        with open(path, "r") as f:
+            return json.load(f)
+    db = _store_db()
+    rows = db.execute("SELECT key, value FROM docs WHERE doc = ?", (path,)).fetchall()
+    if not rows and os.path.exists(path):
+        _import_json_doc(db, path)
+        rows = db.execute("SELECT key, value FROM docs WHERE doc = ?", (path,)).fetchall()
+    _store_snapshots[path] = dict(rows)
+    if not rows:
+        return default
+    return {key: json.loads(value) for key, value in rows}
+
+def store_save(path: str, data, indent: int = 4):
+    if not STORE_FILE:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=indent)
+        return
+    old = _store_snapshots.get(path, {})
+    new = {str(key): json.dumps(value) for key, value in data.items()}
+    db = _store_db()
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO docs (doc, key, value) VALUES (?, ?, ?)",
+            [(path, key, value) for key, value in new.items() if old.get(key) != value]
+        )
+        db.executemany("DELETE FROM docs WHERE doc = ? AND key = ?", [(path, key) for key in old if key not in new])
+    _store_snapshots[path] = new
 
 # -------------------------
 # WARN FILE HELPERS
 # -------------------------
 def load_warnings():
-    if not os.path.exists(WARN_FILE):
-        with open(WARN_FILE, "w") as f:
-            json.dump({}, f)
-    with open(WARN_FILE, "r") as f:
-        return json.load(f)
+    return store_load(WARN_FILE, {})
 
 def save_warnings(data):
-    with open(WARN_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    store_save(WARN_FILE, data)
+
+# -------------------------
+# MOD CASES (per-guild case numbers + indexes by case, user, moderator)
+# -------------------------
+CASES_FILE = "cases.json"
+
+def load_cases():
+    return store_load(CASES_FILE, {})
+
+def save_cases(data):
+    store_save(CASES_FILE, data)
+
+cases_data = load_cases()  # {guild_id: {"next": int, "cases": [case, ...]}}, cases sorted by case_id
+case_user_index = {}       # {guild_id: {user_id: [case_id, ...]}}
+case_mod_index = {}        # {guild_id: {moderator_id: [case_id, ...]}}
+
+def _index_case(guild_id: str, case):
+    case_user_index.setdefault(guild_id, {}).setdefault(str(case["user_id"]), []).append(case["case_id"])
+    case_mod_index.setdefault(guild_id, {}).setdefault(str(case["moderator_id"]), []).append(case["case_id"])
+
+for _gid, _g in cases_data.items():
+    for _case in _g["cases"]:
+        _index_case(_gid, _case)
+
+def _first_case_number(guild_id: str):
+    """Start numbering above any legacy random warn case ids so old and new ids never collide."""
+    legacy = [w.get("case_id", 0) for ws in load_warnings().get(guild_id, {}).values() for w in ws]
+    return max(legacy, default=0) + 1
+
+def open_case(guild, action: str, user, moderator, reason: str, duration: str = None, save: bool = True):
+    """
+    Record a moderation action under the guild's next case number and return that number.
+    Batch callers pass save=False and call save_cases once at the end.
+    """
+    guild_id = str(guild.id)
+    g = cases_data.get(guild_id)
+    if g is None:
+        g = cases_data[guild_id] = {"next": _first_case_number(guild_id), "cases": []}
+    case = {
+        "case_id": g["next"],
+        "action": action,
+        "user_id": user.id,
+        "user": str(user),
+        "moderator_id": moderator.id,
+        "moderator": str(moderator),
+        "reason": reason,
+        "duration": duration,
+        "time": datetime.utcnow().isoformat(),
+    }
+    g["next"] += 1
+    g["cases"].append(case)
+    _index_case(guild_id, case)
+    if save:
+        save_cases(cases_data)
+    return case["case_id"]
+
+def get_case(guild_id, case_id: int):
+    """Binary search the guild's case list (sorted by case_id)."""
+    g = cases_data.get(str(guild_id))
+    if not g:
+        return None
+    cases = g["cases"]
+    i = bisect.bisect_left(cases, case_id, key=lambda c: c["case_id"])
+    if i < len(cases) and cases[i]["case_id"] == case_id:
+        return cases[i]
+    return None
+
+def cases_by_moderator(guild_id, moderator_id: int):
+    ids = case_mod_index.get(str(guild_id), {}).get(str(moderator_id), [])
+    return [get_case(guild_id, i) for i in ids]
+
+def cases_by_user(guild_id, user_id: int):
+    ids = case_user_index.get(str(guild_id), {}).get(str(user_id), [])
+    return [get_case(guild_id, i) for i in ids]
+
+def case_embed(c):
+    embed = make_embed(f"📁 Case #{c['case_id']} — {c['action'].title()}", None, discord.Color.blurple())
+    embed.add_field(name="User", value=f"{c['user']} (`{c['user_id']}`)", inline=False)
+    embed.add_field(name="Moderator", value=f"{c['moderator']} (`{c['moderator_id']}`)", inline=False)
+    embed.add_field(name="Reason", value=c["reason"], inline=False)
+    if c.get("duration"):
+        embed.add_field(name="Duration", value=c["duration"], inline=True)
+    if c.get("cleared"):
+        embed.add_field(name="Status", value="Cleared", inline=True)
+    embed.add_field(name="Time", value=c["time"], inline=True)
+    return embed
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def case(ctx, case_id: int):
+    c = get_case(ctx.guild.id, case_id)
+    if not c:
+        return await send_error(ctx, f"No case `#{case_id}` in this server.")
+    await ctx.send(embed=case_embed(c))
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def cases(ctx, moderator: str):
+    # mention or raw id works for moderators who have since left the server
+    match = re.fullmatch(r"<@!?(\d+)>|(\d{15,20})", moderator)
+    if match:
+        moderator_id = int(match.group(1) or match.group(2))
+    else:
+        member = await find_member_async(ctx, moderator)
+        if not member:
+            return await send_error(ctx, "Moderator not found. Use a mention or their user ID.")
+        moderator_id = member.id
+    mod_cases = cases_by_moderator(ctx.guild.id, moderator_id)
+    if not mod_cases:
+        return await send_error(ctx, f"<@{moderator_id}> has no cases.")
+    recent = mod_cases[-15:]
+    lines = [f"`#{c['case_id']}` **{c['action']}** {c['user']} — {c['reason'][:60]}" for c in reversed(recent)]
+    embed = make_embed(f"📁 Cases by {recent[-1]['moderator']}", "\n".join(lines), discord.Color.blurple())
+    embed.set_footer(text=f"Showing {len(recent)} of {len(mod_cases)} cases")
+    await ctx.send(embed=embed)
 
 # -------------------------
 # EVENTS
@@ -143,28 +763,419 @@ def save_warnings(data):
 @bot.event
 async def on_ready():
     print(f"✅ Logged inn as {bot.user}")
+    resume_role_jobs()
+    resume_ban_jobs()
+    sync_mutes_from_cache()
 
-@bot.event
-async def on_message_delete(message):
+# -------------------------
+# SNIPE ARCHIVE (daily segment logs on disk + in-memory inverted index)
+# -------------------------
+ARCHIVE_DIR = "snipe_archive"       # snipe_archive/<guild_id>/<YYYY-MM-DD>.jsonl
+ARCHIVE_CONFIG_FILE = "snipe_config.json"
+ARCHIVE_RETENTION_DAYS = 30         # default, overridable per guild with `xs retention`
+ARCHIVE_FLUSH_INTERVAL = 5          # seconds between batched segment writes
+ARCHIVE_RESULTS = 25
+TOKEN_RE = re.compile(r"\w{2,}")
+
+def load_archive_config():
+    return store_load(ARCHIVE_CONFIG_FILE, {})
+
+def save_archive_config(data):
+    store_save(ARCHIVE_CONFIG_FILE, data)
+
+archive_config = load_archive_config()  # {guild_id: {"retention_days": int}}
+archive_pending = []  # [(guild_id, record)] waiting for the next flush
+archive_index = {}    # {guild_id: {"tokens": {token: [ref]}, "users": {user_id: [ref]}, "attachments": [ref]}}
+# a ref is (day, byte offset) into snipe_archive/<guild_id>/<day>.jsonl; ref lists are oldest-first
+
+def archive_retention(guild_id):
+    return archive_config.get(str(guild_id), {}).get("retention_days", ARCHIVE_RETENTION_DAYS)
+
+def _index_record(guild_id: int, ref, record):
+    idx = archive_index.setdefault(guild_id, {"tokens": {}, "users": {}, "attachments": []})
+    for token in set(TOKEN_RE.findall(record["content"].lower())):
+        idx["tokens"].setdefault(token, []).append(ref)
+    idx["users"].setdefault(record["author_id"], []).append(ref)
+    if record["attachments"]:
+        idx["attachments"].append(ref)
+
+def _write_archive_batch(batch):
+    """Append records to their daily segments. Runs in a worker thread; returns [(guild_id, ref, record)]."""
+    by_segment = {}
+    for guild_id, record in batch:
+        by_segment.setdefault((guild_id, record["time"][:10]), []).append(record)
+    written = []
+    for (guild_id, day), records in by_segment.items():
+        folder = os.path.join(ARCHIVE_DIR, str(guild_id))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{day}.jsonl"), "ab") as f:
+            f.seek(0, os.SEEK_END)
+            for record in records:
+                offset = f.tell()
+                f.write((json.dumps(record) + "\n").encode("utf-8"))
+                written.append((guild_id, (day, offset), record))
+    return written
+
+def _scan_archive():
+    """Rebuild the index from retained segments on startup. Runs in a worker thread."""
+    entries = []
+    if not os.path.isdir(ARCHIVE_DIR):
+        return entries
+    for guild_dir in os.listdir(ARCHIVE_DIR):
+        if not guild_dir.isdigit():
+            continue
+        guild_id = int(guild_dir)
+        cutoff = (datetime.utcnow() - timedelta(days=archive_retention(guild_id))).strftime("%Y-%m-%d")
+        folder = os.path.join(ARCHIVE_DIR, guild_dir)
+        for name in sorted(os.listdir(folder)):
+            day = name[:-len(".jsonl")]
+            if not name.endswith(".jsonl") or day < cutoff:
+                continue
+            with open(os.path.join(folder, name), "rb") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entries.append((guild_id, (day, offset), json.loads(line)))
+                    except ValueError:
+                        pass
+                    offset += len(line)
+    return entries
+
+def _read_archive_refs(guild_id: int, refs):
+    """Fetch records for refs by seeking into their segments. Runs in a worker thread."""
+    records = []
+    handles = {}
     try:
-        if message.author.bot:
+        for day, offset in refs:
+            f = handles.get(day)
+            if f is None:
+                try:
+                    f = handles[day] = open(os.path.join(ARCHIVE_DIR, str(guild_id), f"{day}.jsonl"), "rb")
+                except FileNotFoundError:
+                    continue
+            f.seek(offset)
+            records.append(json.loads(f.readline()))
+    finally:
+        for f in handles.values():
+            f.close()
+    return records
+
+def _expire_archive(guild_id: int):
+    """Delete segments past retention and drop their refs from the index. Runs in a worker thread."""
+    cutoff = (datetime.utcnow() - timedelta(days=archive_retention(guild_id))).strftime("%Y-%m-%d")
+    folder = os.path.join(ARCHIVE_DIR, str(guild_id))
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name.endswith(".jsonl") and name[:-len(".jsonl")] < cutoff:
+                os.remove(os.path.join(folder, name))
+    return cutoff
+
+def archive_deleted(guild_id: int, ch_id: int, entry):
+    if guild_id is None:
+        return
+    record = dict(entry, channel_id=ch_id)
+    archive_pending.append((guild_id, record))
+
+async def archive_flush_loop():
+    for guild_id, ref, record in await asyncio.to_thread(_scan_archive):
+        _index_record(guild_id, ref, record)
+    last_expiry = datetime.utcnow()
+    while True:
+        await asyncio.sleep(ARCHIVE_FLUSH_INTERVAL)
+        if archive_pending:
+            batch = archive_pending[:]
+            del archive_pending[:len(batch)]
+            try:
+                for guild_id, ref, record in await asyncio.to_thread(_write_archive_batch, batch):
+                    _index_record(guild_id, ref, record)
+            except Exception as e:
+                print("snipe archive write error:", e)
+        if datetime.utcnow() - last_expiry > timedelta(hours=1):
+            last_expiry = datetime.utcnow()
+            for guild_id, idx in list(archive_index.items()):
+                cutoff = await asyncio.to_thread(_expire_archive, guild_id)
+                keep = lambda refs: [r for r in refs if r[0] >= cutoff]
+                idx["tokens"] = {t: kept for t, refs in idx["tokens"].items() if (kept := keep(refs))}
+                idx["users"] = {u: kept for u, refs in idx["users"].items() if (kept := keep(refs))}
+                idx["attachments"] = keep(idx["attachments"])
+
+async def search_archive(guild_id: int, mode: str, query=None):
+    """Newest-first archived records for `search <terms>`, `user <id>` or `attachments`."""
+    idx = archive_index.get(guild_id, {"tokens": {}, "users": {}, "attachments": []})
+    pending = [r for g, r in archive_pending if g == guild_id]
+    if mode == "search":
+        terms = set(TOKEN_RE.findall(query.lower()))
+        if not terms:
+            return []
+        postings = sorted((idx["tokens"].get(t, []) for t in terms), key=len)
+        hits = set(postings[0]).intersection(*postings[1:])
+        refs = sorted(hits)
+        pending = [r for r in pending if terms <= set(TOKEN_RE.findall(r["content"].lower()))]
+    elif mode == "user":
+        refs = idx["users"].get(query, [])
+        pending = [r for r in pending if r["author_id"] == query]
+    else:
+        refs = idx["attachments"]
+        pending = [r for r in pending if r["attachments"]]
+    refs = refs[-max(0, ARCHIVE_RESULTS - len(pending)):] if len(pending) < ARCHIVE_RESULTS else []
+    records = await asyncio.to_thread(_read_archive_refs, guild_id, refs)
+    return (records + pending)[-ARCHIVE_RESULTS:][::-1]
+
+# -------------------------
+# ATTACHMENT CACHE (content-addressed copies of attachments in watched channels)
+# -------------------------
+ATTACH_DIR = "attachment_cache"         # attachment_cache/<sha[:2]>/<sha>
+ATTACH_URL_LOG = os.path.join(ATTACH_DIR, "urls.jsonl")
+ATTACH_MAX_BYTES = 500 * 1024 * 1024    # total cache size before LRU eviction
+ATTACH_MAX_FILE = 8 * 1024 * 1024       # larger attachments are not preserved
+ATTACH_CONCURRENCY = 4
+ATTACH_MAX_URLS = 50_000
+attach_session = None       # aiohttp.ClientSession, created in setup
+attach_sem = None
+attach_lru = OrderedDict()  # {sha: size} least recently used first
+attach_total = 0
+attach_urls = OrderedDict() # {url without query: (sha, filename)}
+attach_log_lines = 0        # lines in urls.jsonl; compacted once mostly stale
+attach_log_lock = None      # asyncio.Lock serializing url log appends and rewrites
+
+def _attach_key(url: str):
+    return url.split("?", 1)[0]
+
+def _attach_path(sha: str):
+    return os.path.join(ATTACH_DIR, sha[:2], sha)
+
+def _scan_attachment_cache():
+    """Load cached blobs (oldest mtime first) and the url map. Runs in a worker thread."""
+    blobs = []
+    if os.path.isdir(ATTACH_DIR):
+        for sub in os.listdir(ATTACH_DIR):
+            folder = os.path.join(ATTACH_DIR, sub)
+            if len(sub) != 2 or not os.path.isdir(folder):
+                continue
+            for sha in os.listdir(folder):
+                st = os.stat(os.path.join(folder, sha))
+                blobs.append((st.st_mtime, sha, st.st_size))
+    urls = []
+    if os.path.exists(ATTACH_URL_LOG):
+        with open(ATTACH_URL_LOG, "r") as f:
+            for line in f:
+                try:
+                    urls.append(json.loads(line))
+                except ValueError:
+                    pass
+    return sorted(blobs), urls
+
+async def download_attachment(session, url: str, max_bytes: int = ATTACH_MAX_FILE):
+    """GET url with the shared session; returns the body, or None on error or if it is too large."""
+    async with session.get(url) as resp:
+        if resp.status != 200 or (resp.content_length or 0) > max_bytes:
+            return None
+        # content.read(n) returns whatever chunk has arrived, so read to EOF and stop past the cap
+        data = bytearray()
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            data += chunk
+            if len(data) > max_bytes:
+                return None
+        return bytes(data)
+
+def _store_blob(data: bytes):
+    """Hash and write a blob unless it is already cached. Runs in a worker thread."""
+    sha = hashlib.sha256(data).hexdigest()
+    path = _attach_path(sha)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return sha
+
+def _append_url_log(entry):
+    with open(ATTACH_URL_LOG, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def _compact_url_log(entries):
+    """Rewrite the url log without entries for evicted blobs. Runs in a worker thread."""
+    with open(ATTACH_URL_LOG + ".tmp", "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(ATTACH_URL_LOG + ".tmp", ATTACH_URL_LOG)
+
+def _evict_blobs(shas):
+    for sha in shas:
+        try:
+            os.remove(_attach_path(sha))
+        except FileNotFoundError:
+            pass
+
+def _remember_blob(key: str, sha: str, filename: str, size: int):
+    global attach_total
+    if sha in attach_lru:
+        attach_lru.move_to_end(sha)
+    else:
+        attach_lru[sha] = size
+        attach_total += size
+    attach_urls[key] = (sha, filename)
+    attach_urls.move_to_end(key)
+    while len(attach_urls) > ATTACH_MAX_URLS:
+        attach_urls.popitem(last=False)
+
+async def preserve_attachment(attachment):
+    global attach_total, attach_log_lines
+    key = _attach_key(attachment.url)
+    if key in attach_urls or attachment.size > ATTACH_MAX_FILE or attach_session is None:
+        return
+    async with attach_sem:
+        try:
+            data = await download_attachment(attach_session, attachment.url)
+        except Exception as e:
+            print("attachment download failed:", e)
             return
-        now = datetime.utcnow()
-        ch_id = message.channel.id
-        entry = {
-            "author": str(message.author),
-            "author_id": getattr(message.author, "id", None),
-            "avatar": getattr(getattr(message.author, "display_avatar", None), "url", None),
-            "content": message.content or "",
-            "attachments": [a.url for a in message.attachments] if message.attachments else [],
-            "time": now.isoformat()
-        }
-        deleted_messages.setdefault(ch_id, []).append(entry)
-        # trim
-        if len(deleted_messages[ch_id]) > MAX_STORE_PER_CHANNEL:
-            deleted_messages[ch_id].pop(0)
+    if data is None:
+        return
+    filename = re.sub(r"[^\w.\-]", "_", attachment.filename)[:100] or "file"
+    sha = await asyncio.to_thread(_store_blob, data)
+    async with attach_log_lock:
+        await asyncio.to_thread(_append_url_log, [key, sha, filename])
+        attach_log_lines += 1
+        _remember_blob(key, sha, filename, len(data))
+
+    evicted = []
+    while attach_total > ATTACH_MAX_BYTES and len(attach_lru) > 1:
+        old_sha, size = attach_lru.popitem(last=False)
+        attach_total -= size
+        evicted.append(old_sha)
+    if evicted:
+        await asyncio.to_thread(_evict_blobs, evicted)
+    if attach_log_lines > 2 * len(attach_urls) + 1000:
+        await compact_url_log()
+
+async def compact_url_log():
+    """Rewrite urls.jsonl with only the live url -> blob entries."""
+    global attach_log_lines
+    async with attach_log_lock:
+        entries = [[k, sha, fn] for k, (sha, fn) in attach_urls.items() if sha in attach_lru]
+        await asyncio.to_thread(_compact_url_log, entries)
+        attach_log_lines = len(entries)
+
+def is_watched_channel(guild_id: int, channel_id: int):
+    return channel_id in archive_config.get(str(guild_id), {}).get("watch_channels", [])
+
+def cached_attachment_files(urls, max_bytes: int):
+    """
+    discord.File objects for the cached copies of urls (max 10, at most max_bytes in total),
+    refreshing their LRU position.
+    """
+    files = []
+    total = 0
+    for url in urls:
+        cached = attach_urls.get(_attach_key(url))
+        if not cached or cached[0] not in attach_lru:
+            continue
+        sha, filename = cached
+        if total + attach_lru[sha] > max_bytes:
+            continue
+        total += attach_lru[sha]
+        attach_lru.move_to_end(sha)
+        try:
+            files.append(discord.File(_attach_path(sha), filename=filename))
+        except OSError:
+            continue
+        if len(files) == 10:
+            break
+    return files
+
+async def start_attachment_cache():
+    global attach_session, attach_sem, attach_total, attach_log_lock, attach_log_lines
+    attach_sem = asyncio.Semaphore(ATTACH_CONCURRENCY)
+    attach_log_lock = asyncio.Lock()
+    attach_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=ATTACH_CONCURRENCY),
+        timeout=aiohttp.ClientTimeout(total=30)
+    )
+    blobs, urls = await asyncio.to_thread(_scan_attachment_cache)
+    for _, sha, size in blobs:
+        attach_lru[sha] = size
+        attach_total += size
+    for key, sha, filename in urls:
+        if sha in attach_lru:
+            attach_urls[key] = (sha, filename)
+    while len(attach_urls) > ATTACH_MAX_URLS:
+        attach_urls.popitem(last=False)
+    attach_log_lines = len(urls)
+    if len(urls) > len(attach_urls):
+        await compact_url_log()
+
+# -------------------------
+# SNIPE CAPTURE (own per-channel store, resolved from raw delete events)
+# -------------------------
+recent_messages = OrderedDict()  # {channel_id: OrderedDict{message_id: (author, author_id, avatar, content, attachments)}}, LRU by activity
+
+def capture_message(message):
+    """Remember a message so a later raw delete can be sniped even if the library cache dropped it."""
+    store = recent_messages.get(message.channel.id)
+    if store is None:
+        store = recent_messages[message.channel.id] = OrderedDict()
+        if len(recent_messages) > CAPTURE_MAX_CHANNELS:
+            recent_messages.popitem(last=False)
+    else:
+        recent_messages.move_to_end(message.channel.id)
+    store[message.id] = (
+        str(message.author),
+        message.author.id,
+        getattr(getattr(message.author, "display_avatar", None), "url", None),
+        message.content or "",
+        tuple(a.url for a in message.attachments),
+    )
+    if len(store) > CAPTURE_PER_CHANNEL:
+        store.popitem(last=False)
+    if message.attachments and is_watched_channel(message.guild.id, message.channel.id):
+        for a in message.attachments:
+            spawn(preserve_attachment(a))
+
+def record_deleted(guild_id, ch_id: int, message_id: int, cached_message=None):
+    store = recent_messages.get(ch_id)
+    captured = store.pop(message_id, None) if store else None
+    if captured:
+        author, author_id, avatar, content, attachments = captured
+    elif cached_message is not None and not cached_message.author.bot:
+        author = str(cached_message.author)
+        author_id = cached_message.author.id
+        avatar = getattr(getattr(cached_message.author, "display_avatar", None), "url", None)
+        content = cached_message.content or ""
+        attachments = [a.url for a in cached_message.attachments]
+    else:
+        return
+    entry = {
+        "author": author,
+        "author_id": author_id,
+        "avatar": avatar,
+        "content": content,
+        "attachments": list(attachments),
+        "time": datetime.utcnow().isoformat()
+    }
+    deleted_messages.setdefault(ch_id, []).append(entry)
+    # trim
+    if len(deleted_messages[ch_id]) > MAX_STORE_PER_CHANNEL:
+        deleted_messages[ch_id].pop(0)
+    archive_deleted(guild_id, ch_id, entry)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    try:
+        record_deleted(payload.guild_id, payload.channel_id, payload.message_id, payload.cached_message)
     except Exception as e:
-        print("on_message_delete error:", e)
+        print("on_raw_message_delete error:", e)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    try:
+        cached = {m.id: m for m in payload.cached_messages}
+        for message_id in sorted(payload.message_ids):
+            record_deleted(payload.guild_id, payload.channel_id, message_id, cached.get(message_id))
+    except Exception as e:
+        print("on_raw_bulk_message_delete error:", e)
 
 # -------------------------
 # MODERATION COMMANDS (embeds for all outputs)
@@ -198,13 +1209,6 @@ async def on_member_ban(guild, user):
         reason = None
         moderator = None
 
-    # Fetch the user object via bot (more reliable for DM)
-    try:
-        user_obj = await bot.fetch_user(user.id)
-    except Exception:
-        print(f"Could not fetch user {user.id}")
-        return
-
     # Get the server-specific appeal link
     appeal_link = appeal_links.get(guild.id, "No appeal form set by server admins")
 
@@ -222,12 +1226,37 @@ async def on_member_ban(guild, user):
     if moderator:
         embed.set_footer(text=f"Banned by: {moderator}")
 
-    # Send DM
-    try:
-        await user_obj.send(embed=embed)
-        print(f"Sent ban DM to {user_obj}")
-    except Exception:
-        print(f"Could not DM {user_obj}.")
+    # Queue DM (worker resolves the user by id, which is more reliable after a ban)
+    queue_dm(user.id, embed=embed, guild=guild, removed=True)
+
+async def ban_member(guild, member, moderator, reason: str, save: bool = True):
+    """Ban, open a case and log it. Returns the feedback embed for the invoking channel."""
+    with rest_priority("mod"):
+        await member.ban(reason=reason)
+    case_id = open_case(guild, "ban", member, moderator, reason, save=save)
+
+    # ✅ Feedback embed
+    embed = make_embed(
+        "🚫 User Banned",
+        f"**{member}** has been banned.\n**Reason:** {reason}\n**Case:** `#{case_id}`",
+        discord.Color.red()
+    )
+    embed.set_author(
+        name=str(moderator),
+        icon_url=getattr(moderator.display_avatar, "url", None)
+    )
+
+    # 📜 Log embed
+    log_embed = make_embed(
+        "🚫 Ban Issued",
+        f"**User:** {member} (`{member.id}`)\n"
+        f"**Moderator:** {moderator} (`{moderator.id}`)\n"
+        f"**Reason:** {reason}\n"
+        f"**Case:** `#{case_id}`",
+        discord.Color.dark_red()
+    )
+    await send_log_embed(guild, "Ban Log", log_embed)
+    return embed
 
 # BAN
 @bot.command(aliases=["fuckoff", "doom", "apple"])
@@ -237,15 +1266,7 @@ async def ban(ctx, *users_and_reason: str):
         return await send_error(ctx, "You must specify at least one user.")
 
     # Separate user arguments and reason arguments
-    potential_users = []
-    reason_parts = []
-
-    for arg in users_and_reason:
-        member = find_member(ctx, arg)
-        if member:
-            potential_users.append(member)
-        else:
-            reason_parts.append(arg)
+    potential_users, reason_parts = await split_targets(ctx, users_and_reason)
 
     if not potential_users:
         return await send_error(ctx, "Could not find any valid users to ban.")
@@ -253,72 +1274,60 @@ async def ban(ctx, *users_and_reason: str):
     reason = " ".join(reason_parts) if reason_parts else "No reason provided"
 
     for member in potential_users:
-        # 🚫 Prevent banning yourself
-        if member.id == ctx.author.id:
-            funny = make_embed(
-                "😂 Nice Try",
-                "You can’t ban yourself, buddy. Sit down 🤡",
-                discord.Color.orange()
-            )
-            await ctx.send(embed=funny)
-            continue
-
-        # 🛡️ Staff immunity (unless executor has admin perms)
-        if is_staff(member) and not ctx.author.guild_permissions.administrator:
-            immune = make_embed(
-                "🛡️ Staff Immunity",
-                f"{member.mention} is staff and cannot be banned by you.",
-                discord.Color.gold()
-            )
-            await ctx.send(embed=immune)
+        # no self-targeting, staff immunity and bot hierarchy (shared policy)
+        blocked = target_block_embed(ctx.author, member, "ban", "banned")
+        if blocked:
+            await ctx.send(embed=blocked)
             continue
 
         try:
-            await member.ban(reason=reason)
-
-            # ✅ Feedback embed
-            embed = make_embed(
-                "🚫 User Banned",
-                f"**{member}** has been banned.\n**Reason:** {reason}",
-                discord.Color.red()
-            )
-            embed.set_author(
-                name=str(ctx.author),
-                icon_url=getattr(ctx.author.display_avatar, "url", None)
-            )
+            embed = await ban_member(ctx.guild, member, ctx.author, reason, save=False)
             await ctx.send(embed=embed)
-
-            # 📜 Log embed
-            log_embed = make_embed(
-                "🚫 Ban Issued",
-                f"**User:** {member} (`{member.id}`)\n"
-                f"**Moderator:** {ctx.author} (`{ctx.author.id}`)\n"
-                f"**Reason:** {reason}",
-                discord.Color.dark_red()
-            )
-            await send_log_embed(ctx.guild, "Ban Log", log_embed)
-
         except Exception as e:
             await send_error(ctx, f"Failed to ban {member}. Error: {e}")
+    save_cases(cases_data)
 
 # ==========================
 # KICK (multi-target, immunity, no-self, DMs, logs)
 # ==========================
+async def kick_member(guild, member, moderator, reason: str, save: bool = True):
+    """Kick, open a case, DM and log it. Returns the feedback embed for the invoking channel."""
+    with rest_priority("mod"):
+        await member.kick(reason=reason)
+    case_id = open_case(guild, "kick", member, moderator, reason, save=save)
+
+    # DM target
+    dm = make_embed(
+        "👢 You were kicked",
+        f"You were kicked from **{guild.name}**.\n**Reason:** {reason}",
+        discord.Color.orange()
+    )
+    queue_dm(member, embed=dm, guild=guild, removed=True)
+
+    # Feedback embed in channel
+    embed = make_embed(
+        "👢 User Kicked",
+        f"**{member}** has been kicked.\n**Reason:** {reason}\n**Case:** `#{case_id}`",
+        discord.Color.orange()
+    )
+    embed.set_author(name=str(moderator), icon_url=getattr(moderator.display_avatar, "url", None))
+
+    # Log embed
+    log_embed = make_embed(
+        "👢 Kick Issued",
+        f"**User:** {member} (`{member.id}`)\n**Moderator:** {moderator} (`{moderator.id}`)\n**Reason:** {reason}\n**Case:** `#{case_id}`",
+        discord.Color.dark_orange()
+    )
+    await send_log_embed(guild, "Kick Log", log_embed)
+    return embed
+
 @bot.command()
 @commands.has_permissions(kick_members=True)
 async def kick(ctx, *users_and_reason: str):
     if not users_and_reason:
         return await send_error(ctx, "You must specify at least one user.")
 
-    potential_users = []
-    reason_parts = []
-
-    for arg in users_and_reason:
-        member = find_member(ctx, arg)
-        if member:
-            potential_users.append(member)
-        else:
-            reason_parts.append(arg)
+    potential_users, reason_parts = await split_targets(ctx, users_and_reason)
 
     if not potential_users:
         return await send_error(ctx, "Could not find any valid users to kick.")
@@ -326,68 +1335,19 @@ async def kick(ctx, *users_and_reason: str):
     reason = " ".join(reason_parts) if reason_parts else "No reason provided"
 
     for member in potential_users:
-        # prevent self kick
-        if member.id == ctx.author.id:
-            funny = make_embed(
-                "😂 Nice Try",
-                "You can’t kick yourself, buddy. Sit down 🤡",
-                discord.Color.orange()
-            )
-            await ctx.send(embed=funny)
-            continue
-
-        # staff immunity check (unless executor is admin)
-        perms = member.guild_permissions
-        is_staff = (
-            perms.manage_messages
-            or perms.kick_members
-            or perms.ban_members
-            or perms.manage_roles
-            or getattr(perms, "moderate_members", False)
-        )
-        if is_staff and not ctx.author.guild_permissions.administrator:
-            immune = make_embed(
-                "🛡️ Staff Immunity",
-                f"{member.mention} is staff and cannot be kicked by you.",
-                discord.Color.gold()
-            )
-            await ctx.send(embed=immune)
+        # no self-targeting, staff immunity and bot hierarchy (shared policy)
+        blocked = target_block_embed(ctx.author, member, "kick", "kicked")
+        if blocked:
+            await ctx.send(embed=blocked)
             continue
 
         try:
-            await member.kick(reason=reason)
-
-            # DM target
-            try:
-                dm = make_embed(
-                    "👢 You were kicked",
-                    f"You were kicked from **{ctx.guild.name}**.\n**Reason:** {reason}",
-                    discord.Color.orange()
-                )
-                await member.send(embed=dm)
-            except Exception:
-                pass
-
-            # Feedback embed in channel
-            embed = make_embed(
-                "👢 User Kicked",
-                f"**{member}** has been kicked.\n**Reason:** {reason}",
-                discord.Color.orange()
-            )
-            embed.set_author(name=str(ctx.author), icon_url=getattr(ctx.author.display_avatar, "url", None))
+            embed = await kick_member(ctx.guild, member, ctx.author, reason, save=False)
             await ctx.send(embed=embed)
-
-            # Log embed
-            log_embed = make_embed(
-                "👢 Kick Issued",
-                f"**User:** {member} (`{member.id}`)\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Reason:** {reason}",
-                discord.Color.dark_orange()
-            )
-            await send_log_embed(ctx.guild, "Kick Log", log_embed)
-
         except Exception as e:
             # continue with the rest, report individual failure
             await send_error(ctx, f"Failed to kick {member}. Error: {e}")
+    save_cases(cases_data)
 
 # UNBAN (ID only)
 @bot.command()
@@ -404,9 +1364,415 @@ async def unban(ctx, user_id: int):
     except Exception as e:
         return await send_error(ctx, f"Failed to unban. Error: {e}")
 
+# -------------------------
+# BAN LISTS (guild bulk-ban endpoint, JSONL export/import, cross-guild sync)
+# -------------------------
+BAN_JOBS_FILE = "ban_jobs.json"
+BULK_BAN_SIZE = 200         # user ids per bulk-ban call (API maximum)
+BAN_JOB_DELAY = 2.0         # seconds between bulk-ban batches
+BAN_DELETE_SECONDS = 86400  # message history removed with each ban
+USER_ID_RE = re.compile(r"<@!?(\d{15,20})>|\b(\d{15,20})\b")
+ban_job_tasks = {}  # {guild_id: asyncio.Task}
+
+def load_ban_jobs():
+    return store_load(BAN_JOBS_FILE, {})
+
+def save_ban_jobs(data):
+    store_save(BAN_JOBS_FILE, data)
+
+ban_jobs = load_ban_jobs()  # {guild_id: {channel_id, targets: [[id, name]], done, banned, failed, ...}}
+
+class BanTarget(discord.Object):
+    """A user id (usually not a member) that prints as its name in cases and logs."""
+    def __init__(self, id, name=None):
+        super().__init__(id)
+        self.name = name
+
+    def __str__(self):
+        return self.name or str(self.id)
+
+async def bulk_ban_ids(guild, targets, moderator, reason: str):
+    """
+    Ban up to BULK_BAN_SIZE BanTargets with one API call and open a case for each.
+    Returns (banned, failed) lists of ids.
+    """
+    try:
+        with rest_priority("mod"):
+            result = await guild.bulk_ban(targets, reason=reason, delete_message_seconds=BAN_DELETE_SECONDS)
+    except discord.HTTPException as e:
+        print("bulk ban batch failed:", e)
+        return [], [t.id for t in targets]
+    banned = {o.id for o in result.banned}
+    for t in targets:
+        if t.id in banned:
+            open_case(guild, "ban", t, moderator, reason, save=False)
+    save_cases(cases_data)
+    return list(banned), [o.id for o in result.failed]
+
+async def run_ban_job(guild):
+    """Work through a persisted ban job in bulk batches, checkpointing after each one."""
+    job = ban_jobs.get(str(guild.id))
+    if not job:
+        return
+    channel = guild.get_channel(job["channel_id"])
+    moderator = guild.get_member(job["moderator_id"]) or guild.me
+    targets = job["targets"]
+    total = len(targets)
+
+    def progress(title, color):
+        return make_embed(title, f"Progress: **{job['done']}/{total}**\nBanned: {job['banned']} • Failed: {job['failed']}", color)
+
+    progress_msg = await channel.send(embed=progress("⏳ Ban Job", discord.Color.blue())) if channel else None
+    try:
+        while job["done"] < total:
+            batch = [BanTarget(uid, name) for uid, name in targets[job["done"]:job["done"] + BULK_BAN_SIZE]]
+            banned, failed = await bulk_ban_ids(guild, batch, moderator, job["reason"])
+            job["done"] += len(batch)
+            job["banned"] += len(banned)
+            job["failed"] += len(failed)
+            save_ban_jobs(ban_jobs)
+            if progress_msg:
+                await progress_msg.edit(embed=progress("⏳ Ban Job", discord.Color.blue()))
+            if job["done"] < total:
+                await asyncio.sleep(BAN_JOB_DELAY)
+    except asyncio.CancelledError:
+        save_ban_jobs(ban_jobs)
+        raise
+    finally:
+        ban_job_tasks.pop(guild.id, None)
+
+    ban_jobs.pop(str(guild.id), None)
+    save_ban_jobs(ban_jobs)
+    embed = progress("✅ Ban Job Finished", discord.Color.green())
+    embed.description += f"\n**Moderator:** {moderator}\n**Reason:** {job['reason']}"
+    if progress_msg:
+        await progress_msg.edit(embed=embed)
+    await send_log_embed(guild, "Ban Job", embed)
+
+def start_ban_job(guild):
+    if guild.id not in ban_job_tasks:
+        ban_job_tasks[guild.id] = asyncio.create_task(run_ban_job(guild))
+
+def resume_ban_jobs():
+    for guild_id in list(ban_jobs):
+        guild = bot.get_guild(int(guild_id))
+        if guild:
+            start_ban_job(guild)
+
+async def queue_ban_job(ctx, targets, reason: str):
+    """targets: [[id, name]]; already-banned ids and protected members are dropped first."""
+    if str(ctx.guild.id) in ban_jobs:
+        await send_error(ctx, "A ban job is already running here. Use `xbans cancel` to stop it.")
+        return False
+    existing = {entry.user.id async for entry in ctx.guild.bans(limit=None)}
+    seen, todo = set(existing), []
+    for uid, name in targets:
+        member = ctx.guild.get_member(uid)
+        if uid in seen or uid == ctx.author.id or (member and is_staff(member)):
+            continue
+        seen.add(uid)
+        todo.append([uid, name])
+    if not todo:
+        await send_error(ctx, "Nothing to ban — every id is already banned or protected.")
+        return False
+    ban_jobs[str(ctx.guild.id)] = {
+        "channel_id": ctx.channel.id,
+        "moderator_id": ctx.author.id,
+        "targets": todo,
+        "done": 0,
+        "banned": 0,
+        "failed": 0,
+        "reason": reason,
+    }
+    save_ban_jobs(ban_jobs)
+    start_ban_job(ctx.guild)
+    return True
+
+def parse_ban_lines(text: str):
+    """JSONL lines ({"id", "name"}) or any text containing user ids -> [[id, name]]."""
+    targets = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                entry = json.loads(line)
+                targets.append([int(entry["id"]), entry.get("name")])
+                continue
+            except (ValueError, KeyError, TypeError):
+                pass
+        targets.extend([int(a or b), None] for a, b in USER_ID_RE.findall(line))
+    return targets
+
+@bot.command(aliases=["massban"])
+@commands.has_permissions(ban_members=True)
+async def bulkban(ctx, *args: str):
+    """xbulkban <ids/mentions...> [reason] — ids may belong to users who already left; a .txt/.jsonl attachment works too."""
+    targets, reason_parts = [], []
+    for arg in args:
+        m = USER_ID_RE.fullmatch(arg)
+        if m:
+            targets.append([int(m.group(1) or m.group(2)), None])
+        else:
+            reason_parts.append(arg)
+    for att in ctx.message.attachments:
+        targets.extend(parse_ban_lines((await att.read()).decode("utf-8", "ignore")))
+    if not targets:
+        return await send_error(ctx, "Usage: `xbulkban <ids...> [reason]` or attach a file of ids.")
+    reason = " ".join(reason_parts) or f"Bulk ban by {ctx.author}"
+    await queue_ban_job(ctx, targets, reason)
+
+@bot.command()
+@commands.has_permissions(ban_members=True)
+async def bans(ctx, action: str = "status", source: int = None):
+    """xbans [status|cancel|export|import|sync <guild_id>]"""
+    action = action.lower()
+    if action == "export":
+        buf = io.BytesIO()
+        count = 0
+        async for entry in ctx.guild.bans(limit=None):
+            line = {"id": entry.user.id, "name": str(entry.user), "reason": entry.reason}
+            buf.write((json.dumps(line) + "\n").encode())
+            count += 1
+        buf.seek(0)
+        file = discord.File(buf, filename=f"bans-{ctx.guild.id}.jsonl")
+        return await ctx.send(embed=make_embed("📤 Ban List Exported", f"**{count}** bans.", discord.Color.blurple()), file=file)
+
+    if action == "import":
+        if not ctx.message.attachments:
+            return await send_error(ctx, "Attach a `.jsonl` ban list exported with `xbans export`.")
+        targets = []
+        for att in ctx.message.attachments:
+            targets.extend(parse_ban_lines((await att.read()).decode("utf-8", "ignore")))
+        if await queue_ban_job(ctx, targets, f"Ban list import by {ctx.author}"):
+            await send_success(ctx, "📥 Ban Import Queued", f"Read **{len(targets)}** entries.")
+        return
+
+    if action == "sync":
+        src = bot.get_guild(source) if source else None
+        if not src:
+            return await send_error(ctx, "Usage: `xbans sync <guild_id>` (I must be in that server).")
+        src_member = src.get_member(ctx.author.id) or await fetch_member_cached(src, str(ctx.author.id))
+        if not src_member or not src_member.guild_permissions.ban_members:
+            return await send_error(ctx, "You need Ban Members in the source server too.")
+        targets = [[entry.user.id, str(entry.user)] async for entry in src.bans(limit=None)]
+        if await queue_ban_job(ctx, targets, f"Ban sync from {src.name} by {ctx.author}"):
+            await send_success(ctx, "🔁 Ban Sync Queued", f"**{len(targets)}** bans in **{src.name}**.")
+        return
+
+    job = ban_jobs.get(str(ctx.guild.id))
+    if not job:
+        return await send_error(ctx, "No ban job is running in this server.")
+    if action == "cancel":
+        task = ban_job_tasks.get(ctx.guild.id)
+        if task:
+            task.cancel()
+        ban_jobs.pop(str(ctx.guild.id), None)
+        save_ban_jobs(ban_jobs)
+        return await send_success(ctx, "🛑 Ban Job Cancelled", f"Stopped after **{job['done']}/{len(job['targets'])}** ids.")
+    embed = make_embed("⏳ Ban Job", f"Progress: **{job['done']}/{len(job['targets'])}**\nBanned: {job['banned']} • Failed: {job['failed']}", discord.Color.blue())
+    await ctx.send(embed=embed)
+
+# -------------------------
+# MUTE REGISTRY (active timeouts indexed by expiry; re-applies mutes past Discord's 28 day cap)
+# -------------------------
+MUTES_FILE = "mutes.json"
+MAX_TIMEOUT = timedelta(days=28) - timedelta(minutes=5)  # Discord's cap, with some slack
+MUTE_REAPPLY_BEFORE = timedelta(days=1)  # extend a long mute this long before its applied timeout ends
+MUTE_SWEEP_INTERVAL = 300                # seconds between expiry sweeps
+UNMUTE_ALL_DELAY = 1.0                   # seconds between unmutes in `xunmute all`
+
+def load_mutes():
+    return store_load(MUTES_FILE, {})
+
+def save_mutes(data):
+    store_save(MUTES_FILE, data)
+
+mutes = load_mutes()  # {guild_id: {user_id: {until, applied, reason, moderator}}}; until None = indefinite
+mute_heap = []        # [(due_ts, guild_id, user_id)]; stale entries are skipped when popped
+
+def _mute_due(entry):
+    """When the sweep next looks at a mute: its expiry, or shortly before the applied timeout runs out."""
+    applied = datetime.fromisoformat(entry["applied"])
+    until = datetime.fromisoformat(entry["until"]) if entry["until"] else None
+    if until and until <= applied:
+        return until.timestamp()
+    return (applied - MUTE_REAPPLY_BEFORE).timestamp()
+
+def _push_mute(guild_id: str, user_id: str, entry):
+    heapq.heappush(mute_heap, (_mute_due(entry), guild_id, user_id))
+
+for _gid, _g in mutes.items():
+    for _uid, _entry in _g.items():
+        _push_mute(_gid, _uid, _entry)
+
+def register_mute(guild, member, until, applied, reason: str, moderator, save: bool = True):
+    entry = {
+        "until": until.isoformat() if until else None,
+        "applied": applied.isoformat(),
+        "reason": reason,
+        "moderator": str(moderator),
+    }
+    mutes.setdefault(str(guild.id), {})[str(member.id)] = entry
+    _push_mute(str(guild.id), str(member.id), entry)
+    if save:
+        save_mutes(mutes)
+
+def unregister_mute(guild_id, user_id, save: bool = True):
+    g = mutes.get(str(guild_id))
+    if g and g.pop(str(user_id), None) is not None:
+        if not g:
+            del mutes[str(guild_id)]
+        if save:
+            save_mutes(mutes)
+
+def track_timeout(before, after):
+    """Keep the registry in line with timeouts set or lifted outside the bot (called from on_member_update)."""
+    if before.timed_out_until == after.timed_out_until:
+        return
+    entry = mutes.get(str(after.guild.id), {}).get(str(after.id))
+    new_until = after.timed_out_until
+    if new_until is None or new_until <= discord.utils.utcnow():
+        unregister_mute(after.guild.id, after.id)
+        return
+    if entry and abs((datetime.fromisoformat(entry["applied"]) - new_until).total_seconds()) < 5:
+        return  # our own timeout call echoing back
+    register_mute(after.guild, after, new_until, new_until, "Timed out outside the bot", "unknown")
+
+def sync_mutes_from_cache():
+    """Pick up timeouts set, and drop ones lifted, while the bot was offline."""
+    now = discord.utils.utcnow()
+    changed = False
+    for guild in bot.guilds:
+        known = mutes.get(str(guild.id), {})
+        for m in guild.members:
+            if m.timed_out_until and m.timed_out_until > now and str(m.id) not in known:
+                register_mute(guild, m, m.timed_out_until, m.timed_out_until, "Timed out outside the bot", "unknown", save=False)
+                changed = True
+        for uid in list(known):
+            m = guild.get_member(int(uid))
+            if m is not None and m.timed_out_until is None:
+                unregister_mute(guild.id, uid, save=False)
+                changed = True
+    if changed:
+        save_mutes(mutes)
+
+async def mute_sweep_loop():
+    await bot.wait_until_ready()
+    while True:
+        now = discord.utils.utcnow()
+        changed = False
+        while mute_heap and mute_heap[0][0] <= now.timestamp():
+            due, gid, uid = heapq.heappop(mute_heap)
+            entry = mutes.get(gid, {}).get(uid)
+            if not entry or _mute_due(entry) != due:
+                continue
+            guild = bot.get_guild(int(gid))
+            if not guild:
+                continue  # not on this cluster
+            until = datetime.fromisoformat(entry["until"]) if entry["until"] else None
+            if until and until <= datetime.fromisoformat(entry["applied"]):
+                unregister_mute(gid, uid, save=False)  # ran out on its own
+                changed = True
+                continue
+            applied = min(until, now + MAX_TIMEOUT) if until else now + MAX_TIMEOUT
+            # record the new timeout first, so the on_member_update echo of our own call
+            # is recognised by track_timeout instead of re-registered as an outside timeout
+            previous = entry["applied"]
+            entry["applied"] = applied.isoformat()
+            _push_mute(gid, uid, entry)
+            try:
+                member = guild.get_member(int(uid)) or await guild.fetch_member(int(uid))
+                with rest_priority("mod"):
+                    await member.timeout(applied, reason=f"Long mute re-applied: {entry['reason']}")
+                changed = True
+            except discord.HTTPException as e:
+                # left the server or missing perms; retried from the registry on next start
+                entry["applied"] = previous   # the heap entry just pushed is now stale and skipped
+                print(f"mute re-apply failed for {uid}:", e)
+        if changed:
+            save_mutes(mutes)
+        await asyncio.sleep(MUTE_SWEEP_INTERVAL)
+
+async def unmute_all(ctx, reason: str):
+    targets = list(mutes.get(str(ctx.guild.id), {}))
+    if not targets:
+        return await send_error(ctx, "Nobody is muted in this server.")
+    done = failed = 0
+    progress_msg = await ctx.send(embed=make_embed("⏳ Unmuting All", f"Progress: **0/{len(targets)}**", discord.Color.blue()))
+    for uid in targets:
+        try:
+            member = ctx.guild.get_member(int(uid)) or await ctx.guild.fetch_member(int(uid))
+            with rest_priority("mod"):
+                await member.timeout(None, reason=reason)
+            done += 1
+        except discord.NotFound:
+            done += 1  # left the server; nothing to lift
+        except discord.HTTPException as e:
+            failed += 1
+            print(f"unmute all failed for {uid}:", e)
+            continue
+        unregister_mute(ctx.guild.id, uid, save=False)
+        if (done + failed) % 25 == 0:
+            await progress_msg.edit(embed=make_embed("⏳ Unmuting All", f"Progress: **{done + failed}/{len(targets)}**", discord.Color.blue()))
+        await asyncio.sleep(UNMUTE_ALL_DELAY)
+    save_mutes(mutes)
+    embed = make_embed("✅ Mass Unmute", f"**Unmuted:** {done} • **Failed:** {failed}\n**Moderator:** {ctx.author}\n**Reason:** {reason}", discord.Color.green())
+    await progress_msg.edit(embed=embed)
+    await send_log_embed(ctx.guild, "Mass Unmute", embed)
+
+@bot.command(name="mutes")
+@commands.has_permissions(moderate_members=True)
+async def mutes_cmd(ctx):
+    g = mutes.get(str(ctx.guild.id), {})
+    if not g:
+        return await ctx.send(embed=make_embed("🔇 Active Mutes", "Nobody is muted.", discord.Color.green()))
+    # soonest expiry first, indefinite last
+    order = sorted(g.items(), key=lambda kv: kv[1]["until"] or "9999")
+    lines = []
+    for uid, e in order[:20]:
+        ends = f"<t:{int(datetime.fromisoformat(e['until']).timestamp())}:R>" if e["until"] else "never"
+        lines.append(f"<@{uid}> — ends {ends} • {e['reason'][:50]}")
+    embed = make_embed("🔇 Active Mutes", "\n".join(lines), discord.Color.gold())
+    embed.set_footer(text=f"Showing {len(lines)} of {len(g)} • xunmute all to lift every mute")
+    await ctx.send(embed=embed)
+
 # -------------------------
 # MUTE / UNMUTE (uses parse_duration)
 # -------------------------
+async def timeout_member(guild, member, duration_td: timedelta, duration_str: str, reason: str, moderator, save: bool = True):
+    """
+    Time out a member and do the bookkeeping every mute shares: case, DM and mod log.
+    Used by xmute and by automatic actions (raid/spam), where moderator is the bot.
+    Mutes past Discord's 28 day cap are registered and re-applied by the mute sweep.
+    Returns the case number. Batch callers pass save=False and call save_cases once.
+    """
+    now = discord.utils.utcnow()
+    until = now + duration_td
+    applied = min(until, now + MAX_TIMEOUT)
+    with rest_priority("mod"):
+        await member.timeout(applied, reason=reason)
+    register_mute(guild, member, until, applied, reason, moderator)
+    case_id = open_case(guild, "mute", member, moderator, reason, duration_str, save=save)
+
+    # DM user
+    dm = make_embed(
+        "🔇 You were muted",
+        f"You were muted in **{guild.name}** for **{duration_str}**.\n**Reason:** {reason}",
+        discord.Color.gold()
+    )
+    queue_dm(member, embed=dm, guild=guild)
+
+    # log
+    log_embed = make_embed(
+        "🔇 Mute Issued",
+        f"**User:** {member} (`{member.id}`)\n**Moderator:** {moderator} (`{moderator.id}`)\n**Duration:** {duration_str}\n**Reason:** {reason}\n**Case:** `#{case_id}`",
+        discord.Color.gold()
+    )
+    await send_log_embed(guild, "Mute Log", log_embed)
+    return case_id
+
 # ==========================
 # MUTE (multi-target, time parsing, immunity, no-self, DMs, logs)
 # ==========================
@@ -434,7 +1800,8 @@ async def mute(ctx, *args: str):
                 duration_str = arg
                 continue
 
-        member = find_member(ctx, arg)
+        # users come first; after the first non-user word the rest is reason
+        member = await find_member_async(ctx, arg) if not reason_parts else None
         if member:
             potential_users.append(member)
         else:
@@ -446,113 +1813,98 @@ async def mute(ctx, *args: str):
     reason = " ".join(reason_parts) if reason_parts else "No reason provided"
 
     for member in potential_users:
-        # prevent self-mute
-        if member.id == ctx.author.id:
-            funny = make_embed(
-                "😂 Nice Try",
-                "You can’t mute yourself, buddy. Sit down 🤡",
-                discord.Color.orange()
-            )
-            await ctx.send(embed=funny)
-            continue
-
-        # staff immunity
-        perms = member.guild_permissions
-        is_staff = (
-            perms.manage_messages
-            or perms.kick_members
-            or perms.ban_members
-            or perms.manage_roles
-            or getattr(perms, "moderate_members", False)
-        )
-        if is_staff and not ctx.author.guild_permissions.administrator:
-            immune = make_embed(
-                "🛡️ Staff Immunity",
-                f"{member.mention} is staff and cannot be muted by you.",
-                discord.Color.gold()
-            )
-            await ctx.send(embed=immune)
+        # no self-targeting, staff immunity and bot hierarchy (shared policy)
+        blocked = target_block_embed(ctx.author, member, "mute", "muted")
+        if blocked:
+            await ctx.send(embed=blocked)
             continue
-
-        try:
-            if duration_td:
-                until = discord.utils.utcnow() + duration_td
-                await member.timeout(until, reason=reason)
-                # channel feedback
-                embed = make_embed(
-                    "🔇 User Muted",
-                    f"**{member}** muted for **{duration_str}**.\n**Reason:** {reason}",
-                    discord.Color.gold()
-                )
-                await ctx.send(embed=embed)
-
-                # DM user
-                try:
-                    dm = make_embed(
-                        "🔇 You were muted",
-                        f"You were muted in **{ctx.guild.name}** for **{duration_str}**.\n**Reason:** {reason}",
-                        discord.Color.gold()
-                    )
-                    await member.send(embed=dm)
-                except:
-                    pass
-
-                # log
-                log_embed = make_embed(
-                    "🔇 Mute Issued",
-                    f"**User:** {member} (`{member.id}`)\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Duration:** {duration_str}\n**Reason:** {reason}",
+
+        try:
+            if duration_td:
+                case_id = await timeout_member(ctx.guild, member, duration_td, duration_str, reason, ctx.author, save=False)
+                # channel feedback
+                embed = make_embed(
+                    "🔇 User Muted",
+                    f"**{member}** muted for **{duration_str}**.\n**Reason:** {reason}\n**Case:** `#{case_id}`",
                     discord.Color.gold()
                 )
-                await send_log_embed(ctx.guild, "Mute Log", log_embed)
+                await ctx.send(embed=embed)
 
             else:
-                # indefinite mute (timeout with None unsets? your original used None for indefinite)
-                await member.timeout(None, reason=reason)
+                # indefinite mute: longest allowed timeout, kept alive by the mute sweep
+                applied = discord.utils.utcnow() + MAX_TIMEOUT
+                with rest_priority("mod"):
+                    await member.timeout(applied, reason=reason)
+                register_mute(ctx.guild, member, None, applied, reason, ctx.author)
+                case_id = open_case(ctx.guild, "mute", member, ctx.author, reason, "Infinite", save=False)
                 embed = make_embed(
                     "🔇 User Muted (Indefinite)",
-                    f"**{member}** muted indefinitely.\n**Reason:** {reason}",
+                    f"**{member}** muted indefinitely.\n**Reason:** {reason}\n**Case:** `#{case_id}`",
                     discord.Color.gold()
                 )
                 await ctx.send(embed=embed)
 
-                try:
-                    dm = make_embed(
-                        "🔇 You were muted",
-                        f"You were muted indefinitely in **{ctx.guild.name}**.\n**Reason:** {reason}",
-                        discord.Color.gold()
-                    )
-                    await member.send(embed=dm)
-                except:
-                    pass
+                dm = make_embed(
+                    "🔇 You were muted",
+                    f"You were muted indefinitely in **{ctx.guild.name}**.\n**Reason:** {reason}",
+                    discord.Color.gold()
+                )
+                queue_dm(member, embed=dm, guild=ctx.guild)
 
                 log_embed = make_embed(
                     "🔇 Mute Issued",
-                    f"**User:** {member} (`{member.id}`)\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Duration:** Infinite\n**Reason:** {reason}",
+                    f"**User:** {member} (`{member.id}`)\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Duration:** Infinite\n**Reason:** {reason}\n**Case:** `#{case_id}`",
                     discord.Color.gold()
                 )
                 await send_log_embed(ctx.guild, "Mute Log", log_embed)
 
         except Exception as e:
             await send_error(ctx, f"Failed to mute {member}. Error: {e}")
+    save_cases(cases_data)
 
 
 # ==========================
 # UNMUTE (multi-target, immunity, no-self, DMs, logs)
 # ==========================
+async def unmute_member(guild, member, moderator, reason: str):
+    """Lift a timeout, DM and log it. Returns the feedback embed for the invoking channel."""
+    with rest_priority("mod"):
+        await member.timeout(None, reason=reason)
+    unregister_mute(guild.id, member.id)
+    # DM target
+    dm = make_embed(
+        "✅ You were unmuted",
+        f"You were unmuted in **{guild.name}**.\n**Reason:** {reason}",
+        discord.Color.green()
+    )
+    queue_dm(member, embed=dm, guild=guild)
+
+    # feedback embed
+    embed = make_embed(
+        "✅ User Unmuted",
+        f"**{member}** has been unmuted.\n**Reason:** {reason}",
+        discord.Color.green()
+    )
+    embed.set_author(name=str(moderator), icon_url=getattr(moderator.display_avatar, "url", None))
+
+    # log
+    log_embed = make_embed(
+        "✅ Unmute",
+        f"**User:** {member} (`{member.id}`)\n**Moderator:** {moderator} (`{moderator.id}`)\n**Reason:** {reason}",
+        discord.Color.green()
+    )
+    await send_log_embed(guild, "Unmute Log", log_embed)
+    return embed
+
 @bot.command()
 @commands.has_permissions(moderate_members=True)
 async def unmute(ctx, *users_and_reason: str):
     if not users_and_reason:
         return await send_error(ctx, "You must specify at least one user.")
+    if users_and_reason[0].lower() == "all":
+        return await unmute_all(ctx, " ".join(users_and_reason[1:]) or f"Mass unmute by {ctx.author}")
 
-    potential_users = []
-    reason_parts = []
-    for arg in users_and_reason:
-        member = find_member(ctx, arg)
-        if member:
-            potential_users.append(member)
-        else:
-            reason_parts.append(arg)
+    potential_users, reason_parts = await split_targets(ctx, users_and_reason)
 
     if not potential_users:
         return await send_error(ctx, "Could not find any valid users to unmute.")
@@ -560,64 +1912,15 @@ async def unmute(ctx, *users_and_reason: str):
     reason = " ".join(reason_parts) if reason_parts else "No reason provided"
 
     for member in potential_users:
-        # prevent self-unmute
-        if member.id == ctx.author.id:
-            funny = make_embed(
-                "😂 Nice Try",
-                "You can’t unmute yourself, buddy. Sit down 🤡",
-                discord.Color.orange()
-            )
-            await ctx.send(embed=funny)
-            continue
-
-        # staff immunity
-        perms = member.guild_permissions
-        is_staff = (
-            perms.manage_messages
-            or perms.kick_members
-            or perms.ban_members
-            or perms.manage_roles
-            or getattr(perms, "moderate_members", False)
-        )
-        if is_staff and not ctx.author.guild_permissions.administrator:
-            immune = make_embed(
-                "🛡️ Staff Immunity",
-                f"{member.mention} is staff and cannot be unmuted by you.",
-                discord.Color.gold()
-            )
-            await ctx.send(embed=immune)
+        # no self-targeting, staff immunity and bot hierarchy (shared policy)
+        blocked = target_block_embed(ctx.author, member, "unmute", "unmuted")
+        if blocked:
+            await ctx.send(embed=blocked)
             continue
 
         try:
-            await member.timeout(None, reason=reason)
-            # DM target
-            try:
-                dm = make_embed(
-                    "✅ You were unmuted",
-                    f"You were unmuted in **{ctx.guild.name}**.\n**Reason:** {reason}",
-                    discord.Color.green()
-                )
-                await member.send(embed=dm)
-            except:
-                pass
-
-            # feedback embed
-            embed = make_embed(
-                "✅ User Unmuted",
-                f"**{member}** has been unmuted.\n**Reason:** {reason}",
-                discord.Color.green()
-            )
-            embed.set_author(name=str(ctx.author), icon_url=getattr(ctx.author.display_avatar, "url", None))
+            embed = await unmute_member(ctx.guild, member, ctx.author, reason)
             await ctx.send(embed=embed)
-
-            # log
-            log_embed = make_embed(
-                "✅ Unmute",
-                f"**User:** {member} (`{member.id}`)\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Reason:** {reason}",
-                discord.Color.green()
-            )
-            await send_log_embed(ctx.guild, "Unmute Log", log_embed)
-
         except Exception as e:
             await send_error(ctx, f"Failed to unmute {member}. Error: {e}")
 
@@ -654,7 +1957,7 @@ async def purge(ctx, *args):
 
     # Case 2: purge <user> <amount>
     elif len(args) == 2 and args[1].isdigit():
-        user = find_member(ctx, args[0])
+        user = await find_member_async(ctx, args[0])
         if not user:
             return await send_error(ctx, "Could not find that user.")
         amount = int(args[1])
@@ -709,9 +2012,103 @@ def _parse_period(period_str: str) -> timedelta:
         return timedelta(days=num)
     return timedelta(hours=2)
 
+def snipe_embed(m, channel_mention: str):
+    try:
+        ts = datetime.fromisoformat(m["time"])
+    except:
+        ts = None
+    embed = discord.Embed(title="🕵️ Deleted Message", description=m["content"] or "*[no content]*", timestamp=ts, color=discord.Color.dark_red())
+    if m.get("avatar"):
+        try:
+            embed.set_author(name=m["author"], icon_url=m["avatar"])
+        except:
+            embed.set_author(name=m["author"])
+    else:
+        embed.set_author(name=m["author"])
+    embed.add_field(name="Channel", value=channel_mention, inline=True)
+    if m.get("attachments"):
+        urls = m["attachments"]
+        if len(urls) == 1:
+            embed.add_field(name="Attachment", value=urls[0], inline=False)
+            try:
+                embed.set_image(url=urls[0])
+            except:
+                pass
+        else:
+            embed.add_field(name="Attachments", value="\n".join(urls), inline=False)
+            try:
+                embed.set_image(url=urls[0])
+            except:
+                pass
+    return embed
+
+async def send_snipe(log_ch, m, channel_mention: str):
+    """Send a snipe embed, re-uploading preserved copies since CDN links of deleted messages expire."""
+    files = cached_attachment_files(m.get("attachments") or [], log_ch.guild.filesize_limit)
+    if files:
+        embed = snipe_embed(m, channel_mention)
+        embed.set_image(url=f"attachment://{files[0].filename}")
+        try:
+            return await log_ch.send(embed=embed, files=files)
+        except discord.HTTPException as e:
+            print("snipe re-upload failed:", e)
+    await log_ch.send(embed=snipe_embed(m, channel_mention))
+
 @bot.command(name="s", aliases=["snipe", "xs"])
 @commands.has_permissions(manage_messages=True)
-async def xs(ctx, period: str = "2h"):
+async def xs(ctx, period: str = "2h", *, query: str = None):
+    """xs [period] | xs search <terms> | xs user <user> | xs attachments | xs retention <days> | xs watch <channel>"""
+    mode = period.lower()
+    if mode == "watch":
+        if not ctx.author.guild_permissions.administrator:
+            return await send_error(ctx, "Only administrators can change watched channels.")
+        channel = ctx.message.channel_mentions[0] if ctx.message.channel_mentions else ctx.channel
+        watched = archive_config.setdefault(str(ctx.guild.id), {}).setdefault("watch_channels", [])
+        if channel.id in watched:
+            watched.remove(channel.id)
+            msg = f"Stopped preserving attachments in {channel.mention}."
+        else:
+            watched.append(channel.id)
+            msg = f"Attachments posted in {channel.mention} will now be preserved for snipes."
+        save_archive_config(archive_config)
+        return await send_success(ctx, "✅ Attachment Watch Updated", msg)
+
+    if mode == "retention":
+        if not ctx.author.guild_permissions.administrator:
+            return await send_error(ctx, "Only administrators can change snipe retention.")
+        if not query or not query.isdigit() or int(query) <= 0:
+            return await send_error(ctx, f"Usage: `xs retention <days>` (currently {archive_retention(ctx.guild.id)} days)")
+        archive_config.setdefault(str(ctx.guild.id), {})["retention_days"] = int(query)
+        save_archive_config(archive_config)
+        return await send_success(ctx, "✅ Snipe Retention Set", f"Deleted messages are kept for **{query}** days.")
+
+    if not log_channel_id:
+        return await send_error(ctx, "Mod log channel not set. Use `logset` first.")
+    log_ch = ctx.guild.get_channel(log_channel_id)
+    if not log_ch:
+        return await send_error(ctx, "Could not find the mod log channel.")
+
+    if mode in ("search", "user", "attachments"):
+        if mode == "search" and not query:
+            return await send_error(ctx, "Usage: `xs search <terms>`")
+        if mode == "user":
+            match = re.fullmatch(r"<@!?(\d+)>|(\d+)", (query or "").strip())
+            if match:
+                query = int(match.group(1) or match.group(2))
+            else:
+                if not query:
+                    return await send_error(ctx, "Usage: `xs user <user>`")
+                member = resolve_member(ctx.guild, query)
+                if not member:
+                    return await send_error(ctx, f"User not found: `{query}`.{did_you_mean(get_member_index(ctx.guild), query)}")
+                query = member.id
+        msgs = await search_archive(ctx.guild.id, mode, query)
+        if not msgs:
+            return await send_error(ctx, "No archived deleted messages match that.")
+        for m in msgs:
+            await send_snipe(log_ch, m, f"<#{m['channel_id']}>")
+        return await send_success(ctx, "🕵️ Archived Snipes Sent", f"Sent {len(msgs)} archived deleted messages to the mod logs.")
+
     ch_id = ctx.channel.id
     if ch_id not in deleted_messages or not deleted_messages[ch_id]:
         return await send_error(ctx, "No deleted messages recorded in this channel.")
@@ -719,65 +2116,223 @@ async def xs(ctx, period: str = "2h"):
     msgs = [m for m in deleted_messages[ch_id] if datetime.fromisoformat(m["time"]) >= cutoff]
     if not msgs:
         return await send_error(ctx, "No deleted messages in that period.")
+    to_send = msgs[-50:]
+    sent_count = 0
+    for m in to_send:
+        await send_snipe(log_ch, m, ctx.channel.mention)
+        sent_count += 1
+    await send_success(ctx, "🕵️ Sniped Messages Sent", f"Sent {sent_count} deleted messages from the last {period} to the mod logs.")
+
+# -------------------------
+# EDIT HISTORY (successive versions stored as difflib deltas)
+# -------------------------
+EDITS_PER_CHANNEL = 200     # edited messages tracked per channel
+DELTA_TOKEN_RE = re.compile(r"\S+\s*|\s+")  # edits are diffed word by word, not char by char
+DELTA_RUN = struct.Struct("<HHH")        # start, end, replacement byte length (messages are <= 4000 chars)
+edit_history = {}           # {channel_id: OrderedDict{message_id: record}}
+# record = {"author", "author_id", "avatar", "base": original text, "times": array of epoch seconds, "deltas": [bytes, ...]}
+# delta = packed (start, end, utf-8 replacement) runs turning the previous version into the next
+# (bench_edits.py reports bytes per stored edit)
+
+def make_delta(a: str, b: str):
+    ta, tb = DELTA_TOKEN_RE.findall(a), DELTA_TOKEN_RE.findall(b)
+    # most edits touch one spot, so only the middle between the shared head and tail is diffed
+    head = 0
+    while head < len(ta) and head < len(tb) and ta[head] == tb[head]:
+        head += 1
+    tail = 0
+    while tail < len(ta) - head and tail < len(tb) - head and ta[-1 - tail] == tb[-1 - tail]:
+        tail += 1
+    mid_a, mid_b = ta[head:len(ta) - tail], tb[head:len(tb) - tail]
+    offsets = [sum(map(len, ta[:head]))]
+    for tok in mid_a:
+        offsets.append(offsets[-1] + len(tok))
+    out = bytearray()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, mid_a, mid_b, autojunk=False).get_opcodes():
+        if tag != "equal":
+            replacement = "".join(mid_b[j1:j2]).encode()
+            out += DELTA_RUN.pack(offsets[i1], offsets[i2], len(replacement)) + replacement
+    return bytes(out)
+
+def apply_delta(text: str, delta: bytes):
+    out = []
+    pos = k = 0
+    while k < len(delta):
+        i1, i2, n = DELTA_RUN.unpack_from(delta, k)
+        k += DELTA_RUN.size
+        out.append(text[pos:i1])
+        out.append(delta[k:k + n].decode())
+        k += n
+        pos = i2
+    out.append(text[pos:])
+    return "".join(out)
+
+def edit_versions(record):
+    """Rebuild every version of a message, oldest first."""
+    versions = [record["base"]]
+    for delta in record["deltas"]:
+        versions.append(apply_delta(versions[-1], delta))
+    return versions
+
+def render_diff(a: str, b: str):
+    """Inline diff: removed text struck through, added text underlined."""
+    out = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+        if tag == "equal":
+            out.append(a[i1:i2])
+            continue
+        if tag in ("delete", "replace") and a[i1:i2].strip():
+            out.append(f"~~{a[i1:i2]}~~")
+        if tag in ("insert", "replace") and b[j1:j2].strip():
+            out.append(f"__{b[j1:j2]}__")
+    return "".join(out)
+
+def record_edit(ch_id: int, message_id: int, author, author_id, avatar, before: str, after: str):
+    history = edit_history.get(ch_id)
+    if history is None:
+        history = edit_history[ch_id] = OrderedDict()
+    record = history.get(message_id)
+    if record is None:
+        record = history[message_id] = {
+            "author": author, "author_id": author_id, "avatar": avatar, "base": before, "times": array("d"), "deltas": []
+        }
+        if len(history) > EDITS_PER_CHANNEL:
+            history.popitem(last=False)
+        prev = before
+    else:
+        history.move_to_end(message_id)
+        prev = edit_versions(record)[-1]
+    record["times"].append(time.time())
+    record["deltas"].append(make_delta(prev, after))
+
+@bot.event
+async def on_raw_message_edit(payload):
+    try:
+        after = payload.data.get("content")
+        if after is None or payload.guild_id is None or payload.data.get("author", {}).get("bot"):
+            return
+        store = recent_messages.get(payload.channel_id)
+        captured = store.get(payload.message_id) if store else None
+        if captured:
+            author, author_id, avatar, before = captured[:4]
+            store[payload.message_id] = (author, author_id, avatar, after, captured[4])
+        elif payload.cached_message is not None:
+            m = payload.cached_message
+            author, author_id, before = str(m.author), m.author.id, m.content or ""
+            avatar = getattr(getattr(m.author, "display_avatar", None), "url", None)
+        else:
+            return
+        if before != after:
+            record_edit(payload.channel_id, payload.message_id, author, author_id, avatar, before, after)
+    except Exception as e:
+        print("on_raw_message_edit error:", e)
+
+def edit_embed(message_id: int, record, channel_mention: str):
+    versions = edit_versions(record)
+    embed = discord.Embed(title="✏️ Edited Message", color=discord.Color.gold(), timestamp=datetime.utcfromtimestamp(record["times"][-1]))
+    if record.get("avatar"):
+        embed.set_author(name=record["author"], icon_url=record["avatar"])
+    else:
+        embed.set_author(name=record["author"])
+    parts = []
+    for n, (prev, nxt) in enumerate(zip(versions, versions[1:]), start=1):
+        parts.append(f"**Edit {n}:** {render_diff(prev, nxt) or '*[empty]*'}")
+    desc = "\n".join(parts)
+    embed.description = desc if len(desc) <= 4000 else "…" + desc[-3999:]
+    embed.add_field(name="Channel", value=channel_mention, inline=True)
+    embed.add_field(name="Message ID", value=f"`{message_id}`", inline=True)
+    return embed
+
+@bot.command(name="es", aliases=["editsnipe", "xes"])
+@commands.has_permissions(manage_messages=True)
+async def xes(ctx, period: str = "2h"):
+    history = edit_history.get(ctx.channel.id)
+    if not history:
+        return await send_error(ctx, "No edited messages recorded in this channel.")
+    cutoff = time.time() - _parse_period(period).total_seconds()
+    edited = [(mid, r) for mid, r in history.items() if r["times"][-1] >= cutoff]
+    if not edited:
+        return await send_error(ctx, "No edited messages in that period.")
     if not log_channel_id:
         return await send_error(ctx, "Mod log channel not set. Use `logset` first.")
     log_ch = ctx.guild.get_channel(log_channel_id)
     if not log_ch:
         return await send_error(ctx, "Could not find the mod log channel.")
-    to_send = msgs[-50:]
-    sent_count = 0
-    for m in to_send:
+    to_send = [edit_embed(mid, r, ctx.channel.mention) for mid, r in edited[-50:]]
+    # pack up to 10 embeds per message, within Discord's 6000 character total per message
+    batches, batch, size = [], [], 0
+    for embed in to_send:
+        n = len(embed)
+        if batch and (len(batch) == 10 or size + n > 6000):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(embed)
+        size += n
+    if batch:
+        batches.append(batch)
+    sent = 0
+    for batch in batches:
         try:
-            ts = datetime.fromisoformat(m["time"])
-        except:
-            ts = None
-        embed = discord.Embed(title="🕵️ Deleted Message", description=m["content"] or "*[no content]*", timestamp=ts, color=discord.Color.dark_red())
-        if m.get("avatar"):
-            try:
-                embed.set_author(name=m["author"], icon_url=m["avatar"])
-            except:
-                embed.set_author(name=m["author"])
-        else:
-            embed.set_author(name=m["author"])
-        embed.add_field(name="Channel", value=ctx.channel.mention, inline=True)
-        if m.get("attachments"):
-            urls = m["attachments"]
-            if len(urls) == 1:
-                embed.add_field(name="Attachment", value=urls[0], inline=False)
-                try:
-                    embed.set_image(url=urls[0])
-                except:
-                    pass
-            else:
-                embed.add_field(name="Attachments", value="\n".join(urls), inline=False)
-                try:
-                    embed.set_image(url=urls[0])
-                except:
-                    pass
-        await log_ch.send(embed=embed)
-        sent_count += 1
-    await send_success(ctx, "🕵️ Sniped Messages Sent", f"Sent {sent_count} deleted messages from the last {period} to the mod logs.")
+            await log_ch.send(embeds=batch)
+            sent += len(batch)
+        except discord.HTTPException as e:
+            print("edit snipe batch failed:", e)
+    if sent < len(to_send):
+        return await send_error(ctx, f"Sent {sent} of {len(to_send)} edited messages; the rest were rejected by Discord.")
+    await send_success(ctx, "✏️ Edit Snipes Sent", f"Sent {len(to_send)} edited messages from the last {period} to the mod logs.")
 
 # -------------------------
 # WARN SYSTEM (full embed styling, same logic)
 # -------------------------
+def record_warnings(guild, moderator, items):
+    """
+    Store warnings for [(member, reason), ...] with a single read/write of the warning file.
+    Returns [(case_id, total_warnings), ...] in the same order.
+    """
+    warnings = load_warnings()
+    guild_warns = warnings.setdefault(str(guild.id), {})
+    results = []
+    for member, reason in items:
+        user_warns = guild_warns.setdefault(str(member.id), [])
+        case_id = open_case(guild, "warn", member, moderator, reason)
+        user_warns.append({
+            "case_id": case_id,
+            "reason": reason,
+            "moderator": str(moderator),
+            "moderator_id": moderator.id,
+            "time": datetime.utcnow().isoformat()
+        })
+        results.append((case_id, len(user_warns)))
+    save_warnings(warnings)
+    return results
+
+async def warn_member(guild, member, moderator, reason: str):
+    """Record a warn, log it and DM the user. Returns (embed, dm_queued)."""
+    case_id, total = record_warnings(guild, moderator, [(member, reason)])[0]
+
+    # server embed
+    embed = make_embed(
+        "⚠️ Warn Issued",
+        f"User: {member} (`{member.id}`)\nModerator: {moderator}\nCase ID: `{case_id}`\nReason: {reason}\nTotal warns: {total}",
+        discord.Color.orange()
+    )
+    await send_log_embed(guild, "Warn Issued", embed)
+
+    # DM the user (delivery failures show up in the DM report on the log channel)
+    dm_embed = make_embed(
+        "⚠️ You Have Been Warned",
+        f"You were warned in **{guild.name}**.\n\n**Moderator:** {moderator}\n**Reason:** {reason}\n**Case ID:** `{case_id}`\n**Total Warnings:** {total}",
+        discord.Color.orange()
+    )
+    return embed, queue_dm(member, embed=dm_embed, guild=guild)
+
 @bot.command()
 @commands.has_permissions(manage_messages=True)
 async def warn(ctx, *users_and_reason: str):
     if not users_and_reason:
         return await send_error(ctx, "You must specify at least one user.")
 
-    warnings = load_warnings()
-    guild_id = str(ctx.guild.id)
-
-    potential_users = []
-    reason_parts = []
-    for arg in users_and_reason:
-        member = find_member(ctx, arg)
-        if member:
-            potential_users.append(member)
-        else:
-            reason_parts.append(arg)
+    potential_users, reason_parts = await split_targets(ctx, users_and_reason)
 
     if not potential_users:
         return await send_error(ctx, "Could not find any valid users to warn.")
@@ -785,85 +2340,169 @@ async def warn(ctx, *users_and_reason: str):
     reason = " ".join(reason_parts) if reason_parts else "No reason provided"
 
     for member in potential_users:
-        # no self-warn
-        if member.id == ctx.author.id:
-            funny = make_embed(
-                "😂 Nice Try",
-                "You can’t warn yourself, buddy. Sit down 🤡",
-                discord.Color.orange()
-            )
-            await ctx.send(embed=funny)
+        # no self-targeting, staff immunity and bot hierarchy (shared policy)
+        blocked = target_block_embed(ctx.author, member, "warn", "warned", hierarchy=False)
+        if blocked:
+            await ctx.send(embed=blocked)
             continue
 
-        # staff immunity
-        perms = member.guild_permissions
-        is_staff = (
-            perms.manage_messages
-            or perms.kick_members
-            or perms.ban_members
-            or perms.manage_roles
-            or getattr(perms, "moderate_members", False)
-        )
-        if is_staff and not ctx.author.guild_permissions.administrator:
-            immune = make_embed(
-                "🛡️ Staff Immunity",
-                f"{member.mention} is staff and cannot be warned by you.",
-                discord.Color.gold()
-            )
-            await ctx.send(embed=immune)
+        embed, dm_queued = await warn_member(ctx.guild, member, ctx.author, reason)
+        await ctx.send(embed=embed)
+        if not dm_queued:
+            await ctx.send(f"⚠️ Could not DM {member.mention}. They might have DMs disabled.")
+
+WARN_PAGE_SIZE = 5
+WARN_PAGE_TTL = 60  # seconds a rendered page stays cached in its view
+_warn_snapshot = {"mtime": None, "data": {}}
+
+def warnings_snapshot():
+    """Read-only view of the warning store, re-read from disk only when the file changes."""
+    if STORE_FILE:
+        return load_warnings()
+    try:
+        mtime = os.path.getmtime(WARN_FILE)
+    except OSError:
+        return {}
+    if _warn_snapshot["mtime"] != mtime:
+        _warn_snapshot["data"] = load_warnings()
+        _warn_snapshot["mtime"] = mtime
+    return _warn_snapshot["data"]
+
+def _warn_key(w):
+    return (w.get("time", ""), w["case_id"])
+
+def fetch_warnings_page(guild_id, user_id, before=None, limit: int = WARN_PAGE_SIZE,
+                        moderator=None, since: str = None, until: str = None):
+    """
+    Newest-first page of a user's warnings whose (time, case_id) key is below `before`.
+    Warnings are appended in time order, so the page start is found by bisect
+    instead of sorting or filtering the whole list. Returns (entries, has_more).
+    """
+    warns = warnings_snapshot().get(str(guild_id), {}).get(str(user_id), [])
+    end = len(warns) if before is None else bisect.bisect_left(warns, tuple(before), key=_warn_key)
+    page = []
+    for i in range(end - 1, -1, -1):
+        w = warns[i]
+        t = w.get("time", "")
+        if since and t < since:
+            break
+        if until and t >= until:
             continue
+        if moderator and w.get("moderator_id") != moderator.id and w.get("moderator") != str(moderator):
+            continue
+        if len(page) == limit:
+            return page, True
+        page.append(w)
+    return page, False
+
+def _parse_warn_date(value: str, end: bool = False):
+    """
+    Accept YYYY-MM-DD (or full ISO) or a relative duration like 7d; returns an ISO string.
+    With end=True a bare date means the whole day, i.e. the next midnight (exclusive).
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+        if end and len(value) == 10:
+            parsed += timedelta(days=1)
+        return parsed.isoformat()
+    except ValueError:
+        td = parse_duration(value)
+        return (datetime.utcnow() - td).isoformat() if td else None
+
+class WarningsView(discord.ui.View):
+    def __init__(self, author: discord.Member, guild_id: int, user: discord.Member, filters: dict, timeout=120):
+        super().__init__(timeout=timeout)
+        self.author = author
+        self.guild_id = guild_id
+        self.user = user
+        self.filters = filters
+        self.cursors = [None]  # keyset cursor each page starts below
+        self.page = 0
+        self.rendered = {}     # {page: (expires, embed, has_more)}
+        self.message = None
+
+    def render(self):
+        cached = self.rendered.get(self.page)
+        if cached and cached[0] > datetime.utcnow():
+            return cached[1], cached[2]
+        entries, has_more = fetch_warnings_page(self.guild_id, self.user.id, self.cursors[self.page], **self.filters)
+        embed = make_embed(f"📋 Warnings for {self.user}", None, discord.Color.orange())
+        for w in entries:
+            embed.add_field(name=f"Case `{w['case_id']}`", value=f"**Reason:** {w['reason'][:900]}\n**Moderator:** {w['moderator']}\n**Time:** {w.get('time','N/A')}", inline=False)
+        if not entries:
+            embed.description = "No warnings match these filters."
+        embed.set_footer(text=f"Page {self.page + 1}")
+        if has_more and len(self.cursors) == self.page + 1:
+            self.cursors.append(_warn_key(entries[-1]))
+        self.rendered[self.page] = (datetime.utcnow() + timedelta(seconds=WARN_PAGE_TTL), embed, has_more)
+        return embed, has_more
+
+    def refresh_buttons(self, has_more: bool):
+        self.prev_page.disabled = self.page == 0
+        self.next_page.disabled = not has_more
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
 
-        user_id = str(member.id)
-        if guild_id not in warnings:
-            warnings[guild_id] = {}
-        if user_id not in warnings[guild_id]:
-            warnings[guild_id][user_id] = []
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message("❌ Only the command invoker can use this.", ephemeral=True)
+            return False
+        return True
 
-        case_id = random.randint(1000, 9999)
-        warnings[guild_id][user_id].append({
-            "case_id": case_id,
-            "reason": reason,
-            "moderator": str(ctx.author),
-            "time": datetime.utcnow().isoformat()
-        })
-        save_warnings(warnings)
+    async def show(self, interaction: discord.Interaction):
+        embed, has_more = self.render()
+        self.refresh_buttons(has_more)
+        await interaction.response.edit_message(embed=embed, view=self)
 
-        # server embed
-        embed = make_embed(
-            "⚠️ Warn Issued",
-            f"User: {member} (`{member.id}`)\nModerator: {ctx.author}\nCase ID: `{case_id}`\nReason: {reason}\nTotal warns: {len(warnings[guild_id][user_id])}",
-            discord.Color.orange()
-        )
-        await ctx.send(embed=embed)
-        await send_log_embed(ctx.guild, "Warn Issued", embed)
+    @discord.ui.button(label="◀ Prev", style=ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: Button):
+        self.page = max(0, self.page - 1)
+        await self.show(interaction)
 
-        # DM the user
-        try:
-            dm_embed = make_embed(
-                "⚠️ You Have Been Warned",
-                f"You were warned in **{ctx.guild.name}**.\n\n**Moderator:** {ctx.author}\n**Reason:** {reason}\n**Case ID:** `{case_id}`\n**Total Warnings:** {len(warnings[guild_id][user_id])}",
-                discord.Color.orange()
-            )
-            await member.send(embed=dm_embed)
-        except Exception:
-            await ctx.send(f"⚠️ Could not DM {member.mention}. They might have DMs disabled.")
+    @discord.ui.button(label="Next ▶", style=ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        if self.page + 1 < len(self.cursors):
+            self.page += 1
+        await self.show(interaction)
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
-async def warnings(ctx, user: discord.Member):
-    warnings = load_warnings()
+async def warnings(ctx, user: discord.Member, *filters: str):
+    """xwarnings @user [mod:<user>] [from:<date|7d>] [to:<date|1d>]"""
     guild_id = str(ctx.guild.id)
     user_id = str(user.id)
 
-    if guild_id not in warnings or user_id not in warnings[guild_id] or len(warnings[guild_id][user_id]) == 0:
+    if not warnings_snapshot().get(guild_id, {}).get(user_id):
         embed = make_embed("📋 Warnings", f"{user.mention} has no warnings.", discord.Color.green())
         return await ctx.send(embed=embed)
 
-    warn_list = warnings[guild_id][user_id]
-    embed = make_embed(f"📋 Warnings for {user}", None, discord.Color.orange())
-    for w in warn_list:
-        embed.add_field(name=f"Case `{w['case_id']}`", value=f"**Reason:** {w['reason']}\n**Moderator:** {w['moderator']}\n**Time:** {w.get('time','N/A')}", inline=False)
-    await ctx.send(embed=embed)
+    opts = {}
+    for f in filters:
+        key, _, value = f.partition(":")
+        key = key.lower()
+        if key == "mod" and value:
+            opts["moderator"] = resolve_member(ctx.guild, value)
+            if not opts["moderator"]:
+                return await send_error(ctx, f"Moderator not found: `{value}`.{did_you_mean(get_member_index(ctx.guild), value)}")
+        elif key in ("from", "to") and value:
+            parsed = _parse_warn_date(value, end=key == "to")
+            if not parsed:
+                return await send_error(ctx, f"Invalid date `{value}`. Use `YYYY-MM-DD` or a period like `7d`.")
+            opts["since" if key == "from" else "until"] = parsed
+        else:
+            return await send_error(ctx, "Usage: `xwarnings @user [mod:<user>] [from:<date|7d>] [to:<date|1d>]`")
+
+    view = WarningsView(ctx.author, ctx.guild.id, user, opts)
+    embed, has_more = view.render()
+    view.refresh_buttons(has_more)
+    view.message = await ctx.send(embed=embed, view=view)
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
@@ -875,6 +2514,10 @@ async def clearwarns(ctx, user: discord.Member):
     if guild_id in warnings and user_id in warnings[guild_id]:
         warnings[guild_id][user_id] = []
         save_warnings(warnings)
+        for c in cases_by_user(ctx.guild.id, user.id):
+            if c["action"] == "warn":
+                c["cleared"] = True
+        save_cases(cases_data)
         embed = make_embed("🗑️ Cleared All Warnings", f"All warnings cleared for {user.mention}.", discord.Color.green())
         await ctx.send(embed=embed)
         await send_log_embed(ctx.guild, "Warnings Cleared", embed)
@@ -889,6 +2532,11 @@ async def clearwarn(ctx, user: discord.Member, case_id: int):
     guild_id = str(ctx.guild.id)
     user_id = str(user.id)
 
+    # numbered cases answer from the case index; legacy random ids fall through to the list scan
+    c = get_case(ctx.guild.id, case_id)
+    if c and (c["action"] != "warn" or c["user_id"] != user.id):
+        return await send_error(ctx, f"Case `#{case_id}` is not a warning for {user.mention}.")
+
     if guild_id in warnings and user_id in warnings[guild_id]:
         warn_list = warnings[guild_id][user_id]
         new_list = [w for w in warn_list if w["case_id"] != case_id]
@@ -896,6 +2544,9 @@ async def clearwarn(ctx, user: discord.Member, case_id: int):
             return await send_error(ctx, f"No warning found with Case ID `{case_id}` for {user.mention}.")
         warnings[guild_id][user_id] = new_list
         save_warnings(warnings)
+        if c:
+            c["cleared"] = True
+            save_cases(cases_data)
         embed = make_embed("🗑️ Cleared Warning", f"Cleared warning `{case_id}` for {user.mention}.", discord.Color.green())
         await ctx.send(embed=embed)
         await send_log_embed(ctx.guild, "Warning Cleared", embed)
@@ -959,11 +2610,12 @@ async def jail(ctx, user: discord.Member, time: str = None, *, reason: str = "No
     if duration_td:
         until_display = time
 
-    embed = make_embed("🚨 User Jailed", f"**{user}** has been jailed.\n**Reason:** {reason}\n**Duration:** {until_display}", discord.Color.dark_red())
+    case_id = open_case(ctx.guild, "jail", user, ctx.author, reason, until_display)
+    embed = make_embed("🚨 User Jailed", f"**{user}** has been jailed.\n**Reason:** {reason}\n**Duration:** {until_display}\n**Case:** `#{case_id}`", discord.Color.dark_red())
     embed.set_author(name=str(ctx.author), icon_url=getattr(ctx.author.display_avatar, "url", None))
     await ctx.send(embed=embed)
     # log
-    log_embed = make_embed("🚨 Jail Issued", f"User: {user} (`{user.id}`)\nModerator: {ctx.author} (`{ctx.author.id}`)\nReason: {reason}\nDuration: {until_display}", discord.Color.dark_red())
+    log_embed = make_embed("🚨 Jail Issued", f"User: {user} (`{user.id}`)\nModerator: {ctx.author} (`{ctx.author.id}`)\nReason: {reason}\nDuration: {until_display}\nCase: #{case_id}", discord.Color.dark_red())
     await send_log_embed(ctx.guild, "Jail Log", log_embed)
 
     # auto unjail
@@ -998,54 +2650,656 @@ async def unjail(ctx, user: discord.Member, *, reason: str = "No reason provided
 # -------------------------
 # ROLE TOGGLE COMMAND (xrole / xr) - embed outputs
 # -------------------------
+ROLE_JOBS_FILE = "role_jobs.json"
+ROLE_JOB_DELAY = 1.0        # seconds between member edits in a bulk job
+ROLE_JOB_CHECKPOINT = 25    # save progress / edit the progress message every N members
+RESOLVE_PREFIX_SCAN = 200   # prefix matches ranked per lookup (a slice of the sorted names)
+RESOLVE_SUGGEST_POOL = 500  # names around the query that "did you mean" compares against
+RESOLVE_SUBSTRING_MAX = 20_000  # substring matching scans every name, so larger indexes stop at prefixes
+role_index = {}      # {guild_id: ({name_lower: role_id}, sorted names)}
+member_index = {}    # {guild_id: ({name_lower: set(member_id)}, sorted names)} (username + display name)
+role_job_tasks = {}  # {guild_id: asyncio.Task} running bulk role jobs
+
+def load_role_jobs():
+    return store_load(ROLE_JOBS_FILE, {})
+
+def save_role_jobs(data):
+    store_save(ROLE_JOBS_FILE, data)
+
+role_jobs = load_role_jobs()  # {guild_id: {channel_id, add, remove, targets, done, ...}}
+
+def _index_member(index, member, add=True):
+    idx, keys = index
+    for name in {member.name.lower(), member.display_name.lower()}:
+        if add:
+            if name not in idx:
+                idx[name] = set()
+                bisect.insort(keys, name)
+            idx[name].add(member.id)
+        else:
+            ids = idx.get(name)
+            if ids:
+                ids.discard(member.id)
+                if not ids:
+                    del idx[name]
+                    del keys[bisect.bisect_left(keys, name)]
+
+def get_role_index(guild):
+    index = role_index.get(guild.id)
+    if index is None:
+        idx = {r.name.lower(): r.id for r in guild.roles if not r.is_default()}
+        index = role_index[guild.id] = (idx, sorted(idx))
+    return index
+
+def get_member_index(guild):
+    index = member_index.get(guild.id)
+    if index is None:
+        idx = {}
+        for m in guild.members:
+            for name in {m.name.lower(), m.display_name.lower()}:
+                idx.setdefault(name, set()).add(m.id)
+        index = member_index[guild.id] = (idx, sorted(idx))
+    return index
+
+def _rank_names(query: str, index):
+    """
+    Rank index keys against query: exact > prefix > substring (small indexes only).
+    Prefixes are a bisect into the sorted names; shorter names win ties since they cover more of the query.
+    """
+    names, keys = index
+    q = query.lower().strip()
+    if q in names:
+        return [q]
+    i = bisect.bisect_left(keys, q)
+    prefix = list(itertools.takewhile(lambda n: n.startswith(q), keys[i:i + RESOLVE_PREFIX_SCAN]))
+    if prefix:
+        return sorted(prefix, key=len)
+    if len(keys) > RESOLVE_SUBSTRING_MAX:
+        return []
+    return sorted((n for n in keys if q in n), key=len)
+
+def did_you_mean(index, query: str):
+    """
+    Close names for an error message, never a resolved target. Only names sorted next to the
+    query are compared, so a typo past the first letters is not suggested in big guilds.
+    """
+    q = query.lower().strip()
+    keys = index[1]
+    if len(keys) > RESOLVE_SUGGEST_POOL:
+        i = bisect.bisect_left(keys, q)
+        keys = keys[max(0, i - RESOLVE_SUGGEST_POOL // 2):i + RESOLVE_SUGGEST_POOL // 2]
+    close = difflib.get_close_matches(q, keys, n=3, cutoff=0.6)
+    return f" Did you mean {', '.join(f'`{n}`' for n in close)}?" if close else ""
+
+def resolve_role(guild, query: str):
+    """Find a role by mention, ID, or ranked name match (best first)."""
+    match = re.fullmatch(r"<@&(\d+)>|(\d+)", query.strip())
+    if match:
+        return guild.get_role(int(match.group(1) or match.group(2)))
+    index = get_role_index(guild)
+    idx = index[0]
+    for name in _rank_names(query, index):
+        role_obj = guild.get_role(idx[name])
+        if role_obj:
+            return role_obj
+    return None
+
+def resolve_member(guild, query: str):
+    """Find a member by mention, ID, or ranked username/display name match (best first)."""
+    match = re.fullmatch(r"<@!?(\d+)>|(\d+)", query.strip())
+    if match:
+        return guild.get_member(int(match.group(1) or match.group(2)))
+    index = get_member_index(guild)
+    idx = index[0]
+    for name in _rank_names(query, index):
+        for member_id in idx[name]:
+            member_obj = guild.get_member(member_id)
+            if member_obj:
+                return member_obj
+    return None
+
+@bot.event
+async def on_guild_role_create(role_obj):
+    role_index.pop(role_obj.guild.id, None)
+    invalidate_guild_perms(role_obj.guild)
+
+@bot.event
+async def on_guild_role_delete(role_obj):
+    role_index.pop(role_obj.guild.id, None)
+    invalidate_guild_perms(role_obj.guild)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if before.name != after.name:
+        role_index.pop(after.guild.id, None)
+    if before.permissions != after.permissions or before.position != after.position:
+        invalidate_guild_perms(after.guild)
+
+@bot.event
+async def on_guild_update(before, after):
+    if before.owner_id != after.owner_id:
+        invalidate_guild_perms(after)
+
+@bot.event
+async def on_member_join(member):
+    index = member_index.get(member.guild.id)
+    if index is not None:
+        _index_member(index, member)
+    index_join(member)
+    queue_welcome(member)
+    await check_raid(member)
+
+@bot.event
+async def on_member_remove(member):
+    index = member_index.get(member.guild.id)
+    if index is not None:
+        _index_member(index, member, add=False)
+    invalidate_member_perms(member)
+
+@bot.event
+async def on_raw_member_remove(payload):
+    # raw, so leaves are seen in low-memory mode where on_member_remove needs a cached member
+    joined_at = getattr(payload.user, "joined_at", None)
+    unindex_join(payload.guild_id, payload.user.id, joined_at)
+
+@bot.event
+async def on_member_update(before, after):
+    track_timeout(before, after)
+    if before.roles != after.roles:
+        invalidate_member_perms(after)
+    if before.name != after.name or before.display_name != after.display_name:
+        index = member_index.get(after.guild.id)
+        if index is not None:
+            _index_member(index, before, add=False)
+            _index_member(index, after)
+
+async def _bulk_targets(guild, target: str):
+    """Member ids for a bulk target: all, humans, bots, or a role."""
+    t = target.lower()
+    role_obj = None if t in ("all", "humans", "bots") else resolve_role(guild, target)
+    if t not in ("all", "humans", "bots") and not role_obj:
+        return None
+    if LOW_MEMORY:
+        members = [m async for m in guild.fetch_members(limit=None)]
+    else:
+        members = role_obj.members if role_obj else guild.members
+    if t == "humans":
+        return [m.id for m in members if not m.bot]
+    if t == "bots":
+        return [m.id for m in members if m.bot]
+    if role_obj and LOW_MEMORY:
+        return [m.id for m in members if role_obj in m.roles]
+    return [m.id for m in members]
+
+async def run_role_job(guild):
+    """Apply a persisted bulk role job, resuming from its last checkpoint."""
+    job = role_jobs.get(str(guild.id))
+    if not job:
+        return
+    channel = guild.get_channel(job["channel_id"])
+    add = [r for r in (guild.get_role(i) for i in job["add"]) if r]
+    remove = [r for r in (guild.get_role(i) for i in job["remove"]) if r]
+    remove_ids = {r.id for r in remove}
+    targets = job["targets"]
+    total = len(targets)
+
+    progress_msg = None
+    if channel:
+        embed = make_embed("⏳ Bulk Role Job", f"Progress: **{job['done']}/{total}**", discord.Color.blue())
+        progress_msg = await channel.send(embed=embed)
+
+    try:
+        while job["done"] < total:
+            member = guild.get_member(targets[job["done"]])
+            if member is None and LOW_MEMORY:
+                member = await fetch_member_cached(guild, str(targets[job["done"]]))
+            if member:
+                current = set(member.roles)
+                wanted = {r for r in current if r.id not in remove_ids} | set(add)
+                if wanted != current:
+                    try:
+                        await member.edit(roles=[r for r in wanted if not r.is_default()], reason=job["reason"])
+                        job["changed"] += 1
+                        await asyncio.sleep(ROLE_JOB_DELAY)
+                    except discord.HTTPException as e:
+                        job["failed"] += 1
+                        print(f"bulk role edit failed for {member.id}:", e)
+            job["done"] += 1
+            if job["done"] % ROLE_JOB_CHECKPOINT == 0:
+                save_role_jobs(role_jobs)
+                if progress_msg:
+                    embed = make_embed("⏳ Bulk Role Job", f"Progress: **{job['done']}/{total}**\nChanged: {job['changed']} • Failed: {job['failed']}", discord.Color.blue())
+                    await progress_msg.edit(embed=embed)
+    except asyncio.CancelledError:
+        save_role_jobs(role_jobs)
+        raise
+    finally:
+        role_job_tasks.pop(guild.id, None)
+
+    role_jobs.pop(str(guild.id), None)
+    save_role_jobs(role_jobs)
+    embed = make_embed("✅ Bulk Role Job Finished", f"Processed **{total}** members.\nChanged: {job['changed']} • Failed: {job['failed']}", discord.Color.green())
+    if progress_msg:
+        await progress_msg.edit(embed=embed)
+    await send_log_embed(guild, "Bulk Role Job", embed)
+
+def start_role_job(guild):
+    if guild.id not in role_job_tasks:
+        role_job_tasks[guild.id] = asyncio.create_task(run_role_job(guild))
+
+def resume_role_jobs():
+    for guild_id in list(role_jobs):
+        guild = bot.get_guild(int(guild_id))
+        if guild:
+            start_role_job(guild)
+
+async def bulk_role(ctx, target: str, changes):
+    if str(ctx.guild.id) in role_jobs:
+        return await send_error(ctx, "A bulk role job is already running here. Use `xrolejob cancel` to stop it.")
+    targets = await _bulk_targets(ctx.guild, target)
+    if targets is None:
+        return await send_error(ctx, "Bulk target must be `all`, `humans`, `bots` or a role.")
+
+    add, remove = [], []
+    for sign, name in changes:
+        role_obj = resolve_role(ctx.guild, name)
+        if not role_obj:
+            return await send_error(ctx, f"Role not found: `{name}`.{did_you_mean(get_role_index(ctx.guild), name)}")
+        if role_obj >= ctx.guild.me.top_role:
+            return await send_error(ctx, f"I cannot manage **{role_obj.name}** because it is higher than or equal to my top role.")
+        (add if sign == "+" else remove).append(role_obj.id)
+
+    role_jobs[str(ctx.guild.id)] = {
+        "channel_id": ctx.channel.id,
+        "add": add,
+        "remove": remove,
+        "targets": targets,
+        "done": 0,
+        "changed": 0,
+        "failed": 0,
+        "reason": f"Bulk role job by {ctx.author}",
+    }
+    save_role_jobs(role_jobs)
+    start_role_job(ctx.guild)
+
+async def toggle_role(guild, member_obj, role_obj):
+    """Add the role if missing, remove it otherwise; logs and returns the embed."""
+    if role_obj in member_obj.roles:
+        await member_obj.remove_roles(role_obj)
+        embed = make_embed("❌ Role Removed", f"Removed **{role_obj.name}** from {member_obj.mention}.", discord.Color.red())
+        await send_log_embed(guild, "Role Removed", embed)
+    else:
+        await member_obj.add_roles(role_obj)
+        embed = make_embed("✅ Role Added", f"Added **{role_obj.name}** to {member_obj.mention}.", discord.Color.green())
+        await send_log_embed(guild, "Role Added", embed)
+    return embed
+
 @bot.command(aliases=["r", "xr"])
 @commands.has_permissions(manage_roles=True)
 async def role(ctx, user: str, *, role: str):
-    # Find member by ID or partial name
-    member_obj = None
-    if user.isdigit():
-        member_obj = ctx.guild.get_member(int(user))
-    else:
-        user_lower = user.lower()
-        for m in ctx.guild.members:
-            if user_lower in m.name.lower() or user_lower in getattr(m, "display_name", "").lower():
-                member_obj = m
-                break
+    # Bulk mode: xrole all|humans|bots|@role +Role -Role
+    changes = re.findall(r"([+-])\s*(.+?)(?=\s+[+-]|$)", role.strip())
+    if changes and role.strip()[0] in "+-":
+        return await bulk_role(ctx, user, changes)
+
+    # Find member by ID, mention or ranked name match
+    member_obj = resolve_member(ctx.guild, user)
+    if not member_obj and LOW_MEMORY:
+        member_obj = await fetch_member_cached(ctx.guild, user)
 
     if not member_obj:
-        return await send_error(ctx, "User not found. Use the user ID or part of their username/display name.")
+        return await send_error(ctx, "User not found. Use the user ID or part of their username/display name."
+                                     + did_you_mean(get_member_index(ctx.guild), user))
 
-    # Find role by ID or partial name
-    role_obj = None
-    if role.isdigit():
-        role_obj = ctx.guild.get_role(int(role))
-    else:
-        role_lower = role.lower()
-        for r in ctx.guild.roles:
-            if role_lower in r.name.lower():
-                role_obj = r
-                break
+    # Find role by ID, mention or ranked name match
+    role_obj = resolve_role(ctx.guild, role)
 
     if not role_obj:
-        return await send_error(ctx, "Role not found. Use the role ID, exact name, or part of the role name.")
+        return await send_error(ctx, "Role not found. Use the role ID, exact name, or part of the role name."
+                                     + did_you_mean(get_role_index(ctx.guild), role))
+
+    # Check hierarchy
+    if role_obj >= ctx.guild.me.top_role:
+        return await send_error(ctx, "I cannot manage that role because it is higher than or equal to my top role.")
+
+    try:
+        embed = await toggle_role(ctx.guild, member_obj, role_obj)
+        await ctx.send(embed=embed)
+    except Exception as e:
+        return await send_error(ctx, f"Failed to toggle role. Error: {e}")
+
+@bot.command()
+@commands.has_permissions(manage_roles=True)
+async def rolejob(ctx, action: str = "status"):
+    job = role_jobs.get(str(ctx.guild.id))
+    if not job:
+        return await send_error(ctx, "No bulk role job is running in this server.")
+    if action.lower() == "cancel":
+        task = role_job_tasks.get(ctx.guild.id)
+        if task:
+            task.cancel()
+        role_jobs.pop(str(ctx.guild.id), None)
+        save_role_jobs(role_jobs)
+        return await send_success(ctx, "🛑 Bulk Role Job Cancelled", f"Stopped after **{job['done']}/{len(job['targets'])}** members.")
+    embed = make_embed("⏳ Bulk Role Job", f"Progress: **{job['done']}/{len(job['targets'])}**\nChanged: {job['changed']} • Failed: {job['failed']}", discord.Color.blue())
+    await ctx.send(embed=embed)
+
+# -------------------------
+# JOIN INDEX (join times sorted per guild for bisect; backs xprunejoins)
+# -------------------------
+PRUNE_DELAY = 1.0     # seconds between kicks/jails in a prune
+PRUNE_ACTIONS = {"kick": "kick_members", "ban": "ban_members", "jail": "manage_roles"}
+join_index = {}       # {guild_id: (array("d") joined_at timestamps, array("Q") member ids)}, sorted by time
+
+def get_join_index(guild):
+    """Built once from the member cache, then kept current by join/leave events."""
+    idx = join_index.get(guild.id)
+    if idx is None:
+        pairs = sorted((m.joined_at.timestamp(), m.id) for m in guild.members if m.joined_at)
+        idx = join_index[guild.id] = (array("d", [t for t, _ in pairs]), array("Q", [i for _, i in pairs]))
+    return idx
+
+def index_join(member):
+    if not member.joined_at:
+        return
+    fresh = member.guild.id not in join_index
+    ts, ids = get_join_index(member.guild)
+    if fresh and member.guild.get_member(member.id):
+        return  # the cache build already included them
+    t = member.joined_at.timestamp()
+    i = bisect.bisect_right(ts, t)  # joins arrive in order, so this is almost always the tail
+    ts.insert(i, t)
+    ids.insert(i, member.id)
+
+def unindex_join(guild_id: int, user_id: int, joined_at=None):
+    idx = join_index.get(guild_id)
+    if idx is None:
+        return
+    ts, ids = idx
+    if joined_at:
+        t = joined_at.timestamp()
+        i = bisect.bisect_left(ts, t)
+        while i < len(ts) and ts[i] == t:
+            if ids[i] == user_id:
+                del ts[i]
+                del ids[i]
+                return
+            i += 1
+    if user_id in ids:
+        i = ids.index(user_id)
+        del ts[i]
+        del ids[i]
+
+def recent_joins(guild, period: timedelta):
+    """Member ids that joined within `period`, oldest first."""
+    ts, ids = get_join_index(guild)
+    since = (discord.utils.utcnow() - period).timestamp()
+    return ids[bisect.bisect_left(ts, since):].tolist()
+
+@bot.command()
+@commands.has_permissions(kick_members=True)
+async def prunejoins(ctx, period: str = None, action: str = "kick", *, reason: str = None):
+    """xprunejoins 10m [kick|ban|jail] [reason]"""
+    td = parse_duration(period) if period else None
+    action = action.lower()
+    if not td or action not in PRUNE_ACTIONS:
+        return await send_error(ctx, "Usage: `xprunejoins <period> [kick|ban|jail] [reason]` e.g. `xprunejoins 10m ban`")
+    if not getattr(ctx.author.guild_permissions, PRUNE_ACTIONS[action]):
+        return await send_error(ctx, f"You need the `{PRUNE_ACTIONS[action]}` permission to {action}.")
+    jail_role = ctx.guild.get_role(jail_role_id) if jail_role_id else None
+    if action == "jail" and not jail_role:
+        return await send_error(ctx, "Set a jail role with `xjailrole` first.")
+
+    targets = []   # BanTargets, so kick/ban work on ids when members aren't cached
+    jail_members = {}
+    for uid in recent_joins(ctx.guild, td):
+        if uid in (ctx.author.id, bot.user.id):
+            continue
+        member = ctx.guild.get_member(uid)
+        if member is None and LOW_MEMORY:
+            # only fetched for the staff check and for jail's role add
+            member = await fetch_member_cached(ctx.guild, str(uid))
+        if not member or is_staff(member):
+            continue
+        targets.append(BanTarget(uid, str(member)))
+        jail_members[uid] = member
+    if not targets:
+        return await send_error(ctx, f"Nobody (non-staff) joined in the last **{period}**.")
+
+    reason = reason or f"Prune of joins in the last {period} by {ctx.author}"
+    confirm_message = await ctx.send(
+        f"⚠️ {ctx.author.mention}, this will **{action}** **{len(targets)}** members who joined in the last **{period}**. Type `confirm` to proceed."
+    )
+
+    def check(m):
+        return m.author == ctx.author and m.channel == ctx.channel and m.content.lower() == "confirm"
+
+    try:
+        await bot.wait_for("message", timeout=15, check=check)
+    except asyncio.TimeoutError:
+        return await confirm_message.edit(content="❌ Prune cancelled (no confirmation).")
+
+    if action == "ban":
+        # ban goes through the persisted bulk-ban job (200 ids per call)
+        if await queue_ban_job(ctx, [[t.id, t.name] for t in targets], reason):
+            await send_success(ctx, "🔨 Prune Queued", f"Banning **{len(targets)}** recent joins. Track it with `xbans status`.")
+        return
+
+    done = failed = 0
+    progress_msg = await ctx.send(embed=make_embed("⏳ Pruning Joins", f"Progress: **0/{len(targets)}**", discord.Color.blue()))
+    for target in targets:
+        try:
+            with rest_priority("mod"):
+                if action == "kick":
+                    await ctx.guild.kick(target, reason=reason)
+                else:
+                    await jail_members[target.id].add_roles(jail_role, reason=reason)
+            open_case(ctx.guild, action, target, ctx.author, reason, save=False)
+            done += 1
+        except discord.HTTPException as e:
+            failed += 1
+            print(f"prune {action} failed for {target.id}:", e)
+        if (done + failed) % 25 == 0:
+            await progress_msg.edit(embed=make_embed("⏳ Pruning Joins", f"Progress: **{done + failed}/{len(targets)}**", discord.Color.blue()))
+        await asyncio.sleep(PRUNE_DELAY)
+    save_cases(cases_data)
+
+    embed = make_embed(
+        "✅ Joins Pruned",
+        f"**Action:** {action}\n**Window:** last {period}\n**Done:** {done} • **Failed:** {failed}\n**Moderator:** {ctx.author}\n**Reason:** {reason}",
+        discord.Color.green()
+    )
+    await progress_msg.edit(embed=embed)
+    await send_log_embed(ctx.guild, "Join Prune", embed)
+
+# -------------------------
+# RAID DETECTION (sliding-window join rate + account heuristics)
+# -------------------------
+RAID_CONFIG_FILE = "raid_config.json"
+RAID_DEFAULTS = {
+    "enabled": True,
+    "joins": 10,           # joins within `window` seconds that trip raid mode
+    "window": 10,
+    "min_age_days": 7,     # accounts younger than this with no avatar are suspicious
+    "action": "alert",     # comma list of: alert, timeout, ban, lockdown
+    "timeout": "1h",
+    "raid_minutes": 10,    # how long raid mode stays on after the last trip
+}
+NAME_SKELETON_RE = re.compile(r"[\d_.\-\s]+")
+
+def load_raid_config():
+    return store_load(RAID_CONFIG_FILE, {})
+
+def save_raid_config(data):
+    store_save(RAID_CONFIG_FILE, data)
+
+raid_config = load_raid_config()  # {guild_id: {...RAID_DEFAULTS overrides, "prev_verification": int}}
+raid_state = {}  # {guild_id: {"joins": deque, "names": deque, "name_counts": dict, "suspects": deque of (t, member), "until": float}}
+
+def get_raid_config(guild_id):
+    cfg = dict(RAID_DEFAULTS)
+    cfg.update(raid_config.get(str(guild_id), {}))
+    return cfg
+
+def detect_join(member, cfg):
+    """
+    Record a join and classify it without awaiting anything.
+    Window counters are deques trimmed from the left, so each join is amortized O(1).
+    Returns (tripped, suspicious).
+    """
+    now = time.monotonic()
+    st = raid_state.get(member.guild.id)
+    if st is None:
+        st = raid_state[member.guild.id] = {
+            "joins": deque(), "names": deque(), "name_counts": {}, "suspects": deque(maxlen=200), "until": 0.0
+        }
+    cutoff = now - cfg["window"]
+    joins, names, counts, suspects = st["joins"], st["names"], st["name_counts"], st["suspects"]
+    while joins and joins[0] < cutoff:
+        joins.popleft()
+    while suspects and suspects[0][0] < cutoff:
+        suspects.popleft()
+    while names and names[0][0] < cutoff:
+        skel = names.popleft()[1]
+        counts[skel] -= 1
+        if not counts[skel]:
+            del counts[skel]
+
+    joins.append(now)
+    skel = NAME_SKELETON_RE.sub("", member.name.lower())
+    names.append((now, skel))
+    counts[skel] = counts.get(skel, 0) + 1
+
+    age = discord.utils.utcnow() - member.created_at
+    # a default avatar alone is common on real accounts, so it only counts on young ones
+    suspicious = (
+        (age < timedelta(days=cfg["min_age_days"]) and member.avatar is None)
+        or (len(skel) >= 3 and counts[skel] >= 3)
+    )
+    if suspicious:
+        suspects.append((now, member))  # the object, since low-memory mode doesn't cache joins
+
+    tripped = len(joins) >= cfg["joins"] and now >= st["until"]
+    if len(joins) >= cfg["joins"]:
+        st["until"] = now + cfg["raid_minutes"] * 60
+    return tripped, suspicious
+
+def in_raid_mode(guild_id):
+    st = raid_state.get(guild_id)
+    return bool(st) and time.monotonic() < st["until"]
+
+async def raid_action(guild, members, cfg):
+    actions = {a.strip() for a in cfg["action"].split(",")}
+    if "ban" in actions:
+        # one bulk-ban call per 200 suspects instead of a ban per member
+        for i in range(0, len(members), BULK_BAN_SIZE):
+            batch = [BanTarget(m.id, str(m)) for m in members[i:i + BULK_BAN_SIZE]]
+            await bulk_ban_ids(guild, batch, guild.me, "Raid detection: suspicious join")
+        return
+    if "timeout" not in actions:
+        return
+    duration_td = parse_duration(cfg["timeout"]) or timedelta(hours=1)
+    for member in members:
+        try:
+            await timeout_member(guild, member, duration_td, cfg["timeout"], "Raid detection: suspicious join", guild.me, save=False)
+        except Exception as e:
+            print(f"raid timeout failed for {member.id}:", e)
+    save_cases(cases_data)
+
+async def start_raid(guild, cfg):
+    actions = {a.strip() for a in cfg["action"].split(",")}
+    st = raid_state[guild.id]
+    suspects = [m for _, m in st["suspects"]]
+    st["suspects"].clear()
+
+    locked = False
+    if "lockdown" in actions and guild.verification_level != discord.VerificationLevel.highest:
+        try:
+            raid_config.setdefault(str(guild.id), {})["prev_verification"] = guild.verification_level.value
+            save_raid_config(raid_config)
+            await guild.edit(verification_level=discord.VerificationLevel.highest, reason="Raid detected")
+            locked = True
+        except Exception as e:
+            print("raid lockdown failed:", e)
+
+    embed = make_embed(
+        "🚨 Raid Detected",
+        f"**{cfg['joins']}+** joins within **{cfg['window']}s**.\n"
+        f"**Suspicious accounts:** {len(suspects)}\n"
+        f"**Actions:** {', '.join(sorted(actions))}\n"
+        f"**Verification lockdown:** {'on' if locked else 'off'}\n"
+        f"Use `xraidoff` to end raid mode.",
+        discord.Color.dark_red()
+    )
+    if "alert" in actions:
+        await send_log_embed(guild, "Raid Alert", embed)
+    await raid_action(guild, suspects, cfg)
+
+async def end_raid(guild):
+    st = raid_state.get(guild.id)
+    if st:
+        st["until"] = 0.0
+        st["suspects"].clear()
+    prev = raid_config.get(str(guild.id), {}).pop("prev_verification", None)
+    if prev is not None:
+        save_raid_config(raid_config)
+        await guild.edit(verification_level=discord.VerificationLevel(prev), reason="Raid mode ended")
+
+async def check_raid(member):
+    cfg = get_raid_config(member.guild.id)
+    if not cfg["enabled"] or member.bot:
+        return
+    tripped, suspicious = detect_join(member, cfg)
+    if tripped:
+        spawn(start_raid(member.guild, cfg))
+    elif suspicious and in_raid_mode(member.guild.id):
+        raid_state[member.guild.id]["suspects"].clear()
+        spawn(raid_action(member.guild, [member], cfg))
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def raidset(ctx, key: str = None, value: str = None):
+    """xraidset [enabled|joins|window|age|action|timeout|minutes] [value]"""
+    keys = {"enabled": "enabled", "joins": "joins", "window": "window", "age": "min_age_days",
+            "action": "action", "timeout": "timeout", "minutes": "raid_minutes"}
+    if not key:
+        cfg = get_raid_config(ctx.guild.id)
+        desc = "\n".join(f"**{k}:** {cfg[v]}" for k, v in keys.items())
+        return await ctx.send(embed=make_embed("🛡️ Raid Detection Settings", desc, discord.Color.blue()))
+    field = keys.get(key.lower())
+    if not field or value is None:
+        return await send_error(ctx, f"Usage: `xraidset [{'|'.join(keys)}] [value]`")
+
+    if field == "enabled":
+        parsed = value.lower() in ("on", "true", "yes", "1")
+    elif field == "action":
+        parsed = value.lower()
+        if not set(parsed.split(",")) <= {"alert", "timeout", "ban", "lockdown"}:
+            return await send_error(ctx, "Action must be a comma list of `alert`, `timeout`, `ban`, `lockdown`.")
+    elif field == "timeout":
+        if not parse_duration(value):
+            return await send_error(ctx, "Invalid timeout. Use formats like `10m`, `1h`, `1d`.")
+        parsed = value
+    else:
+        if not value.isdigit() or int(value) <= 0:
+            return await send_error(ctx, f"`{key}` must be a positive number.")
+        parsed = int(value)
 
-    # Check hierarchy
-    if role_obj >= ctx.guild.me.top_role:
-        return await send_error(ctx, "I cannot manage that role because it is higher than or equal to my top role.")
+    raid_config.setdefault(str(ctx.guild.id), {})[field] = parsed
+    save_raid_config(raid_config)
+    await send_success(ctx, "✅ Raid Setting Updated", f"**{key}** set to **{parsed}**")
 
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def raidoff(ctx):
     try:
-        if role_obj in member_obj.roles:
-            await member_obj.remove_roles(role_obj)
-            embed = make_embed("❌ Role Removed", f"Removed **{role_obj.name}** from {member_obj.mention}.", discord.Color.red())
-            await ctx.send(embed=embed)
-            await send_log_embed(ctx.guild, "Role Removed", embed)
-        else:
-            await member_obj.add_roles(role_obj)
-            embed = make_embed("✅ Role Added", f"Added **{role_obj.name}** to {member_obj.mention}.", discord.Color.green())
-            await ctx.send(embed=embed)
-            await send_log_embed(ctx.guild, "Role Added", embed)
+        await end_raid(ctx.guild)
     except Exception as e:
-        return await send_error(ctx, f"Failed to toggle role. Error: {e}")
+        return await send_error(ctx, f"Failed to restore verification level. Error: {e}")
+    embed = make_embed("✅ Raid Mode Ended", f"Raid mode ended by {ctx.author.mention}.", discord.Color.green())
+    await ctx.send(embed=embed)
+    await send_log_embed(ctx.guild, "Raid Ended", embed)
+
 # say cmd
 # Custom dropdown for choosing colors
 class ColorSelect(discord.ui.Select):
@@ -1158,23 +3412,23 @@ async def suicide(ctx):
 async def dm(ctx, user: str, *, content: str):
     await ctx.message.delete()  # delete the command message
 
-    member = find_member(ctx, user)  # works with mention, ID, or username
+    member = await find_member_async(ctx, user)  # works with mention, ID, or username
     if not member:
         return await ctx.send("❌ Failed to dm (User not found)", delete_after=5)
 
-    try:
-        embed = discord.Embed(
-            title="📩 You Have a New Message",
-            description=content,
-            color=discord.Color.blurple()
-        )
-        embed.set_footer(text=f"Sent from {ctx.guild.name}")
-        await member.send(embed=embed)
-
-        await ctx.send("✅ User dmed", delete_after=5)
+    embed = discord.Embed(
+        title="📩 You Have a New Message",
+        description=content,
+        color=discord.Color.blurple()
+    )
+    embed.set_footer(text=f"Sent from {ctx.guild.name}")
 
-    except Exception as e:
-        await ctx.send("❌ Failed to dm", delete_after=5)
+    if dm_is_closed(member.id):
+        return await ctx.send("❌ Failed to dm (DMs closed)", delete_after=5)
+    if queue_dm(member, embed=embed, guild=ctx.guild):
+        await ctx.send("✅ DM queued, delivery is reported in the log channel", delete_after=5)
+    else:
+        await ctx.send("❌ Failed to dm (DM queue is full, try again shortly)", delete_after=5)
 
 #help
 @bot.command()
@@ -1185,7 +3439,7 @@ async def help(ctx):
         color=discord.Color.blurple()
     )
     
-    # Moderation commands
+    # Moderation commands (Discord caps each field at 1024 characters, so these are split up)
     embed.add_field(
         name="🛠️ Moderation",
         value=(
@@ -1193,15 +3447,42 @@ async def help(ctx):
             "`xunban [user]` - Unban a user\n"
             "`xkick [user] [reason]` - Kick a user\n"
             "`xmute [user] [time] [reason]` - Mute a user\n"
-            "`xunmute [user]` - Unmute a user\n"
+            "`xunmute [user|all]` - Unmute a user, or everyone muted\n"
+            "`xmutes` - List active mutes by expiry\n"
             "`xwarn [user] [reason]` - Warn a user\n"
+            "`xclearwarn [user] [case number]` - Clears a warning\n"
+            "`xwarnings [user] [mod:user] [from:date] [to:date]` - Checks warnings of user\n"
+            "`xjail [user] [period] [reason]` - Jails a user for a period\n"
             "`xrole [user] [role]` - Toggle role for user\n"
-            "`xpurge [user] [number]` - Purges a user's number of messages\n"
-            "`xpurgeset [channel]` - Sets a channel to log purged messages\n"
+            "`xrole [all|humans|bots|role] +Role -Role` - Bulk add/remove roles\n"
+            "`xpurge [user] [number]` - Purges a user's number of messages"
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="🚨 Raids & Bulk Actions",
+        value=(
+            "`xbulkban [ids...] [reason]` - Ban many ids at once (works on users who left)\n"
+            "`xprunejoins [period] [kick|ban|jail]` - Act on everyone who joined recently\n"
+            "`xbans [export|import|sync <server id>|status|cancel]` - Ban list tools\n"
+            "`xlockdown [all|category]` - Lock channels for @everyone\n"
+            "`xunlock [all|category]` - Restore permissions saved by xlockdown\n"
+            "`xraidset [setting] [value]` - Configure raid detection\n"
+            "`xraidoff` - End raid mode\n"
+            "`xantispam [on|off]` - Toggle anti-spam\n"
+            "`xautomod [list|add|remove|regex|invites|action] [value]` - Configure automod"
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="📋 Logs & Cases",
+        value=(
             "`xlogset [channel]` - Sets a log channel\n"
-            "`xjail [user] [period] [reason]` - Jails a user for a period\n"
-            "`xclearwarn [user] [case number]` - Clears a warning\n"
-            "`xwarnings [user]` - Checks warnings of user"
+            "`xpurgeset [channel]` - Sets a channel to log purged messages\n"
+            "`xcase [number]` - Shows a moderation case\n"
+            "`xcases [moderator]` - Lists cases handled by a moderator"
         ),
         inline=False
     )
@@ -1213,6 +3494,9 @@ async def help(ctx):
             "`xnuke` - Nukes a channel\n"
             "`xrevivechat` - Auto revive chat\n"
             "`xs [period]` - Snipe last deleted messages\n"
+            "`xs [search|user|attachments] [query]` - Search archived deleted messages\n"
+            "`xs watch [channel]` - Preserve attachments in a channel for snipes\n"
+            "`xes [period]` - Snipe message edit history\n"
             "`xhelp` - Show this help menu\n"
             "`xinfo` - Get info about a user\n"
             "`xsuggest [idea]` - Suggest an idea for the bot to get it dmed to the creator!\n"
@@ -1220,7 +3504,13 @@ async def help(ctx):
             "`xtz` - Displays your timezone\n"
             "`xremind [period] [what to remind of]` - Reminds you of something\n"
             "`xtimer [time]` - Counts down a set time\n"
-            "`xserverstats` - Stats of server"
+            "`xrank [user]` - Level and XP\n"
+            "`xwelcome [#channel|off] [message]` - Welcome cards for new members\n"
+            "`xleaderboard` - Top members by XP\n"
+            "`xserverstats` - Stats of server\n"
+            "`xactivity [#channel] [period]` - Message volume and unique chatters\n"
+            "`xclusters` - Shard/cluster status\n"
+            "`xrest` - Outbound request queue wait times"
         ),
         inline=False
     )
@@ -1236,6 +3526,12 @@ async def help(ctx):
         inline=False
     )
 
+    embed.add_field(
+        name="⚡ Slash Commands",
+        value="`/ban` `/kick` `/mute` `/unmute` `/warn` `/warnings` `/case` `/role` `/info`",
+        inline=False
+    )
+
     embed.set_footer(
         text=f"Requested by {ctx.author}", 
         icon_url=getattr(ctx.author.display_avatar, "url", None)
@@ -1244,10 +3540,7 @@ async def help(ctx):
     embed.set_thumbnail(url=bot.user.display_avatar.url)
     await ctx.send(embed=embed)
 # ====== xinfo command ======
-@bot.command()
-async def info(ctx, user: discord.Member = None):
-    """Shows info about a user or the author if no user is mentioned."""
-    user = user or ctx.author
+def info_embed(user, requester):
     embed = discord.Embed(
         title=f"ℹ️ User Info - {user}",
         color=discord.Color.blue()
@@ -1258,8 +3551,13 @@ async def info(ctx, user: discord.Member = None):
     embed.add_field(name="Bot?", value=user.bot, inline=True)
     embed.add_field(name="Account Created", value=user.created_at.strftime("%d %b %Y"), inline=False)
     embed.add_field(name="Joined Server", value=user.joined_at.strftime("%d %b %Y"), inline=False)
-    embed.set_footer(text=f"Requested by {ctx.author}", icon_url=ctx.author.display_avatar.url)
-    await ctx.send(embed=embed)
+    embed.set_footer(text=f"Requested by {requester}", icon_url=requester.display_avatar.url)
+    return embed
+
+@bot.command()
+async def info(ctx, user: discord.Member = None):
+    """Shows info about a user or the author if no user is mentioned."""
+    await ctx.send(embed=info_embed(user or ctx.author, ctx.author))
 
 
 # ====== xjoke command ======
@@ -1416,7 +3714,199 @@ async def suggest(ctx, *, idea: str = None):
         )
         await ctx.send(embed=error)
 
+# -------------------------
+# LOCKDOWN (snapshot @everyone overwrites, edit channels concurrently, exact rollback)
+# -------------------------
+LOCKDOWN_FILE = "lockdowns.json"
+LOCKDOWN_CONCURRENCY = 10   # channel edits in flight; each channel is its own rate-limit bucket
+LOCKDOWN_DENY = dict(
+    send_messages=False, send_messages_in_threads=False, create_public_threads=False,
+    create_private_threads=False, add_reactions=False, connect=False, speak=False,
+)
+
+def load_lockdowns():
+    return store_load(LOCKDOWN_FILE, {})
+
+def save_lockdowns(data):
+    store_save(LOCKDOWN_FILE, data)
+
+lockdowns = load_lockdowns()  # {guild_id: {channel_id: [allow, deny] | None}} prior @everyone overwrite
+
+def lockdown_scope(guild, scope: str):
+    """Channels for `all` or a category (mention, ID or name); None if the category isn't found."""
+    channels = [c for c in guild.channels if not isinstance(c, discord.CategoryChannel)]
+    if scope.lower() == "all":
+        return channels
+    match = re.fullmatch(r"<#(\d+)>|(\d+)", scope.strip())
+    if match:
+        category = guild.get_channel(int(match.group(1) or match.group(2)))
+    else:
+        category = discord.utils.find(lambda c: c.name.lower() == scope.lower(), guild.categories)
+    if not isinstance(category, discord.CategoryChannel):
+        return None
+    return [c for c in channels if c.category_id == category.id]
+
+async def _edit_overwrites(channels, make_overwrite, reason: str):
+    """Apply make_overwrite(channel) to @everyone on every channel concurrently. Returns (done, failed)."""
+    sem = asyncio.Semaphore(LOCKDOWN_CONCURRENCY)
+    done, failed = [], []
+
+    async def edit(channel):
+        async with sem:
+            try:
+                with rest_priority("mod"):
+                    await channel.set_permissions(channel.guild.default_role, overwrite=make_overwrite(channel), reason=reason)
+                done.append(channel.id)
+            except discord.HTTPException as e:
+                failed.append(channel.id)
+                print(f"lockdown edit failed for {channel.id}:", e)
+
+    await asyncio.gather(*(edit(c) for c in channels))
+    return done, failed
+
+async def lock_channels(guild, channels, reason: str):
+    snap = lockdowns.setdefault(str(guild.id), {})
+    targets = [c for c in channels if str(c.id) not in snap]  # already locked keeps its first snapshot
+    for c in targets:
+        ow = c.overwrites_for(guild.default_role)
+        snap[str(c.id)] = None if ow.is_empty() else [v.value for v in ow.pair()]
+    save_lockdowns(lockdowns)  # snapshot first so a crash mid-way can still be rolled back
+
+    def locked(channel):
+        ow = channel.overwrites_for(guild.default_role)
+        ow.update(**LOCKDOWN_DENY)
+        return ow
+
+    done, failed = await _edit_overwrites(targets, locked, reason)
+    for channel_id in failed:
+        snap.pop(str(channel_id), None)
+    if not snap:
+        lockdowns.pop(str(guild.id), None)
+    save_lockdowns(lockdowns)
+    return done, failed
+
+async def unlock_channels(guild, channels, reason: str):
+    snap = lockdowns.get(str(guild.id), {})
+    targets = [c for c in channels if str(c.id) in snap]
+
+    def restored(channel):
+        prior = snap[str(channel.id)]
+        if prior is None:
+            return None
+        return discord.PermissionOverwrite.from_pair(discord.Permissions(prior[0]), discord.Permissions(prior[1]))
+
+    done, failed = await _edit_overwrites(targets, restored, reason)
+    for channel_id in done:
+        snap.pop(str(channel_id), None)
+    if not snap:
+        lockdowns.pop(str(guild.id), None)
+    save_lockdowns(lockdowns)
+    return done, failed
+
+@bot.command()
+@commands.has_permissions(manage_channels=True)
+async def lockdown(ctx, *, scope: str = "all"):
+    """xlockdown [all|category]"""
+    channels = lockdown_scope(ctx.guild, scope)
+    if channels is None:
+        return await send_error(ctx, f"Category not found: `{scope}`")
+    started = time.monotonic()
+    done, failed = await lock_channels(ctx.guild, channels, f"Lockdown by {ctx.author}")
+    took = time.monotonic() - started
+    skipped = len(channels) - len(done) - len(failed)
+    embed = make_embed(
+        "🔒 Lockdown",
+        f"**Scope:** {scope}\n**Locked:** {len(done)} • **Failed:** {len(failed)} • **Already locked:** {skipped}\n"
+        f"**Took:** {took:.1f}s\n**Moderator:** {ctx.author}\nUse `xunlock` to restore the previous permissions.",
+        discord.Color.dark_red()
+    )
+    await ctx.send(embed=embed)
+    await send_log_embed(ctx.guild, "Lockdown", embed)
+
+@bot.command()
+@commands.has_permissions(manage_channels=True)
+async def unlock(ctx, *, scope: str = "all"):
+    """xunlock [all|category] — restores the exact overwrites saved by xlockdown"""
+    if str(ctx.guild.id) not in lockdowns:
+        return await send_error(ctx, "No channels are locked in this server.")
+    channels = lockdown_scope(ctx.guild, scope)
+    if channels is None:
+        return await send_error(ctx, f"Category not found: `{scope}`")
+    started = time.monotonic()
+    done, failed = await unlock_channels(ctx.guild, channels, f"Unlock by {ctx.author}")
+    took = time.monotonic() - started
+    embed = make_embed(
+        "🔓 Unlocked",
+        f"**Scope:** {scope}\n**Restored:** {len(done)} • **Failed:** {len(failed)}\n"
+        f"**Took:** {took:.1f}s\n**Moderator:** {ctx.author}",
+        discord.Color.green()
+    )
+    await ctx.send(embed=embed)
+    await send_log_embed(ctx.guild, "Unlock", embed)
+
 # nuke cmd
+def remap_channel_id(guild, old_id: int, new_id: int):
+    """
+    Point every stored reference to old_id at new_id.
+    Runs without awaiting, so no command can observe a half-remapped config.
+    """
+    global log_channel_id, jail_channel_id
+    if log_channel_id == old_id:
+        log_channel_id = new_id
+    if jail_channel_id == old_id:
+        jail_channel_id = new_id
+    if purge_channels.get(guild.id) == old_id:
+        purge_channels[guild.id] = new_id
+    if old_id in deleted_messages:
+        deleted_messages[new_id] = deleted_messages.pop(old_id)
+    job = role_jobs.get(str(guild.id))
+    if job and job["channel_id"] == old_id:
+        job["channel_id"] = new_id
+        save_role_jobs(role_jobs)
+    cfg = welcome_config.get(str(guild.id))
+    if cfg and cfg["channel"] == old_id:
+        cfg["channel"] = new_id
+        save_welcome(welcome_config)
+    snap = lockdowns.get(str(guild.id), {})
+    if str(old_id) in snap:
+        # the clone carries the locked overwrites, so unlock should restore it instead
+        snap[str(new_id)] = snap.pop(str(old_id))
+        save_lockdowns(lockdowns)
+    job = ban_jobs.get(str(guild.id))
+    if job and job["channel_id"] == old_id:
+        job["channel_id"] = new_id
+        save_ban_jobs(ban_jobs)
+    watched = archive_config.get(str(guild.id), {}).get("watch_channels", [])
+    if old_id in watched:
+        watched[watched.index(old_id)] = new_id
+        save_archive_config(archive_config)
+
+async def nuke_channel(channel, reason: str):
+    """
+    Replace a channel with a fresh clone instead of deleting its history message by message.
+    clone() copies name, topic, overwrites, category, nsfw and slowmode; position and
+    webhooks are carried over separately. Returns the new channel.
+    """
+    new_channel = await channel.clone(reason=reason)
+    webhooks = []
+    try:
+        await new_channel.edit(position=channel.position, slowmode_delay=channel.slowmode_delay, reason=reason)
+        # moving keeps webhook ids/tokens valid for whatever posts through them
+        webhooks = await channel.webhooks()
+        for wh in webhooks:
+            await wh.edit(channel=new_channel, reason=reason)
+        await channel.delete(reason=reason)
+    except Exception:
+        for wh in webhooks:
+            try:
+                await wh.edit(channel=channel, reason=reason)
+            except Exception:
+                pass
+        await new_channel.delete(reason="Nuke failed, removing clone")
+        raise
+    remap_channel_id(channel.guild, channel.id, new_channel.id)
+    return new_channel
+
 # --- xnuke ---
 @bot.command()
 @commands.has_permissions(administrator=True)
@@ -1434,34 +3924,509 @@ async def nuke(ctx):
 
     try:
         msg = await bot.wait_for("message", timeout=15, check=check)
-        await ctx.send("💣 Nuking channel...")
+    except asyncio.TimeoutError:
+        return await confirm_message.edit(content="❌ Nuke cancelled (no confirmation).")
 
-        await ctx.channel.purge(limit=None)  # delete all messages
-        await ctx.send("✅ Channel has been nuked by an Administrator.")
+    await ctx.send("💣 Nuking channel...")
+    started = datetime.utcnow()
+    try:
+        new_channel = await nuke_channel(ctx.channel, reason=f"Nuked by {ctx.author}")
+    except Exception as e:
+        return await send_error(ctx, f"Failed to nuke channel. Error: {e}")
 
-    except TimeoutError:
-        await confirm_message.edit(content="❌ Nuke cancelled (no confirmation).")
+    took = (datetime.utcnow() - started).total_seconds()
+    await new_channel.send("✅ Channel has been nuked by an Administrator.")
+    log_embed = make_embed("💣 Channel Nuked", f"**Channel:** {new_channel.mention}\n**Moderator:** {ctx.author} (`{ctx.author.id}`)\n**Took:** {took:.1f}s", discord.Color.dark_red())
+    await send_log_embed(ctx.guild, "Nuke Log", log_embed)
 
 # --- Error handling ---
 @nuke.error
 async def nuke_error(ctx, error):
     if isinstance(error, commands.MissingPermissions):
         await ctx.send("❌ You need Administrator permissions to use this command.")
+# -------------------------
+# AUTOMOD (compiled per-guild word / regex / invite filters)
+# -------------------------
+AUTOMOD_FILE = "automod.json"
+AUTOMOD_FLUSH_INTERVAL = 3  # seconds between batched deletes/warns/mutes/logs
+AUTOMOD_MUTE = "10m"
+AUTOMOD_PATTERN_MAX = 100   # characters per admin pattern
+AUTOMOD_SCAN_MAX = 2000     # characters of a message the admin patterns look at
+INVITE_RE = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg)/[a-z0-9-]+", re.I)
+# Lookalike letters, leetspeak and zero-width characters folded before word matching.
+AUTOMOD_FOLD = str.maketrans({
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "і": "i", "ј": "j",
+    "ѕ": "s", "ԁ": "d", "ɡ": "g", "ο": "o", "α": "a", "ν": "v", "τ": "t", "κ": "k", "ι": "i",
+    "@": "a", "$": "s", "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "!": "i", "|": "i",
+    "\u200b": None, "\u200c": None, "\u200d": None, "\u2060": None, "\ufeff": None,
+})
+
+def load_automod():
+    return store_load(AUTOMOD_FILE, {})
+
+def save_automod(data):
+    store_save(AUTOMOD_FILE, data)
+
+automod_config = load_automod()  # {guild_id: {"words": [], "regex": [], "invites": bool, "action": "delete,warn"}}
+automod_matchers = {}            # {guild_id: (words_re, regex_re, invites)} rebuilt when the config changes
+automod_pending = {}             # {guild_id: {"delete": {channel_id: [msg]}, "warn": [...], "mute": [...], "hits": [...]}}
+
+def normalize_text(text: str):
+    return unicodedata.normalize("NFKC", text).casefold().translate(AUTOMOD_FOLD)
+
+def _trie_pattern(words):
+    """
+    Build one regex from a word list by merging shared prefixes into a trie.
+    The regex engine then walks each message once instead of once per word.
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+# Characters the pattern analysis checks classes against, on top of the pattern's own text.
+AUTOMOD_PROBE = "".join(map(chr, range(32, 127))) + "\n\t éßжλ٣"
+_REPEAT_OPS = tuple(getattr(sre_parse, n) for n in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(sre_parse, n))
+_GROUP_OPS = tuple(getattr(sre_parse, n) for n in ("SUBPATTERN", "ATOMIC_GROUP") if hasattr(sre_parse, n))
+_CATEGORY_RE = {
+    sre_parse.CATEGORY_DIGIT: re.compile(r"\d"), sre_parse.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+    sre_parse.CATEGORY_SPACE: re.compile(r"\s"), sre_parse.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+    sre_parse.CATEGORY_WORD: re.compile(r"\w"), sre_parse.CATEGORY_NOT_WORD: re.compile(r"\W"),
+}
+
+def _class_member(op, av, ch, fold=True):
+    """Whether one member of a [...] class (or a bare literal) matches ch; fold mirrors re.I."""
+    variants = [v for v in (ch, ch.lower(), ch.upper()) if len(v) == 1] if fold else (ch,)
+    if op == sre_parse.LITERAL:
+        return any(v == chr(av) for v in variants)
+    if op == sre_parse.RANGE:
+        return any(av[0] <= ord(v) <= av[1] for v in variants)
+    if op == sre_parse.CATEGORY:
+        rx = _CATEGORY_RE.get(av)
+        return rx is None or rx.match(ch) is not None
+    return True  # unknown member: assume it matches
+
+def _char_set(op, av, chars):
+    if op == sre_parse.LITERAL:
+        return {c for c in chars if _class_member(op, av, c)}
+    if op == sre_parse.NOT_LITERAL:
+        return {c for c in chars if not _class_member(sre_parse.LITERAL, av, c)}
+    if op == sre_parse.ANY:
+        return chars - {"\n"}
+    negate = any(o == sre_parse.NEGATE for o, _ in av)
+    members = [(o, a) for o, a in av if o != sre_parse.NEGATE]
+    return {c for c in chars if any(_class_member(o, a, c) for o, a in members) != negate}
+
+def _pattern_info(items, chars):
+    """(first chars, can match empty, all chars, has a variable repeat) for a parsed sequence."""
+    first, every, nullable, var = set(), set(), True, False
+    for op, av in items:
+        f, n, c, v = _item_info(op, av, chars)
+        if nullable:
+            first |= f
+        nullable = nullable and n
+        every |= c
+        var = var or v
+    return first, nullable, every, var
+
+def _item_info(op, av, chars):
+    if op in _REPEAT_OPS:
+        lo, hi, sub = av
+        f, n, c, v = _pattern_info(sub, chars)
+        return f, n or lo == 0, c, v or (hi > 1 and lo < hi)
+    if op in _GROUP_OPS:
+        return _pattern_info(av[-1], chars)
+    if op == sre_parse.BRANCH:
+        infos = [_pattern_info(b, chars) for b in av[1]]
+        return (set().union(*(i[0] for i in infos)), any(i[1] for i in infos),
+                set().union(*(i[2] for i in infos)), any(i[3] for i in infos))
+    if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return set(), True, set(), False
+    if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN):
+        s = _char_set(op, av, chars)
+        return s, False, s, False
+    return set(chars), True, set(chars), True  # back-references and conditionals: assume the worst
+
+def _backtrack_risk(items, chars, follow=None):
+    """
+    Why a parsed sequence can backtrack catastrophically, or None.
+    `follow` is what can come right after the sequence inside an enclosing repeat; None outside one.
+    Inside a repeat the engine may split the same text into iterations in several ways whenever
+    alternatives or optional parts overlap, and it tries every split before failing.
+    """
+    infos = [_item_info(op, av, chars) for op, av in items]
+    tail = None  # chars of the last variable repeat that later items could also consume
+    for i, ((op, av), (f, n, c, v)) in enumerate(zip(items, infos)):
+        after = None
+        if follow is not None:
+            after = set()
+            for f2, n2, _, _ in infos[i + 1:]:
+                after |= f2
+                if not n2:
+                    break
+            else:
+                after |= follow
+        why = None
+        if op in _REPEAT_OPS:
+            lo, hi, sub = av
+            if hi > 1:
+                if follow is not None:
+                    return "nested repeats like `(a+)+` can hang the bot"
+                if tail is not None and lo < hi and c & tail:
+                    return "back-to-back repeats over the same characters like `.*a.*` can hang the bot"
+                why = _backtrack_risk(sub, chars, f)
+            else:
+                if follow is not None and f & after:
+                    return "optional parts inside a repeat like `(a?a)*` can hang the bot"
+                why = _backtrack_risk(sub, chars, after)
+        elif op == sre_parse.BRANCH:
+            if follow is not None:
+                seen = set()
+                for b in av[1]:
+                    bf, bn, _, _ = _pattern_info(b, chars)
+                    if bn or bf & seen:
+                        return "overlapping alternatives inside a repeat like `(a|aa)*` can hang the bot"
+                    seen |= bf
+            for b in av[1]:
+                why = why or _backtrack_risk(b, chars, after)
+        elif op == sre_parse.IN and follow is not None:
+            seen = set()
+            for o, a in av:
+                if o == sre_parse.NEGATE:
+                    continue
+                member = {ch for ch in chars if _class_member(o, a, ch, fold=False)}
+                if member & seen:
+                    return "overlapping alternatives inside a repeat like `(\\w|\\d)+` can hang the bot"
+                seen |= member
+        elif op in _GROUP_OPS:
+            why = _backtrack_risk(av[-1], chars, after)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            why = _backtrack_risk(av[1], chars, after)
+        if why:
+            return why
+        if v:
+            tail = c
+        elif tail is not None and not c <= tail:
+            tail = None
+    return None
+
+def automod_pattern_error(pattern: str):
+    """
+    Why an admin pattern can't be used, or None. Stdlib re has no match timeout, so
+    patterns that can backtrack catastrophically (nested repeats, overlapping alternatives
+    or optional parts inside a repeat, back-to-back repeats over the same characters)
+    are refused up front since they run inline in on_message.
+    """
+    if len(pattern) > AUTOMOD_PATTERN_MAX:
+        return f"patterns are limited to {AUTOMOD_PATTERN_MAX} characters"
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        return str(e)
+    return _backtrack_risk(parsed, set(AUTOMOD_PROBE) | set(pattern))
+
+def get_automod_matcher(guild_id):
+    matcher = automod_matchers.get(guild_id)
+    if matcher is None:
+        cfg = automod_config.get(str(guild_id))
+        if not cfg:
+            return None
+        words = {normalize_text(w) for w in cfg.get("words", []) if w.strip()}
+        words_re = re.compile(rf"(?<![a-z0-9])(?:{_trie_pattern(words)})(?![a-z0-9])") if words else None
+        regexes = [p for p in cfg.get("regex", []) if automod_pattern_error(p) is None]
+        regex_re = re.compile("|".join(f"(?:{p})" for p in regexes), re.I) if regexes else None
+        matcher = automod_matchers[guild_id] = (words_re, regex_re, cfg.get("invites", False))
+    return matcher
+
+def check_automod(message):
+    """Return what the message matched (for the log), or None if it is clean."""
+    matcher = get_automod_matcher(message.guild.id)
+    if not matcher or not message.content:
+        return None
+    words_re, regex_re, invites = matcher
+    content = message.content
+    if invites and INVITE_RE.search(content):
+        return "invite link"
+    if regex_re:
+        m = regex_re.search(content[:AUTOMOD_SCAN_MAX])
+        if m:
+            return f"pattern `{m.group(0)[:50]}`"
+    if words_re:
+        # leet folding turns trailing punctuation into letters ("bad!" -> "badi"), so also try the unfolded text
+        m = words_re.search(normalize_text(content)) or words_re.search(unicodedata.normalize("NFKC", content).casefold())
+        if m:
+            return f"word `{m.group(0)[:50]}`"
+    return None
+
+def queue_automod_action(message, hit: str):
+    cfg = automod_config.get(str(message.guild.id), {})
+    actions = set(cfg.get("action", "delete").split(","))
+    pending = automod_pending.setdefault(message.guild.id, {"delete": {}, "warn": [], "mute": [], "hits": []})
+    if "delete" in actions:
+        pending["delete"].setdefault(message.channel.id, []).append(message)
+    if "warn" in actions:
+        pending["warn"].append((message.author, f"Automod: {hit}"))
+    if "mute" in actions:
+        pending["mute"].append((message.author, f"Automod: {hit}"))
+    pending["hits"].append(f"{message.author} in {message.channel.mention}: {hit}")
+
+async def flush_automod(guild_id, pending):
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return
+    for channel_id, msgs in pending["delete"].items():
+        channel = guild.get_channel(channel_id)
+        try:
+            with rest_priority("mod"):
+                if len(msgs) == 1:
+                    await msgs[0].delete()
+                else:
+                    for i in range(0, len(msgs), 100):
+                        await channel.delete_messages(msgs[i:i + 100])
+        except discord.HTTPException as e:
+            print("automod delete failed:", e)
+    if pending["warn"]:
+        record_warnings(guild, guild.me, pending["warn"])
+    muted = set()
+    for member, reason in pending["mute"]:
+        if member.id in muted:
+            continue
+        muted.add(member.id)
+        try:
+            await timeout_member(guild, member, parse_duration(AUTOMOD_MUTE), AUTOMOD_MUTE, reason, guild.me)
+        except Exception as e:
+            print(f"automod mute failed for {member.id}:", e)
+
+    hits = pending["hits"]
+    desc = "\n".join(hits[:20])
+    if len(hits) > 20:
+        desc += f"\n...and {len(hits) - 20} more"
+    embed = make_embed(f"🤖 Automod ({len(hits)} hits)", desc, discord.Color.dark_orange())
+    await send_log_embed(guild, "Automod", embed)
+
+async def automod_flush_loop():
+    while True:
+        await asyncio.sleep(AUTOMOD_FLUSH_INTERVAL)
+        for guild_id in list(automod_pending):
+            try:
+                await flush_automod(guild_id, automod_pending.pop(guild_id))
+            except Exception as e:
+                print("automod flush error:", e)
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def automod(ctx, action: str = "list", *, value: str = None):
+    """xautomod [list|add|remove|regex|unregex|invites|action] [value]"""
+    cfg = automod_config.setdefault(str(ctx.guild.id), {"words": [], "regex": [], "invites": False, "action": "delete"})
+    action = action.lower()
+
+    if action == "list":
+        words = ", ".join(f"`{w}`" for w in cfg["words"][:50]) or "None"
+        if len(cfg["words"]) > 50:
+            words += f" ...and {len(cfg['words']) - 50} more"
+        embed = make_embed("🤖 Automod Settings", None, discord.Color.blue())
+        embed.add_field(name=f"Words ({len(cfg['words'])})", value=words[:1024], inline=False)
+        embed.add_field(name=f"Patterns ({len(cfg['regex'])})", value="\n".join(f"`{p}`" for p in cfg["regex"])[:1024] or "None", inline=False)
+        embed.add_field(name="Invite Filter", value="on" if cfg["invites"] else "off", inline=True)
+        embed.add_field(name="Actions", value=cfg["action"], inline=True)
+        return await ctx.send(embed=embed)
+
+    if value is None:
+        return await send_error(ctx, "Usage: `xautomod [list|add|remove|regex|unregex|invites|action] [value]`")
+
+    if action == "add":
+        new = [w.strip().lower() for w in value.split(",") if w.strip()]
+        cfg["words"] = sorted(set(cfg["words"]) | set(new))
+        msg = f"Added {len(new)} word(s)."
+    elif action == "remove":
+        gone = {w.strip().lower() for w in value.split(",")}
+        cfg["words"] = [w for w in cfg["words"] if w not in gone]
+        msg = "Removed word(s)."
+    elif action == "regex":
+        error = automod_pattern_error(value)
+        if error:
+            return await send_error(ctx, f"Invalid pattern: {error}")
+        if value not in cfg["regex"]:
+            cfg["regex"].append(value)
+        msg = f"Added pattern `{value}`."
+    elif action == "unregex":
+        cfg["regex"] = [p for p in cfg["regex"] if p != value]
+        msg = f"Removed pattern `{value}`."
+    elif action == "invites":
+        cfg["invites"] = value.lower() in ("on", "true", "yes", "1")
+        msg = f"Invite filter {'on' if cfg['invites'] else 'off'}."
+    elif action == "action":
+        chosen = value.lower().replace(" ", "")
+        if not set(chosen.split(",")) <= {"delete", "warn", "mute"}:
+            return await send_error(ctx, "Actions must be a comma list of `delete`, `warn`, `mute`.")
+        cfg["action"] = chosen
+        msg = f"Actions set to `{chosen}`."
+    else:
+        return await send_error(ctx, "Usage: `xautomod [list|add|remove|regex|unregex|invites|action] [value]`")
+
+    save_automod(automod_config)
+    automod_matchers.pop(ctx.guild.id, None)  # recompiled on the next message
+    await send_success(ctx, "✅ Automod Updated", msg)
+
+# -------------------------
+# ANTI-SPAM (per-user token buckets in a slot table, checked in on_message)
+# -------------------------
+SPAM_BURST = 5              # bucket capacity: messages allowed back to back
+SPAM_REFILL = 1 / 1.5       # tokens regained per second
+SPAM_REPEATS = 3            # identical messages in a row before acting
+SPAM_REPEAT_WINDOW = 5      # seconds; a slower repeat starts the count over
+SPAM_MENTIONS = 5           # user/role mentions in one message before acting
+SPAM_TIMEOUT = "10m"
+SPAM_IDLE = 300             # seconds without messages before a bucket is evicted
+SPAM_MAX_SLOTS = 200_000
+ANTISPAM_FILE = "antispam.json"
+ANTISPAM_DEFAULT = False    # opt-in per guild with `xantispam on`
+
+def load_antispam():
+    return store_load(ANTISPAM_FILE, {})
+
+def save_antispam(data):
+    store_save(ANTISPAM_FILE, data)
+
+antispam_enabled = load_antispam()  # {guild_id: bool}, ANTISPAM_DEFAULT when unset
+
+# Bucket state lives in flat typed arrays indexed by slot, so 100k users cost a few MB
+# instead of one dict per user. Freed slots are recycled through spam_free.
+spam_slots = {}             # {(guild_id, user_id): slot}
+spam_free = []
+spam_tokens = array("d")
+spam_last = array("d")
+spam_hash = array("q")      # hash of the last normalized message content
+spam_repeats = array("B")
+spam_actioning = set()      # (guild_id, user_id) with a timeout already in flight
+spam_full_until = 0.0       # monotonic time before which a full table isn't rescanned for new users
+
+def evict_spam_slots(now: float, idle: float = SPAM_IDLE):
+    cutoff = now - idle
+    stale = [key for key, slot in spam_slots.items() if spam_last[slot] < cutoff]
+    for key in stale:
+        spam_free.append(spam_slots.pop(key))
+    return len(stale)
+
+def _spam_slot(key, now: float):
+    global spam_full_until
+    slot = spam_slots.get(key)
+    if slot is not None:
+        return slot
+    if len(spam_slots) >= SPAM_MAX_SLOTS:
+        # a table full of active users would otherwise be scanned twice per new user
+        if now < spam_full_until:
+            return None
+        if not evict_spam_slots(now) and not evict_spam_slots(now, SPAM_IDLE / 10):
+            spam_full_until = now + SPAM_IDLE / 10
+            return None
+    if spam_free:
+        slot = spam_free.pop()
+        spam_tokens[slot] = SPAM_BURST
+        spam_last[slot] = now
+        spam_hash[slot] = 0
+        spam_repeats[slot] = 0
+    else:
+        slot = len(spam_tokens)
+        spam_tokens.append(SPAM_BURST)
+        spam_last.append(now)
+        spam_hash.append(0)
+        spam_repeats.append(0)
+    spam_slots[key] = slot
+    return slot
+
+def check_spam(message):
+    """Update the author's bucket and return a reason string if this message is spam, else None."""
+    now = time.monotonic()
+    slot = _spam_slot((message.guild.id, message.author.id), now)
+    if slot is None:
+        return None
+
+    elapsed = now - spam_last[slot]
+    tokens = spam_tokens[slot] + elapsed * SPAM_REFILL
+    if tokens > SPAM_BURST:
+        tokens = SPAM_BURST
+    spam_last[slot] = now
+
+    content = message.content
+    if content:
+        h = hash(" ".join(content.lower().split()))
+        if h == spam_hash[slot] and elapsed <= SPAM_REPEAT_WINDOW:
+            if spam_repeats[slot] < 255:
+                spam_repeats[slot] += 1
+        else:
+            spam_hash[slot] = h
+            spam_repeats[slot] = 0
+
+    reason = None
+    if tokens < 1:
+        reason = "message flood"
+    else:
+        tokens -= 1
+    spam_tokens[slot] = tokens
+
+    if reason is None:
+        if spam_repeats[slot] + 1 >= SPAM_REPEATS:
+            reason = "repeated messages"
+        elif message.mention_everyone or len(message.raw_mentions) + len(message.raw_role_mentions) >= SPAM_MENTIONS:
+            reason = "mention spam"
+    if reason:
+        spam_tokens[slot] = SPAM_BURST
+        spam_repeats[slot] = 0
+    return reason
+
+async def punish_spam(message, reason: str):
+    member = message.author
+    key = (message.guild.id, member.id)
+    if key in spam_actioning or is_staff(member):
+        return
+    spam_actioning.add(key)
+    try:
+        await timeout_member(message.guild, member, parse_duration(SPAM_TIMEOUT), SPAM_TIMEOUT, f"Anti-spam: {reason}", message.guild.me)
+    except Exception as e:
+        print(f"anti-spam timeout failed for {member.id}:", e)
+    finally:
+        spam_actioning.discard(key)
+
+async def spam_eviction_loop():
+    while True:
+        await asyncio.sleep(60)
+        evict_spam_slots(time.monotonic())
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def antispam(ctx, state: str = None):
+    if state is None or state.lower() not in ("on", "off"):
+        current = "on" if antispam_enabled.get(str(ctx.guild.id), ANTISPAM_DEFAULT) else "off"
+        return await ctx.send(embed=make_embed("🛡️ Anti-Spam", f"Anti-spam is **{current}**. Use `xantispam on|off`.", discord.Color.blue()))
+    antispam_enabled[str(ctx.guild.id)] = state.lower() == "on"
+    save_antispam(antispam_enabled)
+    await send_success(ctx, "✅ Anti-Spam Updated", f"Anti-spam is now **{state.lower()}**.")
+
 # afk cmd
 AFK_FILE = "afk.json"
 
 # Load AFK data from file
 def load_afk():
     try:
-        with open(AFK_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+        return store_load(AFK_FILE, {})
+    except json.JSONDecodeError:
         return {}
 
 # Save AFK data to file
 def save_afk(data):
-    with open(AFK_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    store_save(AFK_FILE, data)
 
 afk_users = load_afk()  # {user_id: {"reason": str, "time": iso_str}}
 
@@ -1489,6 +4454,28 @@ async def on_message(message):
     if message.author.bot:
         return
 
+    if message.guild:
+        capture_message(message)
+        record_activity(message)
+
+    spam_reason = None
+    if message.guild and antispam_enabled.get(str(message.guild.id), ANTISPAM_DEFAULT):
+        spam_reason = check_spam(message)
+        if spam_reason:
+            spawn(punish_spam(message, spam_reason))
+
+    if message.guild:
+        automod_hit = check_automod(message)
+        if automod_hit and not is_staff(message.author):
+            queue_automod_action(message, automod_hit)
+            return
+
+    if message.guild and not spam_reason:
+        new_level = award_xp(message)
+        if new_level:
+            # not awaited: a slow or failed send mustn't hold up AFK handling and commands
+            spawn(announce_level_up(message.channel, message.author, new_level))
+
     user_id = str(message.author.id)
 
     # If user was AFK, remove it when they talk
@@ -1537,14 +4524,10 @@ CONFIG_FILE = "revive_config.json"
 
 # Helper: load/save JSON config
 def load_config():
-    if not os.path.exists(CONFIG_FILE):
-        return {"role_id": None, "revive_enabled": False, "interval": None}
-    with open(CONFIG_FILE, "r") as f:
-        return json.load(f)
+    return store_load(CONFIG_FILE, {"role_id": None, "revive_enabled": False, "interval": None})
 
 def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=4)
+    store_save(CONFIG_FILE, config)
 
 config = load_config()
 revive_task = None  # background loop reference
@@ -1582,14 +4565,10 @@ TOPICS = load_topics()
 TIMEZONES_FILE = "timezones.json"
 
 def load_timezones():
-    if not os.path.exists(TIMEZONES_FILE):
-        return {}
-    with open(TIMEZONES_FILE, "r") as f:
-        return json.load(f)
+    return store_load(TIMEZONES_FILE, {})
 
 def save_timezones(data):
-    with open(TIMEZONES_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    store_save(TIMEZONES_FILE, data, indent=2)
 
 @bot.command()
 async def tz(ctx, *args):
@@ -1627,6 +4606,8 @@ async def tz(ctx, *args):
                 if member.name.lower() == name.lower() or member.display_name.lower() == name.lower():
                     target = member
                     break
+            if not target and LOW_MEMORY:
+                target = await fetch_member_cached(ctx.guild, name)
 
         if not target:
             return await ctx.send("⚠️ Could not find that user.")
@@ -1778,10 +4759,12 @@ async def remind(ctx, time: str = None, *, reminder: str = None):
     # Wait without blocking other commands
     await asyncio.sleep(seconds)
 
-    try:
-        await ctx.author.send(f"⏰ Reminder: **{reminder}** (set {time} ago)")
-    except discord.Forbidden:
-        await ctx.send(f"{ctx.author.mention} I couldn't DM you, but here's your reminder:\n**{reminder}**")
+    queue_dm(
+        ctx.author,
+        content=f"⏰ Reminder: **{reminder}** (set {time} ago)",
+        fallback_channel=ctx.channel,
+        fallback_content=f"{ctx.author.mention} I couldn't DM you, but here's your reminder:\n**{reminder}**"
+    )
 
 # ---------------- xtimer ----------------
 @commands.has_permissions(manage_messages=True)
@@ -1813,7 +4796,11 @@ async def timer(ctx, time: str = None):
         await asyncio.sleep(1)
         seconds -= 1
         embed.description = f"Time remaining: **{seconds}**s"
-        await msg.edit(embed=embed)
+        try:
+            with rest_priority("cosmetic"):
+                await msg.edit(embed=embed)
+        except RestShed:
+            pass  # skip this tick, the next one carries the newer value
 
     done = discord.Embed(
         title="⏰ Time's up!",
@@ -1832,27 +4819,717 @@ async def meme(ctx):
             embed = discord.Embed(title=data['title'], url=data['postLink'])
             embed.set_image(url=data['url'])
             await ctx.send(embed=embed)
+# -------------------------
+# XP / LEVELS (in-memory counters, batched flush, maintained top-K leaderboard)
+# -------------------------
+XP_FILE = "xp.json"          # legacy single document, still read on startup
+XP_DIR = "xp"                # xp/<guild_id>.json, one file per guild so a flush only rewrites active guilds
+XP_COOLDOWN = 60            # seconds between XP awards per member; messages are always counted
+XP_MIN, XP_MAX = 15, 25     # XP per award
+XP_FLUSH_INTERVAL = 30      # seconds between saves of dirty counters
+XP_TOP_K = 50               # leaderboard size kept per guild
+
+def load_xp():
+    data = store_load(XP_FILE, {})
+    if os.path.isdir(XP_DIR):
+        for name in os.listdir(XP_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(XP_DIR, name), "r") as f:
+                    data[name[:-5]] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"xp load failed for {name}:", e)
+    return data
+
+def _write_xp(snapshot):
+    """Write each guild's counters to its own file. Runs in a worker thread."""
+    os.makedirs(XP_DIR, exist_ok=True)
+    for guild_id, users in snapshot.items():
+        path = os.path.join(XP_DIR, f"{guild_id}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(users, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+def snapshot_xp(guild_ids):
+    """
+    Copy the given guilds' user dicts on the loop. The [xp, messages] lists are shared:
+    they never change size, so the writer thread at worst sees a counter a message newer.
+    """
+    return {gid: dict(xp_data.get(gid, {})) for gid in guild_ids}
+
+async def save_xp(guild_ids):
+    """Snapshot the given guilds' counters on the loop, then serialize and write them off it."""
+    await asyncio.to_thread(_write_xp, snapshot_xp(guild_ids))
+
+xp_data = load_xp()     # {guild_id: {user_id: [xp, messages]}}
+xp_last = {}            # {(guild_id, user_id): monotonic time of last award}
+xp_dirty = set()        # guild ids with unsaved counters
+xp_top = {}             # {guild_id: [[xp, user_id], ...]} ascending, at most XP_TOP_K
+xp_top_members = {}     # {guild_id: set(user_id)} members currently in xp_top
+
+def _build_xp_top(guild_id: str):
+    users = xp_data.get(guild_id, {})
+    top = heapq.nlargest(XP_TOP_K, ([v[0], uid] for uid, v in users.items()))
+    top.reverse()
+    xp_top[guild_id] = top
+    xp_top_members[guild_id] = {uid for _, uid in top}
+
+for _gid in xp_data:
+    _build_xp_top(_gid)
+
+def _update_xp_top(guild_id: str, user_id: str, old_xp: int, new_xp: int):
+    """XP only grows, so a member outside the top-K can enter only by beating its minimum."""
+    top = xp_top.setdefault(guild_id, [])
+    members = xp_top_members.setdefault(guild_id, set())
+    if user_id in members:
+        del top[bisect.bisect_left(top, [old_xp, user_id])]
+    elif len(top) >= XP_TOP_K and new_xp <= top[0][0]:
+        return
+    bisect.insort(top, [new_xp, user_id])
+    members.add(user_id)
+    if len(top) > XP_TOP_K:
+        members.discard(top.pop(0)[1])
+
+def xp_level(xp: int):
+    """(level, xp into this level, xp needed for the next) with 5l² + 50l + 100 per level."""
+    level = 0
+    while xp >= (need := 5 * level * level + 50 * level + 100):
+        xp -= need
+        level += 1
+    return level, xp, need
+
+def award_xp(message):
+    """Count a message and award XP off cooldown. Returns the new level on a level-up, else None."""
+    guild_id, user_id = str(message.guild.id), str(message.author.id)
+    entry = xp_data.setdefault(guild_id, {}).setdefault(user_id, [0, 0])
+    entry[1] += 1
+    xp_dirty.add(guild_id)
+    now = time.monotonic()
+    key = (guild_id, user_id)
+    if now - xp_last.get(key, -XP_COOLDOWN) < XP_COOLDOWN:
+        return None
+    xp_last[key] = now
+    old = entry[0]
+    entry[0] += random.randint(XP_MIN, XP_MAX)
+    _update_xp_top(guild_id, user_id, old, entry[0])
+    before, after = xp_level(old)[0], xp_level(entry[0])[0]
+    return after if after > before else None
+
+def xp_rank(guild_id, user_id):
+    """1-based rank if the member is on the maintained leaderboard, else None."""
+    top = xp_top.get(str(guild_id), [])
+    for i, (_, uid) in enumerate(reversed(top), 1):
+        if uid == str(user_id):
+            return i
+    return None
+
+async def announce_level_up(channel, member, level: int):
+    embed = make_embed("🎉 Level Up!", f"{member.mention} reached **level {level}**!", discord.Color.gold())
+    try:
+        with rest_priority("cosmetic"):
+            await channel.send(embed=embed, delete_after=15)
+    except (discord.HTTPException, RestShed) as e:
+        print("level-up announcement failed:", e)
+
+async def xp_flush_loop():
+    while True:
+        await asyncio.sleep(XP_FLUSH_INTERVAL)
+        if xp_dirty:
+            dirty = list(xp_dirty)
+            xp_dirty.clear()
+            try:
+                await save_xp(dirty)
+            except Exception as e:
+                xp_dirty.update(dirty)   # retry on the next flush
+                print("xp flush error:", e)
+        # cooldown stamps older than the cooldown carry no information
+        cutoff = time.monotonic() - XP_COOLDOWN
+        for key in [k for k, t in xp_last.items() if t < cutoff]:
+            del xp_last[key]
+
+@bot.command(aliases=["level"])
+async def rank(ctx, member: discord.Member = None):
+    member = member or ctx.author
+    xp, messages = xp_data.get(str(ctx.guild.id), {}).get(str(member.id), [0, 0])
+    level, into, need = xp_level(xp)
+    pos = xp_rank(ctx.guild.id, member.id)
+    embed = make_embed(f"📈 {member.display_name}", None, discord.Color.blurple())
+    embed.set_thumbnail(url=member.display_avatar.url)
+    embed.add_field(name="Level", value=level, inline=True)
+    embed.add_field(name="XP", value=f"{into}/{need} (total {xp})", inline=True)
+    embed.add_field(name="Rank", value=f"#{pos}" if pos else f"Outside top {XP_TOP_K}", inline=True)
+    embed.add_field(name="Messages", value=messages, inline=True)
+    await ctx.send(embed=embed)
+
+@bot.command(aliases=["lb", "top"])
+async def leaderboard(ctx):
+    top = list(reversed(xp_top.get(str(ctx.guild.id), [])))[:10]
+    if not top:
+        return await send_error(ctx, "Nobody has earned XP here yet.")
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = [
+        f"{medals.get(i, f'`#{i}`')} <@{uid}> — level **{xp_level(xp)[0]}** ({xp} XP)"
+        for i, (xp, uid) in enumerate(top, 1)
+    ]
+    await ctx.send(embed=make_embed(f"🏆 {ctx.guild.name} Leaderboard", "\n".join(lines), discord.Color.gold()))
+
+# -------------------------
+# CARDS (Pillow rendering in worker processes; avatar + rendered-card LRU caches)
+# -------------------------
+CARD_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+AVATAR_CACHE_SIZE = 256      # downloaded avatars/icons, keyed by asset hash
+CARD_CACHE_SIZE = 128        # rendered PNGs, keyed by a hash of everything drawn on them
+card_pool = None             # ProcessPoolExecutor, created in setup
+avatar_cache = OrderedDict() # {asset key: bytes}
+card_cache = OrderedDict()   # {sha256 of inputs: PNG bytes}
+
+def start_card_pool():
+    global card_pool
+    # spawn, not fork: forking a process with a running event loop and client threads is unsafe.
+    # Spawned workers re-import the main script as __mp_main__; started from main.py that is a
+    # no-op, so they only import cards (started as python bot.py they would load all of this).
+    ctx = multiprocessing.get_context("spawn")
+    card_pool = ProcessPoolExecutor(max_workers=CARD_WORKERS, mp_context=ctx, initializer=cards.init_worker)
+
+async def run_card_render(kind: str, data: dict, image):
+    """cards.render in the pool; a pool broken by a crashed worker is replaced for the next call."""
+    pool = card_pool
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, cards.render, kind, data, image)
+    except BrokenProcessPool:
+        if card_pool is pool:
+            print("card pool broke, starting a new one")
+            pool.shutdown(wait=False)
+            start_card_pool()
+        raise
+
+def _lru_put(cache, key, value, size: int):
+    cache[key] = value
+    if len(cache) > size:
+        cache.popitem(last=False)
+
+async def fetch_asset_cached(asset):
+    if asset is None:
+        return None
+    data = avatar_cache.get(asset.key)
+    if data is not None:
+        avatar_cache.move_to_end(asset.key)
+        return data
+    data = await asset.replace(size=256, static_format="png").read()
+    _lru_put(avatar_cache, asset.key, data, AVATAR_CACHE_SIZE)
+    return data
+
+async def render_card(kind: str, data: dict, asset=None):
+    """PNG bytes for a card; identical inputs are served from card_cache without re-rendering."""
+    key = hashlib.sha256(json.dumps([kind, data, asset.key if asset else None], sort_keys=True).encode()).hexdigest()
+    png = card_cache.get(key)
+    if png is not None:
+        card_cache.move_to_end(key)
+        return png
+    image = await fetch_asset_cached(asset)
+    png = await run_card_render(kind, data, image)
+    _lru_put(card_cache, key, png, CARD_CACHE_SIZE)
+    return png
+
+async def attach_card(embed, kind: str, data: dict, asset=None):
+    """Render and point the embed at the card. Returns the file to send, or None if rendering failed."""
+    try:
+        png = await render_card(kind, data, asset)
+    except Exception as e:
+        print("card render error:", e)
+        return None
+    embed.set_image(url=f"attachment://{kind}.png")
+    return discord.File(io.BytesIO(png), filename=f"{kind}.png")
+
+# -------------------------
+# WELCOME CARDS (join bursts coalesced, bounded render queue, text-only under overload)
+# -------------------------
+WELCOME_FILE = "welcome.json"
+WELCOME_COALESCE = 3.0      # seconds of joins gathered into one welcome
+WELCOME_GROUP_MAX = 6       # more joins than this in one window -> batched text instead of a card
+WELCOME_QUEUE_SIZE = 10     # renders waiting before new welcomes fall back to text-only
+WELCOME_RENDERERS = 2
+WELCOME_TEXT_CHUNK = 40     # mentions per batched text message (fewer if the text would pass 2000 chars)
+DEFAULT_WELCOME = "Welcome {mention} to **{server}**!"
+
+def load_welcome():
+    return store_load(WELCOME_FILE, {})
+
+def save_welcome(data):
+    store_save(WELCOME_FILE, data)
+
+welcome_config = load_welcome()  # {guild_id: {"channel": id, "message": str}}
+welcome_pending = {}   # {guild_id: [Member]} joins waiting for their window to close
+welcome_queue = None   # asyncio.Queue of (channel, members, text), created in setup
+
+def queue_welcome(member):
+    """Called from on_member_join; only buffers, never awaits."""
+    if member.bot or str(member.guild.id) not in welcome_config:
+        return
+    pending = welcome_pending.get(member.guild.id)
+    if pending is None:
+        pending = welcome_pending[member.guild.id] = []
+        bot.loop.call_later(WELCOME_COALESCE, _close_welcome_window, member.guild.id)
+    pending.append(member)
+
+def _welcome_text(guild, members):
+    template = welcome_config.get(str(guild.id), {}).get("message") or DEFAULT_WELCOME
+    return (template
+            .replace("{mention}", ", ".join(m.mention for m in members))
+            .replace("{server}", guild.name)
+            .replace("{count}", str(guild.member_count)))
+
+def _close_welcome_window(guild_id):
+    members = welcome_pending.pop(guild_id, [])
+    guild = bot.get_guild(guild_id)
+    cfg = welcome_config.get(str(guild_id))
+    channel = guild.get_channel(cfg["channel"]) if guild and cfg else None
+    if not members or not channel:
+        return
+    if len(members) <= WELCOME_GROUP_MAX and not in_raid_mode(guild_id):
+        try:
+            welcome_queue.put_nowait((channel, members, _welcome_text(guild, members)))
+            return
+        except asyncio.QueueFull:
+            pass  # renderers are behind; text-only keeps up
+    spawn(send_welcome_text(channel, members))
+
+def _welcome_mentions(guild):
+    # a raid's welcome would otherwise ping every raider account
+    return discord.AllowedMentions.none() if in_raid_mode(guild.id) else discord.AllowedMentions.default()
+
+def _welcome_chunks(guild, members):
+    """Split members so each rendered welcome fits in one 2000 character message."""
+    template = welcome_config.get(str(guild.id), {}).get("message") or DEFAULT_WELCOME
+    base = len(_welcome_text(guild, []))
+    per = max(1, template.count("{mention}"))   # every {mention} repeats the whole list
+    chunk, size = [], 0
+    for m in members:
+        grow = len(m.mention) + (2 if chunk else 0)
+        if chunk and (len(chunk) == WELCOME_TEXT_CHUNK or base + per * (size + grow) > 2000):
+            yield chunk
+            chunk, size, grow = [], 0, len(m.mention)
+        chunk.append(m)
+        size += grow
+    if chunk:
+        yield chunk
+
+async def send_welcome_text(channel, members):
+    for chunk in _welcome_chunks(channel.guild, members):
+        try:
+            with rest_priority("log"):
+                await channel.send(_welcome_text(channel.guild, chunk)[:2000],
+                                   allowed_mentions=_welcome_mentions(channel.guild))
+        except discord.HTTPException as e:
+            print("welcome send error:", e)
+            return
+
+async def render_welcome(guild, members):
+    accent = guild.me.color.value or None
+    images = await asyncio.gather(*(fetch_asset_cached(m.display_avatar) for m in members))
+    if len(members) == 1:
+        m = members[0]
+        kind, image = "welcome", images[0]
+        data = {"title": m.display_name, "subtitle": f"Member #{guild.member_count:,}",
+                "line": "Welcome to the server!", "caption": guild.name, "accent": accent}
+    else:
+        kind, image = "welcome_group", list(images)
+        data = {"title": f"Welcome {len(members)} new members!", "names": [m.display_name for m in members],
+                "caption": guild.name, "accent": accent}
+    return await run_card_render(kind, data, image)
+
+async def welcome_worker():
+    while True:
+        channel, members, text = await welcome_queue.get()
+        try:
+            png = await render_welcome(channel.guild, members)
+            with rest_priority("log"):
+                await channel.send(text[:2000], file=discord.File(io.BytesIO(png), filename="welcome.png"),
+                                   allowed_mentions=_welcome_mentions(channel.guild))
+        except discord.HTTPException as e:
+            print("welcome send error:", e)
+        except Exception as e:
+            print("welcome render error:", e)
+            await send_welcome_text(channel, members)
+        finally:
+            welcome_queue.task_done()
+
+def start_welcome_workers():
+    global welcome_queue
+    welcome_queue = asyncio.Queue(maxsize=WELCOME_QUEUE_SIZE)
+    for _ in range(WELCOME_RENDERERS):
+        spawn(welcome_worker())
+
+@bot.command()
+@commands.has_permissions(manage_guild=True)
+async def welcome(ctx, channel: str = None, *, message: str = None):
+    """xwelcome #channel [message with {mention} {server} {count}] | xwelcome off"""
+    guild_id = str(ctx.guild.id)
+    if channel is None:
+        cfg = welcome_config.get(guild_id)
+        if not cfg:
+            return await send_error(ctx, "Welcomes are off. Use `xwelcome #channel [message]`.")
+        desc = f"**Channel:** <#{cfg['channel']}>\n**Message:** {cfg.get('message') or DEFAULT_WELCOME}"
+        return await ctx.send(embed=make_embed("👋 Welcome Settings", desc, discord.Color.blue()))
+    if channel.lower() == "off":
+        welcome_config.pop(guild_id, None)
+        save_welcome(welcome_config)
+        return await send_success(ctx, "👋 Welcomes Off", "New members will no longer be welcomed.")
+    match = re.fullmatch(r"<#(\d+)>|(\d+)", channel)
+    target = ctx.guild.get_channel(int(match.group(1) or match.group(2))) if match else None
+    if not isinstance(target, discord.TextChannel):
+        return await send_error(ctx, "Usage: `xwelcome #channel [message]` or `xwelcome off`")
+    welcome_config[guild_id] = {"channel": target.id, "message": message}
+    save_welcome(welcome_config)
+    await send_success(ctx, "👋 Welcomes On", f"New members will be welcomed in {target.mention}.")
+
 # profile
 @bot.command()
 async def profile(ctx, member: discord.Member = None):
     member = member or ctx.author
     embed = discord.Embed(title=f"{member.name}'s Profile", color=discord.Color.blue())
-    embed.set_thumbnail(url=member.avatar.url)
+    embed.set_thumbnail(url=member.display_avatar.url)
     embed.add_field(name="Username", value=member.name, inline=True)
     embed.add_field(name="ID", value=member.id, inline=True)
     embed.add_field(name="Joined Server", value=member.joined_at.strftime("%b %d, %Y"), inline=False)
     embed.add_field(name="Account Created", value=member.created_at.strftime("%b %d, %Y"), inline=False)
+    xp, messages = xp_data.get(str(ctx.guild.id), {}).get(str(member.id), [0, 0])
+    level, into, need = xp_level(xp)
+    embed.add_field(name="Level", value=f"{level} ({xp} XP, {messages} messages)", inline=False)
+    file = await attach_card(embed, "profile", {
+        "title": member.display_name,
+        "subtitle": f"@{member.name}",
+        "level": level,
+        "xp_into": into,
+        "xp_need": need,
+        "messages": messages,
+        "joined": member.joined_at.strftime("%d %b %Y"),
+        "accent": member.color.value or None,
+    }, member.display_avatar)
+    if file:
+        embed.set_thumbnail(url=None)
+        await ctx.send(embed=embed, file=file)
+    else:
+        await ctx.send(embed=embed)
+
+# -------------------------
+# ACTIVITY ANALYTICS (hourly HyperLogLog + count-min sketches per channel)
+# -------------------------
+ACTIVITY_DIR = "activity"          # activity/<guild_id>.bin, zlib-compressed sketches
+ACTIVITY_RETENTION_HOURS = 30 * 24
+ACTIVITY_FLUSH_INTERVAL = 300      # seconds between sketch saves
+HLL_P = 9                          # 512 registers, ~4.6% error on unique counts
+CMS_DEPTH, CMS_WIDTH = 4, 64       # ~4% of the hour's volume as worst-case overcount
+HEAVY_K = 8                        # heavy-hitter candidates kept per channel-hour
+_MASK64 = (1 << 64) - 1
+
+def _mix64(x: int) -> int:
+    """splitmix64 finaliser: spreads sequential snowflakes over all 64 bits."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+class HyperLogLog:
+    __slots__ = ("registers",)
+    M = 1 << HLL_P
+
+    def __init__(self, registers=None):
+        self.registers = registers or bytearray(self.M)
+
+    def add(self, h: int):
+        idx = h >> (64 - HLL_P)
+        rest = h & ((1 << (64 - HLL_P)) - 1)
+        rank = (64 - HLL_P) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        m = self.M
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if est <= 2.5 * m and zeros:
+            est = m * math.log(m / zeros)  # linear counting for small sets
+        return round(est)
+
+class CountMinSketch:
+    __slots__ = ("table",)
+
+    def __init__(self, table=None):
+        self.table = table or array("I", bytes(4 * CMS_DEPTH * CMS_WIDTH))
+
+    def _cells(self, h: int):
+        # a separate 16-bit slice of the mixed hash per row keeps the rows independent
+        return [row * CMS_WIDTH + (h >> (16 * row)) % CMS_WIDTH for row in range(CMS_DEPTH)]
+
+    def add(self, h: int) -> int:
+        """Count one occurrence and return the new estimate."""
+        est = None
+        for i in self._cells(h):
+            self.table[i] += 1
+            est = self.table[i] if est is None else min(est, self.table[i])
+        return est
+
+    def estimate(self, h: int) -> int:
+        return min(self.table[i] for i in self._cells(h))
+
+    def merge(self, other):
+        self.table = array("I", map(operator.add, self.table, other.table))
+
+class ActivityCell:
+    """One channel for one hour (or day): exact message count, unique chatters, heavy-hitter sketch."""
+    __slots__ = ("count", "hll", "cms", "heavy")
+
+    def __init__(self, count=0, hll=None, cms=None, heavy=None):
+        self.count = count
+        self.hll = hll or HyperLogLog()
+        self.cms = cms or CountMinSketch()
+        self.heavy = heavy or {}   # {user_id: estimated messages}
+
+    def add(self, user_id: int, h: int):
+        self.count += 1
+        self.hll.add(h)
+        est = self.cms.add(h)
+        heavy = self.heavy
+        if user_id in heavy or len(heavy) < HEAVY_K:
+            heavy[user_id] = est
+        else:
+            low = min(heavy, key=heavy.get)
+            if est > heavy[low]:
+                del heavy[low]
+                heavy[user_id] = est
+
+    def merge(self, other):
+        self.count += other.count
+        self.hll.merge(other.hll)
+        self.cms.merge(other.cms)
+        est = self.cms.estimate
+        ranked = sorted(((est(_mix64(u)), u) for u in set(self.heavy) | set(other.heavy)), reverse=True)
+        self.heavy = {u: n for n, u in ranked[:HEAVY_K]}
+
+    def copy(self):
+        return ActivityCell(self.count, HyperLogLog(bytearray(self.hll.registers)),
+                            CountMinSketch(array("I", self.cms.table)), dict(self.heavy))
+
+activity = defaultdict(dict)       # {guild_id: {(hour, channel_id): ActivityCell}}
+activity_days = defaultdict(dict)  # {guild_id: {(day, channel_id): ActivityCell}} rollups, rebuilt from hours on load
+activity_dirty = set()             # guild ids with unsaved cells
+_CELL_HEAD = struct.Struct("<IQIB")  # hour, channel_id, count, heavy count
+
+def record_activity(message):
+    hour = int(time.time() // 3600)
+    h = _mix64(message.author.id)
+    for cells, key in ((activity[message.guild.id], (hour, message.channel.id)),
+                       (activity_days[message.guild.id], (hour // 24, message.channel.id))):
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = ActivityCell()
+        cell.add(message.author.id, h)
+    activity_dirty.add(message.guild.id)
+
+def _roll_up_days(cells):
+    days = {}
+    for (hour, channel_id), cell in cells.items():
+        day = days.get((hour // 24, channel_id))
+        if day is None:
+            days[(hour // 24, channel_id)] = cell.copy()
+        else:
+            day.merge(cell)
+    return days
+
+def _pack_activity(cells) -> bytes:
+    """Raw sketch bytes; taken on the event loop so no cell changes mid-write."""
+    out = [struct.pack("<4sBBB", b"XACT", HLL_P, CMS_DEPTH, CMS_WIDTH)]
+    for (hour, channel_id), cell in cells.items():
+        out.append(_CELL_HEAD.pack(hour, channel_id, cell.count, len(cell.heavy)))
+        out.append(bytes(cell.hll.registers))
+        out.append(cell.cms.table.tobytes())
+        out.append(struct.pack(f"<{len(cell.heavy)}Q", *cell.heavy))
+    return b"".join(out)
+
+def _write_activity(guild_id: int, raw: bytes):
+    os.makedirs(ACTIVITY_DIR, exist_ok=True)
+    path = os.path.join(ACTIVITY_DIR, f"{guild_id}.bin")
+    with open(path + ".tmp", "wb") as f:
+        f.write(zlib.compress(raw, 6))
+    os.replace(path + ".tmp", path)
+
+def _read_activity():
+    """Load every guild's sketches (and their day rollups) on startup. Runs in a worker thread."""
+    loaded = {}
+    if not os.path.isdir(ACTIVITY_DIR):
+        return loaded
+    hll_size, cms_size = 1 << HLL_P, 4 * CMS_DEPTH * CMS_WIDTH
+    for name in os.listdir(ACTIVITY_DIR):
+        if not name.endswith(".bin"):
+            continue
+        try:
+            with open(os.path.join(ACTIVITY_DIR, name), "rb") as f:
+                raw = zlib.decompress(f.read())
+            if raw[:7] != struct.pack("<4sBBB", b"XACT", HLL_P, CMS_DEPTH, CMS_WIDTH):
+                continue  # sketch parameters changed; start over
+            cells, pos = {}, 7
+            while pos < len(raw):
+                hour, channel_id, count, n_heavy = _CELL_HEAD.unpack_from(raw, pos)
+                pos += _CELL_HEAD.size
+                hll = HyperLogLog(bytearray(raw[pos:pos + hll_size]))
+                pos += hll_size
+                cms = CountMinSketch(array("I", raw[pos:pos + cms_size]))
+                pos += cms_size
+                ids = struct.unpack_from(f"<{n_heavy}Q", raw, pos)
+                pos += 8 * n_heavy
+                cells[(hour, channel_id)] = ActivityCell(count, hll, cms, {u: cms.estimate(_mix64(u)) for u in ids})
+            loaded[int(name[:-4])] = (cells, _roll_up_days(cells))
+        except (OSError, zlib.error, struct.error, ValueError) as e:
+            print("activity load error:", name, e)
+    return loaded
+
+def _merge_cells(live, loaded):
+    for key, cell in loaded.items():
+        if key in live:
+            live[key].merge(cell)   # messages recorded while the file was loading
+        else:
+            live[key] = cell
+
+async def activity_flush_loop():
+    for guild_id, (cells, days) in (await asyncio.to_thread(_read_activity)).items():
+        _merge_cells(activity[guild_id], cells)
+        _merge_cells(activity_days[guild_id], days)
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+        cutoff = int(time.time() // 3600) - ACTIVITY_RETENTION_HOURS
+        for guild_id in list(activity_dirty):
+            activity_dirty.discard(guild_id)
+            cells = activity[guild_id]
+            for key in [k for k in cells if k[0] < cutoff]:
+                del cells[key]
+            days = activity_days[guild_id]
+            for key in [k for k in days if k[0] < cutoff // 24]:
+                del days[key]
+            try:
+                await asyncio.to_thread(_write_activity, guild_id, _pack_activity(cells))
+            except Exception as e:
+                print("activity flush error:", e)
+
+def _activity_cells(guild_id: int, hours: int, channel_id: int = None):
+    """
+    Copies of the cells covering the last `hours` hours: day rollups for every day that starts
+    inside the window, hourly cells only for the partial day at its start. So a merge touches
+    at most ~30 day cells plus 23 hour cells per channel. Taken on the event loop.
+    """
+    since = int(time.time() // 3600) - hours + 1
+    first_day = -(-since // 24)   # first day starting at or after `since`
+    picked = []
+    for (day, ch), cell in activity_days.get(guild_id, {}).items():
+        if day >= first_day and (not channel_id or ch == channel_id):
+            picked.append((day * 24, ch, cell.copy()))
+    for (hour, ch), cell in activity.get(guild_id, {}).items():
+        if since <= hour < first_day * 24 and (not channel_id or ch == channel_id):
+            picked.append((hour - hour % 24, ch, cell.copy()))
+    return picked
+
+def _summarize_activity(picked):
+    """Merge picked cells into the summary. Runs in a worker thread."""
+    total = ActivityCell()
+    days = defaultdict(ActivityCell)   # {day start hour: merged cell} for the trend
+    channels = defaultdict(int)
+    candidates = set()
+    for day_start, ch, cell in picked:
+        for merged in (total, days[day_start]):
+            merged.count += cell.count
+            merged.hll.merge(cell.hll)
+        total.cms.merge(cell.cms)
+        channels[ch] += cell.count
+        candidates.update(cell.heavy)
+    top = sorted(((total.cms.estimate(_mix64(u)), u) for u in candidates), reverse=True)[:5]
+    return {
+        "messages": total.count,
+        "uniques": total.hll.estimate() if total.count else 0,
+        "top_users": top,
+        "top_channels": sorted(channels.items(), key=lambda kv: kv[1], reverse=True)[:5],
+        "days": [(day, c.count, c.hll.estimate()) for day, c in sorted(days.items())],
+    }
+
+async def activity_summary(guild_id: int, hours: int, channel_id: int = None):
+    """Merge the sketches of the last `hours` hours (one channel or all of them), off the event loop."""
+    return await asyncio.to_thread(_summarize_activity, _activity_cells(guild_id, hours, channel_id))
+
+@bot.command(name="activity")
+@commands.has_permissions(manage_guild=True)
+async def activity_cmd(ctx, *args: str):
+    """xactivity [#channel] [7d]"""
+    channel, period = None, "7d"
+    for arg in args:
+        match = re.fullmatch(r"<#(\d+)>|(\d+)", arg)
+        if match:
+            channel = ctx.guild.get_channel(int(match.group(1) or match.group(2)))
+            if not channel:
+                return await send_error(ctx, f"Channel not found: `{arg}`")
+        elif parse_duration(arg):
+            period = arg
+        else:
+            return await send_error(ctx, "Usage: `xactivity [#channel] [period]` e.g. `xactivity #general 7d`")
+    hours = max(1, min(int(parse_duration(period).total_seconds() // 3600), ACTIVITY_RETENTION_HOURS))
+    stats = await activity_summary(ctx.guild.id, hours, channel.id if channel else None)
+    if not stats["messages"]:
+        return await send_error(ctx, f"No activity recorded in the last **{period}**.")
+
+    where = channel.mention if channel else "the whole server"
+    embed = make_embed(f"📈 Activity — last {period}", f"Stats for {where}.", discord.Color.blurple())
+    embed.add_field(name="Messages", value=f"{stats['messages']:,}", inline=True)
+    embed.add_field(name="Unique Chatters", value=f"~{stats['uniques']:,}", inline=True)
+    embed.add_field(
+        name="Top Chatters",
+        value="\n".join(f"<@{uid}> — ~{est:,}" for est, uid in stats["top_users"]) or "—",
+        inline=False
+    )
+    if not channel:
+        embed.add_field(
+            name="Busiest Channels",
+            value="\n".join(f"<#{ch}> — {n:,}" for ch, n in stats["top_channels"]),
+            inline=False
+        )
+    days = stats["days"][-14:]
+    peak = max(n for _, n, _ in days)
+    trend = [
+        f"`{datetime.utcfromtimestamp(day * 3600):%a %d %b}` {'█' * max(1, round(10 * n / peak))} {n:,} • ~{u:,} users"
+        for day, n, u in days
+    ]
+    embed.add_field(name="Daily Trend", value="\n".join(trend), inline=False)
+    embed.set_footer(text="Unique and per-user counts are estimates (HyperLogLog / count-min)")
     await ctx.send(embed=embed)
 
 # ----------------- Server Stats Dashboard -----------------
+guild_counts_cache = {}  # {guild_id: (expires, Guild with approximate counts)}
+
+async def fetch_guild_counts(guild_id: int):
+    now = time.monotonic()
+    cached = guild_counts_cache.get(guild_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    counts = await bot.fetch_guild(guild_id, with_counts=True)
+    guild_counts_cache[guild_id] = (now + MEMBER_LOOKUP_TTL, counts)
+    return counts
+
 @bot.command()
 async def serverstats(ctx):
     guild = ctx.guild
 
     # Members
     total_members = guild.member_count
-    online_members = sum(1 for m in guild.members if m.status != discord.Status.offline)
-    bots = sum(1 for m in guild.members if m.bot)
+    if LOW_MEMORY:
+        # no member cache to count from; use the API's approximate counts
+        counts = await fetch_guild_counts(guild.id)
+        online_members = counts.approximate_presence_count
+        bots = "N/A"
+    else:
+        online_members = sum(1 for m in guild.members if m.status != discord.Status.offline)
+        bots = sum(1 for m in guild.members if m.bot)
 
     # Channels
     text_channels = len(guild.text_channels)
@@ -1891,10 +5568,31 @@ async def serverstats(ctx):
     embed.add_field(name="Roles", value=roles, inline=True)
     embed.add_field(name="Emojis", value=emojis, inline=True)
     embed.add_field(name="Server Boosts", value=f"{boosts} (Level {boost_level})", inline=True)
+    recent = await activity_summary(guild.id, 24)
+    embed.add_field(name="Messages (24h)", value=f"{recent['messages']:,}", inline=True)
+    embed.add_field(name="Active Chatters (24h)", value=f"~{recent['uniques']:,}", inline=True)
+    if recent["top_channels"]:
+        embed.add_field(name="Busiest Channel (24h)", value=f"<#{recent['top_channels'][0][0]}>", inline=True)
+
+    file = await attach_card(embed, "stats", {
+        "title": guild.name,
+        "subtitle": f"Created {created_at}",
+        "rows": [
+            ["Members", f"{total_members:,}"],
+            ["Online", f"{online_members:,}" if isinstance(online_members, int) else online_members],
+            ["Boosts", f"{boosts} (L{boost_level})"],
+            ["Channels", text_channels + voice_channels],
+            ["Msgs 24h", f"{recent['messages']:,}"],
+            ["Chatters 24h", f"~{recent['uniques']:,}"],
+        ],
+    }, guild.icon)
 
-    embed.set_footer(text=f"Requested by {ctx.author}", icon_url=ctx.author.avatar.url)
+    embed.set_footer(text=f"Requested by {ctx.author}", icon_url=ctx.author.display_avatar.url)
 
-    await ctx.send(embed=embed)
+    if file:
+        await ctx.send(embed=embed, file=file)
+    else:
+        await ctx.send(embed=embed)
 
 # fortune
 fortunes = [
@@ -2014,6 +5712,298 @@ fortunes = [
 async def fortune(ctx):
     await ctx.send(f"🔮 {ctx.author.mention}, your fortune is:\n**{random.choice(fortunes)}**")
 # -------------------------
+# SLASH COMMANDS (typed options, resolved client-side; share the prefix command helpers)
+# -------------------------
+TREE_SYNC_FILE = "tree_sync.json"   # {"hash": sha256 of the last synced command payload}
+
+class DurationTransformer(app_commands.Transformer):
+    """Turns '10m' / '2h' / '1d' into (timedelta, text) before the callback runs."""
+    async def transform(self, interaction: Interaction, value: str):
+        td = parse_duration(value)
+        if not td:
+            raise app_commands.TransformerError(value, discord.AppCommandOptionType.string, self)
+        return td, value.strip()
+
+@bot.tree.error
+async def on_app_command_error(interaction: Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.TransformerError):
+        msg = f"Invalid duration `{error.value}`. Use `10s`, `5m`, `2h` or `1d`."
+    elif isinstance(error, app_commands.MissingPermissions):
+        msg = "You don't have permission to use this command."
+    else:
+        msg = f"Command failed. Error: {getattr(error, 'original', error)}"
+    embed = make_embed("❌ Error", msg, discord.Color.red())
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def slash_moderate(interaction: Interaction, member: discord.Member, verb: str, past: str, action):
+    blocked = target_block_embed(interaction.user, member, verb, past, hierarchy=verb != "warn")
+    if blocked:
+        return await interaction.response.send_message(embed=blocked, ephemeral=True)
+    await interaction.response.defer()
+    await interaction.followup.send(embed=await action())
+
+@bot.tree.command(name="ban", description="Ban a member")
+@app_commands.guild_only()
+@app_commands.default_permissions(ban_members=True)
+@app_commands.checks.has_permissions(ban_members=True)
+async def slash_ban(interaction: Interaction, member: discord.Member, reason: str = "No reason provided"):
+    await slash_moderate(interaction, member, "ban", "banned",
+                         lambda: ban_member(interaction.guild, member, interaction.user, reason))
+
+@bot.tree.command(name="kick", description="Kick a member")
+@app_commands.guild_only()
+@app_commands.default_permissions(kick_members=True)
+@app_commands.checks.has_permissions(kick_members=True)
+async def slash_kick(interaction: Interaction, member: discord.Member, reason: str = "No reason provided"):
+    await slash_moderate(interaction, member, "kick", "kicked",
+                         lambda: kick_member(interaction.guild, member, interaction.user, reason))
+
+@bot.tree.command(name="mute", description="Time out a member")
+@app_commands.guild_only()
+@app_commands.default_permissions(moderate_members=True)
+@app_commands.checks.has_permissions(moderate_members=True)
+@app_commands.describe(duration="How long, e.g. 10m, 2h, 1d")
+async def slash_mute(interaction: Interaction, member: discord.Member,
+                     duration: app_commands.Transform[tuple, DurationTransformer],
+                     reason: str = "No reason provided"):
+    duration_td, duration_str = duration
+
+    async def action():
+        case_id = await timeout_member(interaction.guild, member, duration_td, duration_str, reason, interaction.user)
+        return make_embed(
+            "🔇 User Muted",
+            f"**{member}** muted for **{duration_str}**.\n**Reason:** {reason}\n**Case:** `#{case_id}`",
+            discord.Color.gold()
+        )
+    await slash_moderate(interaction, member, "mute", "muted", action)
+
+@bot.tree.command(name="unmute", description="Remove a member's timeout")
+@app_commands.guild_only()
+@app_commands.default_permissions(moderate_members=True)
+@app_commands.checks.has_permissions(moderate_members=True)
+async def slash_unmute(interaction: Interaction, member: discord.Member, reason: str = "No reason provided"):
+    await slash_moderate(interaction, member, "unmute", "unmuted",
+                         lambda: unmute_member(interaction.guild, member, interaction.user, reason))
+
+@bot.tree.command(name="warn", description="Warn a member")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+async def slash_warn(interaction: Interaction, member: discord.Member, reason: str = "No reason provided"):
+    async def action():
+        embed, dm_queued = await warn_member(interaction.guild, member, interaction.user, reason)
+        if not dm_queued:
+            embed.set_footer(text="Could not DM the user. They might have DMs disabled.")
+        return embed
+    await slash_moderate(interaction, member, "warn", "warned", action)
+
+@bot.tree.command(name="warnings", description="Show a member's warnings")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+async def slash_warnings(interaction: Interaction, member: discord.Member, moderator: discord.Member = None):
+    if not warnings_snapshot().get(str(interaction.guild.id), {}).get(str(member.id)):
+        embed = make_embed("📋 Warnings", f"{member.mention} has no warnings.", discord.Color.green())
+        return await interaction.response.send_message(embed=embed)
+    opts = {"moderator": moderator} if moderator else {}
+    view = WarningsView(interaction.user, interaction.guild.id, member, opts)
+    embed, has_more = view.render()
+    view.refresh_buttons(has_more)
+    await interaction.response.send_message(embed=embed, view=view)
+
+@bot.tree.command(name="case", description="Look up a moderation case")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_messages=True)
+@app_commands.checks.has_permissions(manage_messages=True)
+async def slash_case(interaction: Interaction, case_id: int):
+    c = get_case(interaction.guild.id, case_id)
+    if not c:
+        embed = make_embed("❌ Error", f"No case `#{case_id}` in this server.", discord.Color.red())
+        return await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=case_embed(c))
+
+@bot.tree.command(name="role", description="Toggle a role on a member")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_roles=True)
+@app_commands.checks.has_permissions(manage_roles=True)
+async def slash_role(interaction: Interaction, member: discord.Member, role: discord.Role):
+    if role >= interaction.guild.me.top_role:
+        embed = make_embed("❌ Error", "I cannot manage that role because it is higher than or equal to my top role.", discord.Color.red())
+        return await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=await toggle_role(interaction.guild, member, role))
+
+@bot.tree.command(name="info", description="Show info about a user")
+@app_commands.guild_only()
+async def slash_info(interaction: Interaction, member: discord.Member = None):
+    await interaction.response.send_message(embed=info_embed(member or interaction.user, interaction.user))
+
+async def sync_tree():
+    """Push the command tree only when its payload changed since the last sync."""
+    payload = [c.to_dict(bot.tree) for c in bot.tree.get_commands()]
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    state = store_load(TREE_SYNC_FILE, {})
+    if state.get("hash") == digest:
+        return
+    try:
+        await bot.tree.sync()
+        store_save(TREE_SYNC_FILE, {"hash": digest})
+        print(f"slash: synced {len(payload)} commands")
+    except Exception as e:
+        print("slash sync error:", e)
+
+# -------------------------
+# CLUSTER MODE (launcher, shard split, IPC between cluster processes)
+# -------------------------
+# CLUSTERS=N runs a launcher that starts N copies of the bot (main.py), each an AutoShardedBot
+# over every Nth shard. Clusters share state through STORE_FILE and talk through a small
+# JSON-lines relay on 127.0.0.1:IPC_PORT run by the launcher. check_cluster.py runs two
+# clusters against the relay and store without connecting to Discord.
+IPC_PORT = int(os.getenv("IPC_PORT", "20090"))
+IPC_TIMEOUT = 3
+ipc_writer = None
+ipc_waiters = {}   # {request_id: (future, [responses])}
+ipc_handlers = {}  # {cmd: function(data) -> response data}
+
+def ipc_handler(cmd: str):
+    def register(func):
+        ipc_handlers[cmd] = func
+        return func
+    return register
+
+@ipc_handler("stats")
+def _ipc_stats(data):
+    return {
+        "cluster": CLUSTER_ID or 0,
+        "shards": sorted(bot.shards) if hasattr(bot, "shards") else [0],
+        "guilds": len(bot.guilds),
+        "members": sum(g.member_count or 0 for g in bot.guilds),
+        "latency_ms": round(bot.latency * 1000) if bot.latency == bot.latency else None,  # NaN before first heartbeat
+    }
+
+async def _ipc_send(msg):
+    ipc_writer.write((json.dumps(msg) + "\n").encode())
+    await ipc_writer.drain()
+
+async def _ipc_reader(reader):
+    while True:
+        line = await reader.readline()
+        if not line:
+            print("IPC relay disconnected")
+            return
+        try:
+            msg = json.loads(line)
+            if msg["op"] == "request":
+                handler = ipc_handlers.get(msg["cmd"])
+                try:
+                    data = handler(msg.get("data")) if handler else None
+                except Exception as e:
+                    # still answer, so the requester isn't left waiting for this cluster
+                    print(f"ipc handler {msg['cmd']} error:", e)
+                    data = None
+                await _ipc_send({"op": "response", "id": msg["id"], "to": msg["from"], "data": data})
+            elif msg["op"] == "response":
+                waiter = ipc_waiters.get(msg["id"])
+                if waiter:
+                    future, responses = waiter
+                    responses.append(msg["data"])
+                    if len(responses) >= CLUSTER_COUNT and not future.done():
+                        future.set_result(responses)
+        except Exception as e:
+            print("ipc message error:", e)
+
+async def ipc_request(cmd: str, data=None):
+    """Ask every cluster (including this one) to run cmd; returns the responses that arrive in time."""
+    if ipc_writer is None:
+        handler = ipc_handlers.get(cmd)
+        return [handler(data)] if handler else []
+    request_id = uuid.uuid4().hex
+    future = asyncio.get_running_loop().create_future()
+    responses = []
+    ipc_waiters[request_id] = (future, responses)
+    try:
+        await _ipc_send({"op": "request", "id": request_id, "from": CLUSTER_ID, "cmd": cmd, "data": data})
+        await asyncio.wait_for(future, IPC_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        ipc_waiters.pop(request_id, None)
+    return responses
+
+async def start_ipc():
+    global ipc_writer
+    if CLUSTER_ID is None:
+        return
+    reader, ipc_writer = await asyncio.open_connection("127.0.0.1", IPC_PORT)
+    await _ipc_send({"op": "hello", "cluster": CLUSTER_ID})
+    spawn(_ipc_reader(reader))
+
+ENTRY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+async def start_ipc_relay():
+    """Serve the relay clusters connect to on IPC_PORT; returns the asyncio server."""
+    clusters = {}  # {cluster_id: writer}
+
+    async def relay(reader, writer):
+        cluster = None
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                msg = json.loads(line)
+            except ValueError as e:
+                print("ipc relay dropped a bad message:", e)
+                continue
+            if msg["op"] == "hello":
+                cluster = msg["cluster"]
+                clusters[cluster] = writer
+            elif msg["op"] == "request":
+                targets = list(clusters.values())
+            else:
+                targets = [clusters[msg["to"]]] if msg.get("to") in clusters else []
+            if msg["op"] != "hello":
+                for w in targets:
+                    w.write(line)
+                    await w.drain()
+        if clusters.get(cluster) is writer:
+            del clusters[cluster]
+
+    return await asyncio.start_server(relay, "127.0.0.1", IPC_PORT)
+
+async def run_cluster_launcher():
+    """Relay IPC between clusters and keep CLUSTER_COUNT cluster processes running."""
+    async def supervise(cluster_id: int):
+        env = dict(os.environ, CLUSTER_ID=str(cluster_id), CLUSTERS=str(CLUSTER_COUNT),
+                   SHARD_COUNT=str(SHARD_COUNT), STORE_FILE=STORE_FILE, IPC_PORT=str(IPC_PORT))
+        while True:
+            proc = await asyncio.create_subprocess_exec(sys.executable, ENTRY_SCRIPT, env=env)
+            code = await proc.wait()
+            print(f"cluster {cluster_id} exited with {code}, restarting in 5s")
+            await asyncio.sleep(5)
+
+    server = await start_ipc_relay()
+    async with server:
+        await asyncio.gather(*(supervise(i) for i in range(CLUSTER_COUNT)))
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def clusters(ctx):
+    stats = sorted((s for s in await ipc_request("stats") if s), key=lambda s: s["cluster"])
+    if not stats:
+        return await send_error(ctx, "No cluster answered.")
+    lines = [
+        f"**Cluster {s['cluster']}** • shards {', '.join(map(str, s['shards']))} • "
+        f"{s['guilds']} guilds • {s['members']} members • {s['latency_ms']}ms"
+        for s in stats
+    ]
+    embed = make_embed("🛰️ Clusters", "\n".join(lines), discord.Color.blurple())
+    embed.set_footer(text=f"{len(stats)}/{CLUSTER_COUNT} clusters answered • {sum(s['guilds'] for s in stats)} guilds total")
+    await ctx.send(embed=embed)
+
+# -------------------------
 # RUN BOT
 # -------------------------
 # status
@@ -2056,9 +6046,34 @@ async def change_status():
         await bot.change_presence(activity=discord.Game(name=current_status))
         await asyncio.sleep(60)  # change every 15 seconds
 async def setup():
-    bot.loop.create_task(change_status())
+    spawn(change_status())
+    start_dm_workers()
+    spawn(spam_eviction_loop())
+    spawn(automod_flush_loop())
+    spawn(archive_flush_loop())
+    spawn(mute_sweep_loop())
+    spawn(xp_flush_loop())
+    spawn(activity_flush_loop())
+    start_card_pool()
+    start_welcome_workers()
+    await start_attachment_cache()
+    await start_ipc()
+    if not CLUSTER_ID:
+        # one cluster is enough to publish the (global) command tree
+        await sync_tree()
 bot.setup_hook = setup
 
 import os
-Token = os.getenv("Token")
-bot.run(Token)
+def main():
+    """Start the bot, or the cluster launcher in cluster mode. Run through main.py."""
+    # cluster processes share the launcher's keep-alive server
+    if CLUSTER_ID is None:
+        keep_alive()
+    Token = os.getenv("Token")
+    if CLUSTER_COUNT > 1 and CLUSTER_ID is None:
+        asyncio.run(run_cluster_launcher())
+    else:
+        bot.run(Token)
+
+if __name__ == "__main__":
+    main()
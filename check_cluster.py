@@ -0,0 +1,129 @@
+"""
+Cluster mode check: two clusters, one relay, one SQLite store, no Discord connection.
+
+    python check_cluster.py
+
+Runs the launcher's IPC relay in this process and starts two cluster processes
+(CLUSTERS=2, CLUSTER_ID=0/1) in a temporary directory sharing one STORE_FILE.
+Each cluster connects to the relay and writes its own key into a shared document.
+Cluster 0 then checks:
+  - an IPC request reaches both clusters and both responses come back
+    (the bot's own "stats" handler, plus the shard split);
+  - both clusters read back both keys from the shared document, so neither
+    save clobbered the other's row.
+Exits non-zero if anything fails.
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOC = "cluster_check.json"
+DEADLINE = 20  # seconds for the whole check
+
+
+def cluster_main():
+    sys.path.insert(0, HERE)
+    import bot
+
+    done = asyncio.Event()
+
+    @bot.ipc_handler("check_info")
+    def _info(data):
+        return {"cluster": bot.CLUSTER_ID, "shard_ids": bot.bot.shard_ids}
+
+    @bot.ipc_handler("check_doc")
+    def _doc(data):
+        return sorted(bot.store_load(DOC, {}))
+
+    @bot.ipc_handler("check_done")
+    def _done(data):
+        done.set()
+        return True
+
+    async def run():
+        await bot.start_ipc()
+        doc = bot.store_load(DOC, {})
+        doc[str(bot.CLUSTER_ID)] = {"written_at": time.time()}
+        bot.store_save(DOC, doc)
+
+        # wait until the other cluster is connected too (cluster 0 may already be done checking)
+        deadline = time.monotonic() + DEADLINE
+        while not done.is_set() and len(await bot.ipc_request("check_info")) < bot.CLUSTER_COUNT:
+            if time.monotonic() > deadline:
+                print(f"cluster {bot.CLUSTER_ID}: the other cluster never answered")
+                return 1
+        if bot.CLUSTER_ID != 0:
+            await asyncio.wait_for(done.wait(), DEADLINE)
+            return 0
+
+        ok = True
+        stats = sorted(await bot.ipc_request("stats"), key=lambda s: s["cluster"])
+        print("stats responses:", stats)
+        ok &= [s["cluster"] for s in stats] == [0, 1]
+        info = sorted(await bot.ipc_request("check_info"), key=lambda i: i["cluster"])
+        print("shard split:", info)
+        ok &= [i["shard_ids"] for i in info] == [[0], [1]]
+
+        keys = []
+        while time.monotonic() < deadline:
+            keys = await bot.ipc_request("check_doc")
+            if keys == [["0", "1"], ["0", "1"]]:
+                break
+            await asyncio.sleep(0.2)
+        print("shared document keys seen by each cluster:", keys)
+        ok &= keys == [["0", "1"], ["0", "1"]]
+
+        await bot.ipc_request("check_done")
+        return 0 if ok else 1
+
+    sys.exit(asyncio.run(run()))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CLUSTERS="2", SHARD_COUNT="2", STORE_FILE=os.path.join(tmp, "store.db"),
+                   IPC_PORT=str(free_port()))
+        env.pop("CLUSTER_ID", None)
+        os.environ.update(env)
+        os.chdir(tmp)  # the bot reads and writes its JSON files relative to the working directory
+        sys.path.insert(0, HERE)
+        import bot
+
+        async def run():
+            server = await bot.start_ipc_relay()
+            async with server:
+                procs = [
+                    await asyncio.create_subprocess_exec(
+                        sys.executable, os.path.abspath(__file__), "--cluster",
+                        env=dict(env, CLUSTER_ID=str(i)), cwd=tmp)
+                    for i in range(2)
+                ]
+                try:
+                    return await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), DEADLINE + 10)
+                except asyncio.TimeoutError:
+                    for p in procs:
+                        p.kill()
+                    return [None, None]
+
+        codes = asyncio.run(run())
+        os.chdir(HERE)
+    print("cluster exit codes:", codes)
+    print("PASS" if codes == [0, 0] else "FAIL")
+    return 0 if codes == [0, 0] else 1
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--cluster"]:
+        cluster_main()
+    else:
+        sys.exit(main())
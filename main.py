@@ -0,0 +1,6 @@
+# Entry point: python main.py (see Procfile.txt).
+# Card workers are spawned processes that re-import the main script, so it stays this thin:
+# they import cards for the render functions and never load bot.py and its state.
+if __name__ == "__main__":
+    import bot
+    bot.main()
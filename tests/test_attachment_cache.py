@@ -0,0 +1,120 @@
+"""preserve_attachment against a local aiohttp server: dedupe by hash, size cap, LRU eviction."""
+import asyncio
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bot  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "ATTACH_DIR", str(tmp_path))
+    monkeypatch.setattr(bot, "ATTACH_URL_LOG", str(tmp_path / "urls.jsonl"))
+    monkeypatch.setattr(bot, "attach_lru", OrderedDict())
+    monkeypatch.setattr(bot, "attach_urls", OrderedDict())
+    monkeypatch.setattr(bot, "attach_total", 0)
+    monkeypatch.setattr(bot, "attach_log_lines", 0)
+    return tmp_path
+
+
+def run_with_server(files, scenario):
+    """Serve files ({name: bytes}) on a local port and run scenario(base_url, hits) with the cache started."""
+    hits = []
+
+    async def serve(request):
+        name = request.match_info["name"]
+        hits.append(name)
+        if name not in files:
+            raise web.HTTPNotFound()
+        if not name.startswith("chunked"):
+            return web.Response(body=files[name])
+        resp = web.StreamResponse()  # no Content-Length, so the size is only known while reading
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        for i in range(0, len(files[name]), 1 << 20):
+            await resp.write(files[name][i:i + (1 << 20)])
+        await resp.write_eof()
+        return resp
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/{name}", serve)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        await bot.start_attachment_cache()
+        try:
+            await scenario(f"http://127.0.0.1:{port}", hits)
+        finally:
+            await bot.attach_session.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def attachment(base, name, size, filename="file.png"):
+    return SimpleNamespace(url=f"{base}/{name}?ex=123", size=size, filename=filename)
+
+
+def blob_files(root):
+    return sorted(f for sub in os.listdir(root) if len(sub) == 2 for f in os.listdir(root / sub))
+
+
+def test_same_bytes_under_different_urls_are_stored_once(cache):
+    data = b"same image" * 100
+
+    async def scenario(base, hits):
+        await bot.preserve_attachment(attachment(base, "a", len(data)))
+        await bot.preserve_attachment(attachment(base, "b", len(data)))
+        await bot.preserve_attachment(attachment(base, "a", len(data)))  # known url: not fetched again
+        assert hits == ["a", "b"]
+
+    run_with_server({"a": data, "b": data}, scenario)
+    sha = hashlib.sha256(data).hexdigest()
+    assert blob_files(cache) == [sha]
+    assert list(bot.attach_lru) == [sha]
+    assert bot.attach_total == len(data)
+    assert {k.rsplit("/", 1)[1]: v[0] for k, v in bot.attach_urls.items()} == {"a": sha, "b": sha}
+
+
+def test_attachments_over_the_size_cap_are_not_preserved(cache):
+    big = b"x" * (bot.ATTACH_MAX_FILE + 1)
+
+    async def scenario(base, hits):
+        await bot.preserve_attachment(attachment(base, "declared", len(big)))  # skipped before downloading
+        await bot.preserve_attachment(attachment(base, "lying", 10))          # refused on Content-Length
+        await bot.preserve_attachment(attachment(base, "chunked", 10))        # cut off while downloading
+        assert hits == ["lying", "chunked"]
+
+    run_with_server({"declared": big, "lying": big, "chunked": big}, scenario)
+    assert blob_files(cache) == []
+    assert bot.attach_total == 0 and not bot.attach_urls
+
+
+def test_least_recently_used_blob_is_evicted(cache, monkeypatch):
+    monkeypatch.setattr(bot, "ATTACH_MAX_BYTES", 250)
+    files = {name: name.encode() * 100 for name in ("a", "b", "c")}
+    sha = {name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+
+    async def scenario(base, hits):
+        await bot.preserve_attachment(attachment(base, "a", 100))
+        await bot.preserve_attachment(attachment(base, "b", 100))
+        # serving "a" from the cache makes "b" the least recently used
+        sent = bot.cached_attachment_files([f"{base}/a?ex=456"], 10_000)
+        assert len(sent) == 1
+        sent[0].close()
+        await bot.preserve_attachment(attachment(base, "c", 100))
+
+    run_with_server(files, scenario)
+    assert list(bot.attach_lru) == [sha["a"], sha["c"]]
+    assert bot.attach_total == 200
+    assert blob_files(cache) == sorted([sha["a"], sha["c"]])